@@ -1,4 +1,5 @@
 from django.db import models
+from django.http import HttpResponseRedirect, JsonResponse
 from django.contrib.auth.models import User
 
 class Vote(models.Model):
@@ -10,11 +11,13 @@ class Vote(models.Model):
         (DOWNVOTE, 'downvote')
     ]
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Votes might be in a shard, see forums.models.Post.poster
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False)
     kind_of_vote = models.CharField(
         max_length=1, 
         choices=KIND_OF_VOTE_CHOICES
         )
+    voted_at = models.DateTimeField('voted_at', auto_now_add=True)
 
     def is_upvote(self):
         return self.kind_of_vote == Vote.UPVOTE
@@ -23,4 +26,43 @@ class Vote(models.Model):
         return self.kind_of_vote == Vote.DOWNVOTE
 
     class Meta:
-        abstract = True
\ No newline at end of file
+        abstract = True
+
+
+def vote_button_labels(vote_record):
+    '''
+    Returns the (upvote button, downvote button) labels to show to the user who owns vote_record.
+    vote_record is None if the user has not voted the post/comment yet.
+    '''
+    return vote_button_labels_for(vote_record.kind_of_vote if vote_record is not None else None)
+
+
+def vote_button_labels_for(kind_of_vote):
+    '''vote_button_labels from the kind of the vote of the user (Vote.UPVOTE, Vote.DOWNVOTE or None)'''
+    if kind_of_vote == Vote.UPVOTE:
+        return 'Remove Upvote', 'Downvote'
+    elif kind_of_vote == Vote.DOWNVOTE:
+        return 'Upvote', 'Remove Downvote'
+    else:
+        return 'Upvote', 'Downvote'
+
+
+def wants_json(request):
+    '''True for the requests of static/js/ajax_votes.js, which ask for json instead of a redirect'''
+    return 'application/json' in request.headers.get('Accept', '')
+
+
+def vote_response(request, points, kind_of_vote, redirection_url):
+    '''
+    The response to a vote: the new points and vote of the user as json when the request asks for it,
+    so the page updates one number instead of being rendered again, a redirect otherwise.
+    '''
+    if not wants_json(request):
+        return HttpResponseRedirect(redirection_url)
+    upvote_label, downvote_label = vote_button_labels_for(kind_of_vote)
+    return JsonResponse({
+        'points': points,
+        'vote': kind_of_vote,
+        'upvote_label': upvote_label,
+        'downvote_label': downvote_label
+    })
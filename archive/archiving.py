@@ -0,0 +1,157 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.db import transaction
+from django.contrib.auth.models import User
+
+from forums import sharding
+from forums.models import Forum, Post, PostVote
+from comments.models import Comment, CommentVote
+from .models import ArchivedPost, ArchivedComment, ArchivedPostVote, ArchivedCommentVote
+
+POST_FIELDS = (
+    'pk', 'forum_id', 'poster_id',
+    'title', 'content', 'points', 'edited', 'pub_date', 'last_modified'
+    )
+COMMENT_FIELDS = (
+    'pk', 'post_id', 'in_reply_to_id', 'commenter_id',
+    'content', 'points', 'edited', 'pub_date', 'last_modified'
+    )
+
+
+def default_cutoff():
+    return timezone.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+
+
+def thread_comments(post_pks, using):
+    '''
+    The comments of the threads of post_pks (locked until the end of the transaction), as dicts
+    with COMMENT_FIELDS and the pk of their thread's post as thread_id. Replies only point to their
+    parent comment, so the trees are walked one level of nesting at a time
+    '''
+    comments = []
+    level = Comment.objects.using(using).filter(post_id__in=post_pks)
+    thread_of = {}
+    while True:
+        rows = list(level.select_for_update(of=('self',)).values(*COMMENT_FIELDS))
+        if not rows:
+            return comments
+        for row in rows:
+            row['thread_id'] = row['post_id'] if row['post_id'] is not None else thread_of[row['in_reply_to_id']]
+            thread_of[row['pk']] = row['thread_id']
+        comments.extend(rows)
+        level = Comment.objects.using(using).filter(in_reply_to_id__in=[row['pk'] for row in rows])
+
+
+def archive_batch(after_pk, cutoff, batch_size, dry_run=False, using=None):
+    '''
+    Looks at the batch_size posts of shard using after after_pk not modified (edited or voted) since cutoff and
+    archives the threads where none of the comments was modified since then either. Returns (last
+    post pk looked at, or None when there are no more posts, archived threads, archived comments)
+
+    Everything is read with the hot rows locked and deleted in the same transaction, so a reply or
+    a vote that comes in the meantime waits for us instead of being lost. If the archive is in
+    another db, its rows are written first: when something fails after that, the thread is
+    still in the hot tables (which win) and the next run replaces the leftover archive rows.
+    '''
+    using = using or sharding.shards()[0]
+    with transaction.atomic(using=using):
+        posts = list(
+            Post.objects.using(using).filter(pk__gt=after_pk, last_modified__lt=cutoff).order_by('pk')
+            .select_for_update(of=('self',)).values(*POST_FIELDS)[:batch_size]
+            )
+        if not posts:
+            return None, 0, 0
+        last_pk = posts[-1]['pk']
+
+        comments = thread_comments([post['pk'] for post in posts], using)
+        active_threads = {comment['thread_id'] for comment in comments if comment['last_modified'] >= cutoff}
+        posts = [post for post in posts if post['pk'] not in active_threads]
+        comments = [comment for comment in comments if comment['thread_id'] not in active_threads]
+        if dry_run or not posts:
+            return last_pk, len(posts), len(comments)
+
+        post_pks = [post['pk'] for post in posts]
+        thread_of = {comment['pk']: comment['thread_id'] for comment in comments}
+        post_votes = PostVote.objects.using(using).filter(post_id__in=post_pks).values('post_id', 'user_id', 'kind_of_vote', 'voted_at')
+        comment_votes = CommentVote.objects.using(using).filter(comment_id__in=list(thread_of)).values(
+            'comment_id', 'user_id', 'kind_of_vote', 'voted_at'
+            )
+
+        # Forums and users are in the primary db, not in the shard of the content
+        forum_names = dict(Forum.objects.filter(pk__in={post['forum_id'] for post in posts}).values_list('pk', 'name'))
+        usernames = dict(User.objects.filter(
+            pk__in={post['poster_id'] for post in posts} | {comment['commenter_id'] for comment in comments}
+            ).values_list('pk', 'username'))
+
+        with transaction.atomic(using=settings.ARCHIVE_DATABASE):
+            delete_archived_threads(post_pks)  # Leftovers of an interrupted run
+            ArchivedPost.objects.bulk_create(
+                ArchivedPost(
+                    id=post['pk'], forum_id=post['forum_id'], forum_name=forum_names[post['forum_id']],
+                    poster_id=post['poster_id'], poster_username=usernames[post['poster_id']],
+                    title=post['title'], content=post['content'], points=post['points'], edited=post['edited'],
+                    pub_date=post['pub_date'], last_modified=post['last_modified']
+                    )
+                for post in posts
+                )
+            ArchivedComment.objects.bulk_create(
+                ArchivedComment(
+                    id=comment['pk'], thread_id=comment['thread_id'], post_id=comment['post_id'],
+                    in_reply_to_id=comment['in_reply_to_id'], commenter_id=comment['commenter_id'],
+                    commenter_username=usernames[comment['commenter_id']], content=comment['content'],
+                    points=comment['points'], edited=comment['edited'],
+                    pub_date=comment['pub_date'], last_modified=comment['last_modified']
+                    )
+                for comment in comments
+                )
+            ArchivedPostVote.objects.bulk_create(ArchivedPostVote(**vote) for vote in post_votes)
+            ArchivedCommentVote.objects.bulk_create(
+                ArchivedCommentVote(thread_id=thread_of[vote['comment_id']], **vote) for vote in comment_votes
+                )
+
+        # Deleting the posts deletes their comment trees, votes and activity too
+        Post.objects.using(using).filter(pk__in=post_pks).delete()
+
+    return last_pk, len(posts), len(comments)
+
+
+def archive_threads(cutoff=None, *, batch_size=100, dry_run=False):
+    '''Archives every thread not modified since cutoff (ARCHIVE_AFTER_DAYS ago by default). Returns (threads, comments)'''
+    cutoff = cutoff or default_cutoff()
+    threads = comments = 0
+    for shard in sharding.shards():
+        last_pk = 0
+        while True:
+            last_pk, archived_threads, archived_comments = archive_batch(last_pk, cutoff, batch_size, dry_run, shard)
+            if last_pk is None:
+                break
+            threads += archived_threads
+            comments += archived_comments
+    return threads, comments
+
+
+def delete_archived_threads(post_pks):
+    ArchivedPost.objects.filter(pk__in=post_pks).delete()
+    ArchivedComment.objects.filter(thread_id__in=post_pks).delete()
+    ArchivedPostVote.objects.filter(post_id__in=post_pks).delete()
+    ArchivedCommentVote.objects.filter(thread_id__in=post_pks).delete()
+
+
+def delete_archived_comments(comment_pks):
+    '''Deletes the archived comments with comment_pks, with their replies (like the cascade of the hot table) and votes'''
+    while comment_pks:
+        replies = list(ArchivedComment.objects.filter(in_reply_to_id__in=comment_pks).values_list('pk', flat=True))
+        ArchivedCommentVote.objects.filter(comment_id__in=comment_pks).delete()
+        ArchivedComment.objects.filter(pk__in=comment_pks).delete()
+        comment_pks = replies
+
+
+def delete_archived_content_of(user_pk):
+    '''Deletes what a user wrote or voted from the archive, as deleting the user does in the hot tables'''
+    with transaction.atomic(using=settings.ARCHIVE_DATABASE):
+        delete_archived_threads(list(ArchivedPost.objects.filter(poster_id=user_pk).values_list('pk', flat=True)))
+        delete_archived_comments(list(ArchivedComment.objects.filter(commenter_id=user_pk).values_list('pk', flat=True)))
+        ArchivedPostVote.objects.filter(user_id=user_pk).delete()
+        ArchivedCommentVote.objects.filter(user_id=user_pk).delete()
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.core.management.base import BaseCommand
+
+from archive.archiving import archive_threads
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves the threads (posts with their comments and votes) nobody edited or voted in the last '
+        'ARCHIVE_AFTER_DAYS days to the archive tables. Meant to be run periodically, e.g. daily from cron.'
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=float, default=None,
+            help='Archive the threads not modified in this many days (default: ARCHIVE_AFTER_DAYS)'
+            )
+        parser.add_argument('--batch-size', type=int, default=100, help='Posts looked at per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+
+    def handle(self, *args, older_than_days, batch_size, dry_run, **options):
+        days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+        cutoff = timezone.now() - timedelta(days=days)
+        threads, comments = archive_threads(cutoff, batch_size=batch_size, dry_run=dry_run)
+        self.stdout.write(
+            f'{"Would archive" if dry_run else "Archived"} {threads} threads with {comments} comments '
+            f'not modified since {cutoff:%Y-%m-%d %H:%M}'
+            )
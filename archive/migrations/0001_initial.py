@@ -0,0 +1,76 @@
+# Generated by Django 4.0.10 on 2026-10-19 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('thread_id', models.BigIntegerField(db_index=True)),
+                ('post_id', models.BigIntegerField(db_index=True, null=True)),
+                ('in_reply_to_id', models.BigIntegerField(db_index=True, null=True)),
+                ('commenter_id', models.IntegerField(db_index=True)),
+                ('commenter_username', models.CharField(max_length=150)),
+                ('content', models.CharField(max_length=255)),
+                ('points', models.IntegerField(default=0)),
+                ('edited', models.BooleanField(default=False)),
+                ('pub_date', models.DateTimeField(verbose_name='pub_date')),
+                ('last_modified', models.DateTimeField(verbose_name='last_modified')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedCommentVote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField(db_index=True)),
+                ('kind_of_vote', models.CharField(choices=[('U', 'upvote'), ('D', 'downvote')], max_length=1)),
+                ('voted_at', models.DateTimeField(verbose_name='voted_at')),
+                ('comment_id', models.BigIntegerField()),
+                ('thread_id', models.BigIntegerField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPost',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('forum_id', models.BigIntegerField(db_index=True)),
+                ('forum_name', models.CharField(max_length=15)),
+                ('poster_id', models.IntegerField(db_index=True)),
+                ('poster_username', models.CharField(max_length=150)),
+                ('title', models.CharField(max_length=30)),
+                ('content', models.CharField(max_length=255)),
+                ('points', models.IntegerField(default=0)),
+                ('edited', models.BooleanField(default=False)),
+                ('pub_date', models.DateTimeField(verbose_name='pub_date')),
+                ('last_modified', models.DateTimeField(verbose_name='last_modified')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='archived_at')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPostVote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField(db_index=True)),
+                ('kind_of_vote', models.CharField(choices=[('U', 'upvote'), ('D', 'downvote')], max_length=1)),
+                ('voted_at', models.DateTimeField(verbose_name='voted_at')),
+                ('post_id', models.BigIntegerField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='archivedpostvote',
+            constraint=models.UniqueConstraint(fields=('post_id', 'user_id'), name='unique_archived_vote_per_post'),
+        ),
+        migrations.AddConstraint(
+            model_name='archivedcommentvote',
+            constraint=models.UniqueConstraint(fields=('comment_id', 'user_id'), name='unique_archived_vote_per_comment'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+'''
+Threads (a post with its comment tree and votes) nobody touched in settings.ARCHIVE_AFTER_DAYS,
+moved out of the hot forums/comments tables by archive.archiving.archive_threads.
+
+Archived rows keep the ids they had in the hot tables, so the old urls keep working (show_post
+and show_comment fall back to these tables). They live in the settings.ARCHIVE_DATABASE db, which
+might not be the one of the hot tables, so they reference forums and users by id, not by foreign
+key, and keep a copy of the names needed to show them.
+'''
+from django.db import models
+
+from abstract_models.vote import Vote
+
+
+class ArchivedPost(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    forum_id = models.BigIntegerField(db_index=True)
+    forum_name = models.CharField(max_length=15)
+    poster_id = models.IntegerField(db_index=True)
+    poster_username = models.CharField(max_length=150)
+    title = models.CharField(max_length=30)
+    content = models.CharField(max_length=255)
+    points = models.IntegerField(default=0)
+    edited = models.BooleanField(default=False)
+    pub_date = models.DateTimeField('pub_date')
+    last_modified = models.DateTimeField('last_modified')
+    archived_at = models.DateTimeField('archived_at', auto_now_add=True)
+
+    def __str__(self):
+        return f'tittle: {self.title}, from: {self.forum_name}, by: {self.poster_username} (archived)'
+
+
+class ArchivedComment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    thread_id = models.BigIntegerField(db_index=True)  # The post at the root of the thread
+    post_id = models.BigIntegerField(null=True, db_index=True)
+    in_reply_to_id = models.BigIntegerField(null=True, db_index=True)
+    commenter_id = models.IntegerField(db_index=True)
+    commenter_username = models.CharField(max_length=150)
+    content = models.CharField(max_length=255)
+    points = models.IntegerField(default=0)
+    edited = models.BooleanField(default=False)
+    pub_date = models.DateTimeField('pub_date')
+    last_modified = models.DateTimeField('last_modified')
+
+
+class ArchivedVote(models.Model):
+    user_id = models.IntegerField(db_index=True)
+    kind_of_vote = models.CharField(max_length=1, choices=Vote.KIND_OF_VOTE_CHOICES)
+    voted_at = models.DateTimeField('voted_at')
+
+    class Meta:
+        abstract = True
+
+
+class ArchivedPostVote(ArchivedVote):
+    post_id = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post_id', 'user_id'],
+                name='unique_archived_vote_per_post'
+                )
+        ]
+
+
+class ArchivedCommentVote(ArchivedVote):
+    comment_id = models.BigIntegerField()
+    thread_id = models.BigIntegerField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['comment_id', 'user_id'],
+                name='unique_archived_vote_per_comment'
+                )
+        ]
@@ -0,0 +1,24 @@
+from django.conf import settings
+
+
+class ArchiveRouter:
+    '''
+    Sends the archive app to the settings.ARCHIVE_DATABASE db (which can be a separate sqlite
+    file, see settings.py) and keeps every other app out of it
+    '''
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'archive':
+            return settings.ARCHIVE_DATABASE
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'archive':
+            return db == settings.ARCHIVE_DATABASE
+        if settings.ARCHIVE_DATABASE == 'default':
+            return None
+        return db != settings.ARCHIVE_DATABASE
@@ -0,0 +1,19 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_delete
+from django.contrib.auth.models import User
+
+from forums.models import Forum
+from .models import ArchivedPost
+from .archiving import delete_archived_threads, delete_archived_content_of
+
+
+# The archived rows have no foreign keys to cascade from, these receivers do it instead
+
+@receiver(post_delete, sender=User)
+def delete_archived_content_of_user(sender, instance, **kwargs):
+    delete_archived_content_of(instance.pk)
+
+
+@receiver(post_delete, sender=Forum)
+def delete_archived_threads_of_forum(sender, instance, **kwargs):
+    delete_archived_threads(list(ArchivedPost.objects.filter(forum_id=instance.pk).values_list('pk', flat=True)))
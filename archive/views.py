@@ -0,0 +1,38 @@
+from django.shortcuts import render, get_object_or_404
+from django.db.models import Count, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce
+
+from .models import ArchivedPost, ArchivedComment
+
+
+def with_replies_count(comments):
+    replies = (
+        ArchivedComment.objects.filter(in_reply_to_id=OuterRef('pk'))
+        .order_by().values('in_reply_to_id').annotate(count=Count('pk')).values('count')
+        )
+    return comments.annotate(replies_count=Coalesce(Subquery(replies, output_field=IntegerField()), 0))
+
+
+def show_archived_post(request, post_id):
+    '''Read only version of forums:show_post, for the threads moved to the archive'''
+    post = get_object_or_404(ArchivedPost, pk=post_id)
+
+    return render(request, 'archive/post.html', {
+        'post': post,
+        'replies': with_replies_count(ArchivedComment.objects.filter(post_id=post.pk).order_by('pk'))
+    })
+
+
+def show_archived_comment(request, comment_id):
+    '''Read only version of comments:show_comment, for the threads moved to the archive'''
+    comment = get_object_or_404(ArchivedComment, pk=comment_id)
+    in_reply_to = None
+    if comment.in_reply_to_id is not None:
+        in_reply_to = ArchivedComment.objects.only('commenter_username').get(pk=comment.in_reply_to_id)
+
+    return render(request, 'archive/comment.html', {
+        'comment': comment,
+        'in_reply_to': in_reply_to,
+        'post': ArchivedPost.objects.only('title', 'forum_name').get(pk=comment.thread_id),
+        'replies': with_replies_count(ArchivedComment.objects.filter(in_reply_to_id=comment.pk).order_by('pk'))
+    })
@@ -0,0 +1,40 @@
+'''
+Compares a vote on a post of a forum page the way the vote forms send it without javascript (a
+redirect to the page, which is rendered again) with the json answer static/js/ajax_votes.js asks for.
+
+    python -m benchmarks.bench_ajax_votes
+'''
+from benchmarks.utils import benchmark_database, measure, report, create_member, create_forum_with_posts
+
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from forums.models import Post
+
+
+def main():
+    with benchmark_database():
+        user = create_member('benchmarker')
+        forum = create_forum_with_posts(user, 'benchforum', 15)
+        post = Post.objects.order_by('pk').first()
+        client = Client()
+        client.login(username='benchmarker', password='benchmark')
+
+        forum_url = reverse('forums:show_forum', args=(forum.name,))
+        vote_url = reverse('forums:upvote_post', args=(post.pk,))
+        votes = (
+            ('redirect and render the forum', lambda: client.post(vote_url, HTTP_REFERER=forum_url, follow=True)),
+            ('json', lambda: client.post(vote_url, HTTP_ACCEPT='application/json')),
+        )
+        print('Voting a post of a forum page with 15 posts')
+        for label, vote in votes:
+            queries = []  # django resets the query log at the start of every request
+            with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+                response = vote()
+            report(label, measure(vote))
+            print(f'{"":<45} {len(queries)} queries, {len(response.content)} bytes')
+
+
+if __name__ == '__main__':
+    main()
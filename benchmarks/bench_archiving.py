@@ -0,0 +1,61 @@
+'''
+Times the queries that hit the hot tables (latest posts of a forum, search inside a forum, replies
+of a post) before and after archive_threads moves the old threads out of them. Most of the
+posts are made old, like in a forum with years of history where only the last weeks get traffic.
+
+    python -m benchmarks.bench_archiving
+'''
+from datetime import timedelta
+
+from benchmarks.utils import benchmark_database, measure, report, create_member, create_forum_with_posts
+
+from django.db.models import Q
+from django.utils import timezone
+
+from forums.models import Post
+from comments.models import Comment
+from archive.archiving import archive_threads
+
+POSTS = 20000
+RECENT_POSTS = 1000
+COMMENTS_PER_POST = 3
+
+
+def main():
+    with benchmark_database():
+        user = create_member('benchmarker')
+        forum = create_forum_with_posts(user, 'benchforum', POSTS)
+        posts = list(forum.post_set.order_by('pk'))
+        Comment.objects.bulk_create(
+            Comment(post=post, commenter=user.member, content='a comment')
+            for post in posts for _ in range(COMMENTS_PER_POST)
+            )
+        long_ago = timezone.now() - timedelta(days=1000)
+        old_pks = [post.pk for post in posts[:-RECENT_POSTS]]
+        for start in range(0, len(old_pks), 500):
+            Post.objects.filter(pk__in=old_pks[start:start + 500]).update(pub_date=long_ago, last_modified=long_ago)
+        Comment.objects.filter(post_id__lte=old_pks[-1]).update(last_modified=long_ago)
+        recent_post = posts[-1]
+
+        def latest_posts():
+            list(forum.post_set.order_by('-pub_date')[:15])
+
+        def search():
+            list(forum.post_set.filter(Q(title__icontains='post 1999') | Q(content__icontains='post 1999')))
+
+        def replies():
+            list(recent_post.comment_set.all())
+
+        def run(label):
+            print(f'\n{label}: {Post.objects.count()} posts, {Comment.objects.count()} comments in the hot tables')
+            for name, func in (('latest 15 posts of the forum', latest_posts), ('search in the forum', search), ('replies of a post', replies)):
+                report(f'  {name}', measure(func))
+
+        run('Before archiving')
+        threads, comments = archive_threads(batch_size=500)
+        print(f'\nArchived {threads} threads, {comments} comments')
+        run('After archiving')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+'''
+Compares refreshing the scores of a forum page by reloading it with asking forums:bulk_points
+for the posts it shows, for a member that voted some of them.
+
+    python -m benchmarks.bench_bulk_points
+'''
+from benchmarks.utils import benchmark_database, measure, report, create_member, create_forum_with_posts
+
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from forums.models import Post
+
+
+def main():
+    with benchmark_database():
+        user = create_member('benchmarker')
+        forum = create_forum_with_posts(user, 'benchforum', 15)
+        posts = list(Post.objects.order_by('pk'))
+        for post in posts[::2]:
+            post.postvote_set.create(user=user, kind_of_vote='U')
+        client = Client()
+        client.login(username='benchmarker', password='benchmark')
+
+        forum_url = reverse('forums:show_forum', args=(forum.name,))
+        points_url = reverse('forums:bulk_points') + '?posts=' + ','.join(str(post.pk) for post in posts)
+        print(f'Refreshing the scores of {len(posts)} posts')
+        for label, url in (('reload the forum page', forum_url), ('bulk_points', points_url)):
+            queries = []  # django resets the query log at the start of every request
+            with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+                response = client.get(url)
+            report(label, measure(lambda: client.get(url)))
+            print(f'{"":<45} {len(queries)} queries, {len(response.content)} bytes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+'''
+Measures the post page of a small thread and of a huge one, on its first page of comments and
+deep into it (following the cursors of the pages), for every order of comments.pagination.
+
+    python -m benchmarks.bench_comment_pages
+'''
+from benchmarks.utils import benchmark_database, measure, report, create_member, create_forum_with_posts
+
+from django.conf import settings
+from django.test import Client
+from django.urls import reverse
+
+from comments import pagination
+from comments.models import Comment
+from forums.models import Post
+
+THREAD_SIZES = (50, 10000)  # A single page, and 200 pages
+
+
+def main():
+    with benchmark_database():
+        user = create_member('benchmarker')
+        create_forum_with_posts(user, 'benchforum', len(THREAD_SIZES))
+        client = Client()
+
+        for post, size in zip(Post.objects.order_by('pk'), THREAD_SIZES):
+            Comment.objects.bulk_create(
+                Comment(post=post, commenter=user.member, content=f'comment {i}', points=i % 17)
+                for i in range(size)
+                )
+            url = reverse('forums:show_post', args=(post.pk,))
+            print(f'\nThread of {size} comments ({settings.COMMENTS_PAGE_SIZE} per page)')
+            for sort in pagination.SORTS:
+                report(f'{sort}: first page', measure(lambda: client.get(url, {'sort': sort})))
+                cursor = None
+                for _ in range(min(size // settings.COMMENTS_PAGE_SIZE, 100)):
+                    cursor = pagination.get_page(post.comment_set.all(), sort=sort, cursor=cursor).next_cursor
+                if cursor:
+                    report(f'{sort}: page {min(size // settings.COMMENTS_PAGE_SIZE, 100) + 1}', measure(
+                        lambda: client.get(url, {'sort': sort, 'after': cursor})
+                        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+'''
+Time and peak python memory of export_forums/import_forums against dumpdata, for
+forums of growing size. The peak of export_forums is bounded by --chunk-size (it stops growing once
+the forum has more rows than a chunk), the one of import_forums by the id remap table of one forum.
+
+    python -m benchmarks.bench_export_import
+'''
+import os
+import tempfile
+import tracemalloc
+from io import StringIO
+
+from benchmarks.utils import benchmark_database, measure, create_member, create_forum_with_posts
+
+from django.core.management import call_command
+
+from abstract_models.vote import Vote
+from forums.models import Forum, PostVote
+from comments.models import Comment
+
+SIZES = {'smallforum': 500, 'mediumforum': 2000, 'largeforum': 8000}
+
+
+def fill_forum(owner, voter, name, n_posts):
+    forum = create_forum_with_posts(owner, name, n_posts)
+    posts = list(forum.post_set.all())
+    PostVote.objects.bulk_create(PostVote(post=post, user=voter, kind_of_vote=Vote.UPVOTE) for post in posts)
+    comments = Comment.objects.bulk_create(
+        Comment(post=post, commenter=voter.member, content='a comment') for post in posts
+        )
+    Comment.objects.bulk_create(
+        Comment(in_reply_to=comment, commenter=owner.member, content='a reply') for comment in comments
+        )
+    return forum
+
+
+def peak_memory(func):
+    '''(milliseconds, peak KiB allocated by python) of one call'''
+    tracemalloc.start()
+    timings = measure(func, repeat=1)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return timings[0], peak / 1024
+
+
+def main():
+    with benchmark_database(), tempfile.TemporaryDirectory() as directory:
+        owner = create_member('benchowner')
+        voter = create_member('benchvoter')
+        dump_path = os.path.join(directory, 'forum.jsonl')
+        fixture_path = os.path.join(directory, 'forum.json')
+
+        for name, n_posts in SIZES.items():
+            fill_forum(owner, voter, name, n_posts)
+            print(f'\n{n_posts} posts, {n_posts} votes, {2 * n_posts} comments')
+
+            def export():
+                call_command('export_forums', name, output=dump_path, stdout=StringIO())
+
+            def dumpdata():
+                call_command('dumpdata', 'forums.post', 'forums.postvote', 'comments', output=fixture_path)
+
+            def reimport():
+                Forum.objects.get(name=name).delete()
+                call_command('import_forums', dump_path, stdout=StringIO())
+
+            for label, func in (('export_forums', export), ('dumpdata', dumpdata), ('import_forums', reimport)):
+                elapsed, peak = peak_memory(func)
+                print(f'  {label:<15} {elapsed:9.1f} ms   peak {peak:9.0f} KiB')
+            Forum.objects.get(name=name).delete()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+'''
+Measures the Forum lookups of a forum page and of a page of posts from several forums (the
+"Posted in" links of the profile and the feed), from the db and from forums.forum_cache, and
+how many queries the requests for a forum that does not exist make.
+
+    python -m benchmarks.bench_forum_cache
+'''
+from benchmarks.utils import benchmark_database, measure, report, create_member, create_forum_with_posts
+
+from django.db import connection
+from django.core.cache import caches
+from django.test.utils import CaptureQueriesContext
+from django.test import Client
+
+from forums import forum_cache
+from forums.models import Forum, Post
+
+FORUMS = 'abcdefghijklmnopqrst'
+
+
+def main():
+    with benchmark_database():
+        user = create_member('benchmarker')
+        for letter in FORUMS:
+            create_forum_with_posts(user, f'bench{letter * 3}', 5)
+        posts = list(Post.objects.order_by('pk'))
+        client = Client()
+
+        print(f'Looking up the forum of {len(posts)} posts from {len(FORUMS)} forums')
+        report('db: post.forum', measure(lambda: [Forum.objects.get(pk=post.forum_id) for post in posts]))
+        caches['objects'].clear()
+        report('cache: post.cached_forum (cold)', measure(lambda: [post.cached_forum for post in posts], repeat=1))
+        report('cache: post.cached_forum (warm)', measure(lambda: [post.cached_forum for post in posts]))
+
+        print('\nRequesting a forum that does not exist')
+        report('db: Forum by name', measure(lambda: Forum.objects.filter(name='nosuchforum').first()))
+        report('cache: Forum by name', measure(lambda: forum_cache.get_forum_by_name('nosuchforum')))
+        for attempt in ('first', 'second'):
+            with CaptureQueriesContext(connection) as queries:
+                client.get('/forums/othermissing/')
+            print(f'{attempt} request: {len(queries)} queries')
+
+
+if __name__ == '__main__':
+    main()
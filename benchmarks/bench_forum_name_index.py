@@ -0,0 +1,43 @@
+'''
+Builds the forum name similarity index over up to 10^6 random forum names and measures how long
+it takes to find the names that are too similar to a new one. Does not need a database.
+
+    python -m benchmarks.bench_forum_name_index
+'''
+import random
+import string
+import time
+
+from benchmarks.utils import measure, report
+
+from forums.name_index import ForumNameIndex
+
+
+def random_real_name(rng):
+    return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 15)))
+
+
+def main():
+    rng = random.Random(0)
+    for n_forums in (10 ** 4, 10 ** 5, 10 ** 6):
+        real_names = {random_real_name(rng) for _ in range(n_forums)}
+        real_names.add('tiktoknews')
+
+        index = ForumNameIndex()
+        start = time.perf_counter()
+        index.rebuild(real_names)
+        print(f'\n{len(real_names)} forums, index built in {time.perf_counter() - start:.1f} s')
+
+        assert 'tiktoknews' in index.similar_to('tiktoknewz')
+        queries = [random_real_name(rng) for _ in range(1000)]
+
+        def lookups():
+            for query in queries:
+                index.similar_to(query)
+
+        # 1000 lookups per call, so the reported milliseconds are microseconds per lookup
+        report('similar_to() (us per lookup)', measure(lookups, repeat=5))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+'''
+Measures how long it takes to render a page of posts (includes/show_posts.html) and a page
+of replies (includes/show_replies.html) with the template fragment cache disabled, cold and warm.
+
+    python -m benchmarks.bench_fragment_cache
+'''
+from benchmarks.utils import benchmark_database, measure, report, create_member, create_forum_with_posts
+
+from django.core.cache import caches
+from django.test import RequestFactory, override_settings
+from django.template.loader import render_to_string
+
+from comments.models import Comment
+
+PAGE_SIZE = 100
+
+DUMMY_FRAGMENT_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'objects': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'template_fragments': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+def main():
+    with benchmark_database():
+        user = create_member('benchmarker')
+        forum = create_forum_with_posts(user, 'benchforum', PAGE_SIZE)
+        posts = list(forum.post_set.select_related('forum', 'poster__user'))
+        Comment.objects.bulk_create(
+            Comment(commenter=user.member, post=posts[0], content=f'reply {i}') for i in range(PAGE_SIZE)
+        )
+        replies = list(posts[0].comment_set.select_related('commenter__user'))
+
+        request = RequestFactory().get('/')
+        request.user = user
+
+        def render_posts():
+            render_to_string('includes/show_posts.html', {'posts_to_show': posts}, request=request)
+
+        def render_replies():
+            render_to_string('includes/show_replies.html', {'replies': replies}, request=request)
+
+        print(f'Rendering {PAGE_SIZE} posts / {PAGE_SIZE} replies per page')
+        for label, render in (('posts', render_posts), ('replies', render_replies)):
+            with override_settings(CACHES=DUMMY_FRAGMENT_CACHE):
+                report(f'{label}: no fragment cache', measure(render))
+
+            caches['template_fragments'].clear()
+            report(f'{label}: cold fragment cache', measure(render, repeat=1))
+            report(f'{label}: warm fragment cache', measure(render))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+'''
+Renders pages of 500 posts and 500 replies with and without the cached template loader, and
+compares reverse() against the precomputed URL builders used by the per-row links. The template
+fragment cache is disabled so every row is actually rendered.
+
+    python -m benchmarks.bench_list_rendering
+'''
+import copy
+
+from benchmarks.utils import benchmark_database, measure, report, create_member, create_forum_with_posts
+
+from django.conf import settings
+from django.urls import reverse
+from django.test import RequestFactory, override_settings
+from django.template.loader import render_to_string
+
+from comments.models import Comment
+from templatetags.fast_urls import build_url
+
+ROWS = 500
+
+NO_FRAGMENT_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'objects': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'template_fragments': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+def templates_setting(cached):
+    templates = copy.deepcopy(settings.TEMPLATES)
+    loaders = settings.TEMPLATE_LOADERS
+    templates[0]['OPTIONS']['loaders'] = [('django.template.loaders.cached.Loader', loaders)] if cached else loaders
+    return templates
+
+
+def main():
+    with benchmark_database():
+        user = create_member('benchmarker')
+        forum = create_forum_with_posts(user, 'benchforum', ROWS)
+        posts = list(forum.post_set.select_related('forum', 'poster__user'))
+        Comment.objects.bulk_create(
+            Comment(commenter=user.member, post=posts[0], content=f'reply {i}') for i in range(ROWS)
+        )
+        replies = list(posts[0].comment_set.select_related('commenter__user'))
+
+        request = RequestFactory().get('/')
+        request.user = user
+
+        def render_posts():
+            render_to_string('includes/show_posts.html', {'posts_to_show': posts}, request=request)
+
+        def render_replies():
+            render_to_string('includes/show_replies.html', {'replies': replies}, request=request)
+
+        print(f'Rendering {ROWS} rows per page')
+        for cached in (False, True):
+            loader = 'cached loader' if cached else 'uncached loader'
+            with override_settings(CACHES=NO_FRAGMENT_CACHE, TEMPLATES=templates_setting(cached)):
+                report(f'posts: {loader}', measure(render_posts, repeat=10))
+                report(f'replies: {loader}', measure(render_replies, repeat=10))
+
+        print(f'\nBuilding the 4 per-row links of {ROWS} rows')
+
+        def with_reverse():
+            for post in posts:
+                reverse('forums:show_post', args=(post.pk,))
+                reverse('forums:upvote_post', args=(post.pk,))
+                reverse('members:show_member', args=(post.poster.user.username,))
+                reverse('comments:show_comment', args=(post.pk,))
+
+        def with_builders():
+            for post in posts:
+                build_url('forums:show_post', post.pk)
+                build_url('forums:upvote_post', post.pk)
+                build_url('members:show_member', post.poster.user.username)
+                build_url('comments:show_comment', post.pk)
+
+        report('reverse()', measure(with_reverse))
+        report('URLBuilder', measure(with_builders))
+
+
+if __name__ == '__main__':
+    main()
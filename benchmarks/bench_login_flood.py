@@ -0,0 +1,88 @@
+'''
+Load test: measures the latency of a read page (the forums directory) while other threads flood the
+login view with wrong passwords, with the login throttling disabled and enabled.
+
+    python -m benchmarks.bench_login_flood
+'''
+import time
+import logging
+import threading
+import statistics
+
+from benchmarks.utils import benchmark_database, create_member, create_forum_with_posts
+
+from django.db import connections
+from django.core.cache import cache
+from django.test import Client, override_settings
+from django.urls import reverse
+
+FLOOD_THREADS = 16
+DURATION = 3  # seconds
+
+NO_THROTTLING = {
+    'login_per_ip': (10 ** 9, 60),
+    'login_per_username': (10 ** 9, 60),
+    'singup_per_ip': (10 ** 9, 60),
+}
+
+
+def read_latencies(stop):
+    client = Client()
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        client.get(reverse('forums:forums_home'))
+        latencies.append((time.perf_counter() - start) * 1000)
+    connections.close_all()
+    return latencies
+
+
+def flood(stop, attempts):
+    client = Client()
+    while not stop.is_set():
+        client.post(reverse('members:login'), {'username': 'victim', 'password': 'wrong password'})
+        attempts.append(1)
+    connections.close_all()
+
+
+def run(flood_threads):
+    cache.clear()
+    stop = threading.Event()
+    attempts = []
+    threads = [threading.Thread(target=flood, args=(stop, attempts)) for _ in range(flood_threads)]
+    for thread in threads:
+        thread.start()
+
+    result = {}
+    reader = threading.Thread(target=lambda: result.update(latencies=read_latencies(stop)))
+    reader.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads + [reader]:
+        thread.join()
+
+    latencies = sorted(result['latencies'])
+    p95 = latencies[int(len(latencies) * 0.95)]
+    print(
+        f'  read median {statistics.median(latencies):7.2f} ms   p95 {p95:7.2f} ms   '
+        f'({len(attempts) / DURATION:.0f} login attempts/s)'
+        )
+
+
+def main():
+    logging.getLogger('django.request').setLevel(logging.ERROR)  # Not logging every 429
+    with benchmark_database():
+        victim = create_member('victim')
+        create_forum_with_posts(victim, 'benchforum', 0)
+
+        print('No flood')
+        run(0)
+        with override_settings(AUTH_THROTTLE_RATES=NO_THROTTLING):
+            print(f'{FLOOD_THREADS} threads flooding the login view, throttling disabled')
+            run(FLOOD_THREADS)
+        print(f'{FLOOD_THREADS} threads flooding the login view, throttling enabled')
+        run(FLOOD_THREADS)
+
+
+if __name__ == '__main__':
+    main()
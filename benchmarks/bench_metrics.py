@@ -0,0 +1,63 @@
+'''
+Measures monitoring.metrics: what MetricsMiddleware adds to a forum page (with and without it),
+the bookkeeping it does per request on its own, and a scrape of /metrics adding up the files of
+16 workers.
+
+    python -m benchmarks.bench_metrics
+'''
+from benchmarks.utils import benchmark_database, measure, report, create_member, create_forum_with_posts
+
+import time
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.test import Client
+from django.test.utils import modify_settings, override_settings
+from django.urls import reverse
+
+from monitoring import metrics
+
+MIDDLEWARE = 'monitoring.metrics.MetricsMiddleware'
+WORKERS = 16
+
+
+def bookkeeping(n=10_000):
+    '''The updates of the metrics MetricsMiddleware makes for a request'''
+    for _ in range(n):
+        metrics.request_latency.observe(0.012, 'forums:show_forum', 'GET')
+        metrics.requests.inc('forums:show_forum', 'GET', 200)
+        metrics.request_queries.observe(7, 'forums:show_forum')
+        metrics.request_db_time.observe(0.002, 'forums:show_forum')
+        metrics.response_size.observe(25_000, 'forums:show_forum')
+
+
+def main():
+    with benchmark_database(), tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+        user = create_member('benchmarker')
+        forum = create_forum_with_posts(user, 'benchforum', 30)
+        client = Client()
+        url = reverse('forums:show_forum', args=(forum.name,))
+        client.get(url)  # Warming up the caches
+
+        with modify_settings(MIDDLEWARE={'remove': MIDDLEWARE}):
+            report('without the middleware', measure(lambda: client.get(url), repeat=200))
+        report('with the middleware', measure(lambda: client.get(url), repeat=200))
+
+        start = time.perf_counter()
+        bookkeeping()
+        print(f'Updates of the metrics of a request: {(time.perf_counter() - start) * 100:.2f} µs')
+
+        for view in ('forums:show_post', 'forums:show_forum', 'members:feed', 'comments:show_comment'):
+            for status in (200, 302, 404):
+                metrics.requests.inc(view, 'GET', status)
+                metrics.request_latency.observe(0.01, view, 'GET')
+        metrics.flush()
+        own = next(Path(directory).glob('*.json'))
+        for worker in range(WORKERS - 1):
+            shutil.copy(own, Path(directory, f'{worker}-0.json'))
+        report(f'scrape of {WORKERS} workers', measure(lambda: client.get(reverse('metrics'))))
+
+
+if __name__ == '__main__':
+    main()
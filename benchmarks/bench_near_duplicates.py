@@ -0,0 +1,128 @@
+'''
+Measures the near-duplicate detection of forums.duplicates on real English text, the paragraphs
+of the docstrings of the standard library: how many one word edits of a text are caught, how
+many pairs of unrelated texts are taken for near duplicates (false positives), what happens to
+short replies that only differ in one word, and how long a lookup takes in a forum with many
+recent fingerprints.
+
+    python -m benchmarks.bench_near_duplicates
+'''
+import re
+import random
+import inspect
+import importlib
+from itertools import combinations
+
+from benchmarks.utils import benchmark_database, measure, report, create_member, create_forum_with_posts
+
+from django.conf import settings
+
+from forums import duplicates
+from forums.models import Post, Fingerprint
+
+MODULES = (
+    'argparse', 'asyncio', 'base64', 'bisect', 'calendar', 'codecs', 'collections', 'configparser',
+    'contextlib', 'copy', 'csv', 'dataclasses', 'datetime', 'decimal', 'difflib', 'email', 'enum',
+    'fractions', 'ftplib', 'functools', 'gettext', 'glob', 'gzip', 'hashlib', 'heapq', 'html.parser',
+    'http.client', 'imaplib', 'inspect', 'io', 'ipaddress', 'itertools', 'json', 'locale', 'logging',
+    'mailbox', 'mimetypes', 'os', 'pathlib', 'pdb', 'pickle', 'platform', 'pprint', 'pstats', 'queue',
+    'random', 're', 'sched', 'selectors', 'shlex', 'shutil', 'smtplib', 'socket', 'sqlite3', 'ssl',
+    'statistics', 'string', 'subprocess', 'tarfile', 'tempfile', 'textwrap', 'threading', 'timeit',
+    'trace', 'traceback', 'unittest', 'urllib.request', 'uuid', 'warnings', 'weakref',
+    'xml.etree.ElementTree', 'zipfile',
+    )
+SHORT_REPLIES = (
+    ('I have the same problem with my laptop', 'I have the same problem with my phone'),
+    ('This is the best movie I have seen this year', 'This is the worst movie I have seen this year'),
+    ('Does anyone know how to fix this error in python', 'Does anyone know how to fix this error in java'),
+    )
+FINGERPRINTS = (2000, 20000)  # Recent fingerprints of the forum, the lookups are timed at both sizes
+TRIALS = 2000
+UNRELATED = 0.5  # Texts sharing less than this fraction (Jaccard index) of their words
+
+
+def corpus():
+    '''The paragraphs of at least 4 words of the docstrings of the classes and functions of MODULES'''
+    texts = set()
+    for name in MODULES:
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            continue
+        for value in vars(module).values():
+            documented = inspect.isfunction(value) or inspect.isclass(value) or inspect.isbuiltin(value)
+            if documented and isinstance(value.__doc__, str):
+                for paragraph in re.split(r'\n\s*\n', value.__doc__):
+                    text = ' '.join(paragraph.split())
+                    if len(text.split()) >= 4 and not text.startswith(('>>>', '-', '=')):
+                        texts.add(text)
+    return sorted(texts)
+
+
+def one_word_edit(rng, text, vocabulary):
+    '''text with one of its words that is not a stop word replaced'''
+    words = text.split()
+    candidates = [i for i, word in enumerate(words) if duplicates.features(word)]
+    words[rng.choice(candidates)] = rng.choice(vocabulary)
+    return ' '.join(words)
+
+
+def fill(forum, post, texts):
+    Fingerprint.objects.bulk_create(
+        Fingerprint(
+            forum=forum, post=post, simhash=value,
+            **{f'band{band}': band_value for band, band_value in enumerate(duplicates.bands(value))}
+            )
+        for value in map(duplicates.simhash, texts)
+        )
+
+
+def main():
+    rng = random.Random(42)
+    max_distance = settings.NEAR_DUPLICATE_MAX_DISTANCE
+    texts = corpus()
+    checked = [text for text in texts if duplicates.is_checked(text)]
+    vocabulary = sorted({word for text in checked for word in duplicates.features(text)})
+    print(f'{len(texts)} texts, {len(checked)} of them with {settings.NEAR_DUPLICATE_MIN_WORDS}+ words that are checked')
+    print(f'max distance {max_distance}, default action {settings.NEAR_DUPLICATE_ACTION!r}')
+
+    edits = [(text, one_word_edit(rng, text, vocabulary)) for text in rng.choices(checked, k=TRIALS)]
+    caught = sum(duplicates.distance(duplicates.simhash(a), duplicates.simhash(b)) <= max_distance for a, b in edits)
+    print(f'one word edits caught: {caught / TRIALS:.1%}')
+
+    hashed = [(duplicates.simhash(text), set(duplicates.features(text))) for text in checked]
+    pairs = false_positives = 0
+    for (a, a_words), (b, b_words) in combinations(hashed, 2):
+        if len(a_words & b_words) < UNRELATED * len(a_words | b_words):
+            pairs += 1
+            false_positives += duplicates.distance(a, b) <= max_distance
+    print(f'unrelated pairs taken for near duplicates: {false_positives} of {pairs} ({false_positives / pairs:.1e})')
+
+    for a, b in SHORT_REPLIES:
+        state = 'checked' if duplicates.is_checked(a) else 'not checked'
+        print(f'{duplicates.distance(duplicates.simhash(a), duplicates.simhash(b)):2} bits, {state}: {a!r} / {b!r}')
+
+    with benchmark_database():
+        user = create_member('benchmarker')
+        forum = create_forum_with_posts(user, 'benchforum', 1)
+        post = Post.objects.get()
+
+        def found(text):
+            return duplicates.check(text, forum.pk, 'default')[1] is not None
+
+        published = 0
+        for size in FINGERPRINTS:
+            # The corpus over and over, each time with its paragraphs in other pairs
+            fill(forum, post, (f'{rng.choice(checked)} {rng.choice(checked)}' for _ in range(size - published)))
+            published = size
+            edit, unrelated = edits[0][1], rng.choice(checked)
+            fill(forum, post, [edits[0][0]])
+
+            print(f'\n{size} recent fingerprints in the forum')
+            report('simhash of a text', measure(lambda: duplicates.simhash(unrelated), repeat=200))
+            report('lookup of a near duplicate', measure(lambda: found(edit), repeat=200))
+            report('lookup of an unrelated text', measure(lambda: found(unrelated), repeat=200))
+
+
+if __name__ == '__main__':
+    main()
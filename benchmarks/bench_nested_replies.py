@@ -0,0 +1,49 @@
+'''
+Measures opening the replies of a comment of a post page: the whole comment page it used to link
+to, against the comments:replies_fragment that static/js/load_replies.js fetches, and that
+fragment again when it did not change (answered 304 from its ETag).
+
+    python -m benchmarks.bench_nested_replies
+'''
+from benchmarks.utils import benchmark_database, measure, report, create_member, create_forum_with_posts
+
+from django.test import Client
+from django.urls import reverse
+
+from comments.models import Comment
+from forums.models import Post
+
+REPLIES = 30  # Replies of the comment, each with a few replies of its own
+
+
+def main():
+    with benchmark_database():
+        user = create_member('benchmarker')
+        create_forum_with_posts(user, 'benchforum', 1)
+        post = Post.objects.get()
+        parent = Comment.objects.create(post=post, commenter=user.member, content='parent comment')
+        replies = Comment.objects.bulk_create(
+            Comment(in_reply_to=parent, commenter=user.member, content=f'reply {i}') for i in range(REPLIES)
+            )
+        Comment.objects.bulk_create(
+            Comment(in_reply_to=reply, commenter=user.member, content=f'nested reply {i}')
+            for reply in replies for i in range(3)
+            )
+        client = Client()
+        client.login(username='benchmarker', password='benchmark')
+
+        page_url = reverse('comments:show_comment', args=(parent.pk,))
+        fragment_url = reverse('comments:replies_fragment', args=(parent.pk,))
+        page_size = len(client.get(page_url).content)
+        response = client.get(fragment_url)
+        print(f'\n{REPLIES} replies: comment page {page_size} bytes, fragment {len(response.content)} bytes')
+        report('comment page', measure(lambda: client.get(page_url)))
+        report('replies fragment', measure(lambda: client.get(fragment_url)))
+        etag = response['ETag']
+        report('replies fragment, not modified (304)', measure(
+            lambda: client.get(fragment_url, HTTP_IF_NONE_MATCH=etag)
+            ))
+
+
+if __name__ == '__main__':
+    main()
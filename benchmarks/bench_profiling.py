@@ -0,0 +1,36 @@
+'''
+Measures what monitoring.profiling.ProfilingMiddleware adds to a forum page: without the
+middleware, with it but unsampled (what almost every request pays), and on a profiled request,
+including the dump of its profile.
+
+    python -m benchmarks.bench_profiling
+'''
+from benchmarks.utils import benchmark_database, measure, report, create_member, create_forum_with_posts
+
+import tempfile
+
+from django.test import Client
+from django.test.utils import modify_settings, override_settings
+from django.urls import reverse
+
+MIDDLEWARE = 'monitoring.profiling.ProfilingMiddleware'
+
+
+def main():
+    with benchmark_database(), tempfile.TemporaryDirectory() as directory, override_settings(PROFILING_DIR=directory):
+        user = create_member('benchmarker')
+        forum = create_forum_with_posts(user, 'benchforum', 30)
+        client = Client()
+        url = reverse('forums:show_forum', args=(forum.name,))
+        client.get(url)  # Warming up the caches
+
+        with modify_settings(MIDDLEWARE={'remove': MIDDLEWARE}):
+            report('without the middleware', measure(lambda: client.get(url), repeat=200))
+        with override_settings(PROFILING_SAMPLE_RATE=0):
+            report('unsampled', measure(lambda: client.get(url), repeat=200))
+        with override_settings(PROFILING_SAMPLE_RATE=1):
+            report('profiled', measure(lambda: client.get(url), repeat=50))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+'''
+Counts the db reads and writes, and how many of them hit django_session, made by an authenticated
+show_forum request and by a vote (POST + redirect back to the forum), for every session profile.
+
+    python -m benchmarks.bench_sessions
+'''
+from benchmarks.utils import benchmark_database, measure, report, create_member, create_forum_with_posts
+
+from django.db import connection
+from django.urls import reverse
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+
+
+def count_queries(func):
+    with CaptureQueriesContext(connection) as context:
+        func()
+    sqls = [query['sql'] for query in context.captured_queries]
+    writes = [sql for sql in sqls if not sql.lstrip().upper().startswith('SELECT')]
+    session = [sql for sql in sqls if 'django_session' in sql]
+    return len(sqls) - len(writes), len(writes), len(session)
+
+
+def main():
+    with benchmark_database():
+        user = create_member('benchmarker')
+        forum = create_forum_with_posts(user, 'benchforum', 15)
+        post = forum.post_set.first()
+        forum_url = reverse('forums:show_forum', args=(forum.name,))
+
+        for profile, engine in SESSION_ENGINES.items():
+            with override_settings(SESSION_ENGINE=engine):
+                client = Client()
+                client.force_login(user)
+                client.get(forum_url)  # Warming the session cache
+
+                def show_forum():
+                    client.get(forum_url)
+
+                def vote():
+                    client.post(reverse('forums:upvote_post', args=(post.pk,)), HTTP_REFERER=forum_url, follow=True)
+
+                print(f'\nSession profile: {profile}')
+                for label, func in (('show_forum', show_forum), ('vote + redirect', vote)):
+                    reads, writes, session = count_queries(func)
+                    print(f'  {label:<16} {reads:3} reads  {writes:3} writes  ({session} on django_session)')
+                report('  show_forum time', measure(show_forum))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+'''
+Measures what monitoring.slow_queries.SlowQueryMiddleware adds to a forum page when none of its
+queries is slow (with and without the middleware), then logs every query of the forum page and of
+the feed (SLOW_QUERY_SECONDS=0) and prints the slow_query_report of them.
+
+    python -m benchmarks.bench_slow_queries
+'''
+from benchmarks.utils import benchmark_database, measure, report, create_member, create_forum_with_posts
+
+import logging
+import tempfile
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import Client
+from django.test.utils import modify_settings, override_settings
+from django.urls import reverse
+
+MIDDLEWARE = 'monitoring.slow_queries.SlowQueryMiddleware'
+
+
+def main():
+    with benchmark_database(), tempfile.TemporaryDirectory() as directory:
+        log = Path(directory, 'slow.log')
+        user = create_member('benchmarker')
+        forum = create_forum_with_posts(user, 'benchforum', 30)
+        client = Client()
+        client.login(username='benchmarker', password='benchmark')
+        url = reverse('forums:show_forum', args=(forum.name,))
+        client.get(url)  # Warming up the caches
+
+        with modify_settings(MIDDLEWARE={'remove': MIDDLEWARE}):
+            report('without the middleware', measure(lambda: client.get(url), repeat=200))
+        report('with the middleware, no slow query', measure(lambda: client.get(url), repeat=200))
+
+        logging.getLogger('monitoring.slow_queries').setLevel(logging.ERROR)  # Only the log file
+        with override_settings(SLOW_QUERY_SECONDS=0, SLOW_QUERY_LOG=log):
+            report('with the middleware, every query slow', measure(lambda: client.get(url), repeat=20))
+            client.get(reverse('members:feed'))
+            print()
+            call_command('slow_query_report', top=5)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+'''
+Load test: measures the latency of a legitimate writer replying to posts while one account floods
+the vote views from several threads, with the write throttling disabled and enabled.
+
+    python -m benchmarks.bench_write_flood
+'''
+import os
+import time
+import tempfile
+import logging
+import threading
+import statistics
+
+from benchmarks.utils import benchmark_database, create_member, create_forum_with_posts
+
+from django.db import connection, connections
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from forums.models import Post
+
+FLOOD_THREADS = 4
+DURATION = 5  # seconds
+
+NO_THROTTLING = {
+    scope: (10 ** 9, 60)
+    for action in ('post', 'comment', 'vote') for scope in (f'{action}_per_user', f'{action}_per_ip')
+}
+
+
+def write_latencies(stop, post_pk):
+    # The exceptions of a request are signaled to every test client, the ones of the flood are not ours
+    client = Client(REMOTE_ADDR='10.0.0.1', raise_request_exception=False)
+    client.login(username='writer', password='benchmark')
+    latencies, failures = [], 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = client.post(reverse('comments:reply_to_post', args=(post_pk,)), {'comment_content': 'a reply'})
+        failures += response.status_code != 302  # database is locked
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.05)  # Not a flood itself
+    connections.close_all()
+    return latencies, failures
+
+
+def flood(stop, votes, post_pk):
+    client = Client(REMOTE_ADDR='10.0.0.66', raise_request_exception=False)
+    client.login(username='bot', password='benchmark')
+    while not stop.is_set():
+        client.post(reverse('forums:upvote_post', args=(post_pk,)))  # Might fail, it is not measured
+        votes.append(1)
+    connections.close_all()
+
+
+def run(flood_threads, post_pk):
+    cache.clear()
+    stop = threading.Event()
+    votes = []
+    threads = [threading.Thread(target=flood, args=(stop, votes, post_pk)) for _ in range(flood_threads)]
+    for thread in threads:
+        thread.start()
+
+    result = {}
+    writer = threading.Thread(target=lambda: result.update(writes=write_latencies(stop, post_pk)))
+    writer.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads + [writer]:
+        thread.join()
+
+    latencies, failures = result['writes']
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)]
+    print(
+        f'  reply median {statistics.median(latencies):7.2f} ms   p95 {p95:7.2f} ms   '
+        f'{failures} replies failed   ({len(votes) / DURATION:.0f} flood votes/s)'
+        )
+
+
+def main():
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)  # Not logging every 429 and failed vote
+    # Concurrent writers need a db file, an in-memory test db fails with "table is locked" instead of waiting
+    connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench_write_flood.sqlite3')
+    with benchmark_database():
+        owner = create_member('writer')
+        create_member('bot')
+        create_forum_with_posts(owner, 'benchforum', 1)
+        post_pk = Post.objects.get().pk
+
+        with override_settings(WRITE_THROTTLE_RATES=NO_THROTTLING):
+            print('No flood')
+            run(0, post_pk)
+            print(f'{FLOOD_THREADS} threads flooding the vote views, throttling disabled')
+            run(FLOOD_THREADS, post_pk)
+        # The writer replies faster than its comment limits allow, so that every run measures many replies
+        with override_settings(WRITE_THROTTLE_RATES={
+                **settings.WRITE_THROTTLE_RATES, 'comment_per_user': (10 ** 9, 60), 'comment_per_ip': (10 ** 9, 60)
+                }):
+            print(f'{FLOOD_THREADS} threads flooding the vote views, throttling enabled')
+            run(FLOOD_THREADS, post_pk)
+
+
+if __name__ == '__main__':
+    main()
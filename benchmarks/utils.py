@@ -0,0 +1,75 @@
+'''
+Helpers shared by the benchmark scripts.
+
+Every benchmark runs against a throwaway test database (just like manage.py test does),
+so they are safe to run in a checkout that has a real db.sqlite3. Run them from the
+project root as modules, for example:
+
+    python -m benchmarks.bench_fragment_cache
+'''
+import os
+import time
+import statistics
+from contextlib import contextmanager
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'forum_app.settings')
+django.setup()
+
+from django.db import connection
+from django.contrib.auth.models import User
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from members.models import Member
+from forums.models import Forum, Post
+
+
+@contextmanager
+def benchmark_database():
+    '''Creates a fresh test database for the duration of the block and destroys it afterwards'''
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(func, *, repeat=20):
+    '''Calls func repeat times and returns the elapsed time of every call, in milliseconds'''
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label, timings):
+    print(
+        f'{label:<45} median {statistics.median(timings):8.2f} ms   '
+        f'min {min(timings):8.2f} ms   max {max(timings):8.2f} ms'
+        )
+
+
+def create_member(username, password='benchmark'):
+    user = User(username=username)
+    user.set_password(password)
+    user.save()
+    Member.objects.create(user=user, bio='benchmark member')
+    return user
+
+
+def create_forum_with_posts(owner, name, n_posts):
+    '''Creates a forum owned by owner (who also joins it) with n_posts posts written by the owner'''
+    forum = Forum(owner=owner, name=name, description='benchmark forum')
+    forum.save()
+    forum.members.add(owner.member)
+    Post.objects.bulk_create(
+        Post(forum=forum, poster=owner.member, title=f'post {i}', content=f'content of post {i} ' * 5)
+        for i in range(n_posts)
+    )
+    return forum
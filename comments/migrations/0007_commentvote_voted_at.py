@@ -0,0 +1,20 @@
+# Generated by Django 4.0.10 on 2026-10-19 13:09
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0006_comment_last_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commentvote',
+            name='voted_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='voted_at'),
+            preserve_default=False,
+        ),
+    ]
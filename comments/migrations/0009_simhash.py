@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-19 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0008_sharding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='simhash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
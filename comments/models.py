@@ -6,8 +6,21 @@ from forums.models import Post
 from members.models import Member
 
 
+# The post of the thread the comment %s is in: the comments it replies to are followed up to the
+# one that comments the post
+THREAD_POST_SQL = '''
+    WITH RECURSIVE thread(id, post_id, in_reply_to_id) AS (
+        SELECT id, post_id, in_reply_to_id FROM {comment} WHERE id = %s
+        UNION ALL
+        SELECT parent.id, parent.post_id, parent.in_reply_to_id FROM {comment} parent
+        JOIN thread ON parent.id = thread.in_reply_to_id
+    )
+    SELECT {post}.* FROM {post} JOIN thread ON {post}.id = thread.post_id
+'''
+
+
 class Comment(models.Model):
-    commenter = models.ForeignKey(Member, on_delete=models.CASCADE)
+    commenter = models.ForeignKey(Member, on_delete=models.DO_NOTHING, db_constraint=False)  # See Post.poster
     post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True)
     in_reply_to = models.ForeignKey(
         'self',
@@ -18,11 +31,38 @@ class Comment(models.Model):
     points = models.IntegerField(default=0)
     edited = models.BooleanField(default=False)
     pub_date = models.DateTimeField('pub_date', auto_now_add=True)
+    # Bumped on every save, cached template fragments of the comment are keyed on it
+    last_modified = models.DateTimeField('last_modified', auto_now=True)
+    # SimHash of the content, see forums.duplicates. Null until backfill_fingerprints fills it
+    simhash = models.BigIntegerField(null=True, blank=True)
 
     def was_published_by(self, member):
         return self.commenter == member
+
+    def thread_post(self):
+        '''
+        The post at the root of the thread of this comment. For a reply, the chain of comments up to
+        it is followed in the database with one recursive query, whatever the nesting, and the post
+        is kept on the comment (the votes of a reply need it, and so does sharding.get_or_404)
+        '''
+        if self.post_id is not None:
+            return self.post
+        if getattr(self, '_thread_post', None) is None:
+            sql = THREAD_POST_SQL.format(comment=Comment._meta.db_table, post=Post._meta.db_table)
+            posts = list(Post.objects.raw(sql, [self.in_reply_to_id]).using(self._state.db))
+            if not posts:
+                raise Post.DoesNotExist(f'Comment {self.pk} is not in the thread of a post')
+            self._thread_post = posts[0]
+        return self._thread_post
         
     class Meta:
+        # The orders of comments.pagination, for the comments of a post and the replies of a comment
+        indexes = [
+            models.Index(fields=['post', 'pub_date', 'id'], name='comment_post_pub_date_idx'),
+            models.Index(fields=['post', 'points', 'id'], name='comment_post_points_idx'),
+            models.Index(fields=['in_reply_to', 'pub_date', 'id'], name='comment_reply_pub_date_idx'),
+            models.Index(fields=['in_reply_to', 'points', 'id'], name='comment_reply_points_idx'),
+        ]
         constraints = [
             # Comment must be linked either to another comment or a post
             CheckConstraint(
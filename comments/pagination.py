@@ -0,0 +1,111 @@
+'''
+Keyset pagination of the comments of a post and of the replies of a comment.
+
+A page is the first COMMENTS_PAGE_SIZE comments after a cursor (the sort value and id of the last
+comment of the previous page) in one of the SORTS orders. Every order is backed by an index of
+Comment that starts with the parent (post or in_reply_to), so a page is a range scan of at most
+COMMENTS_PAGE_SIZE + 1 index entries, wherever it is in the thread and however big the thread is.
+An OFFSET would read and skip every comment of the previous pages instead.
+'''
+import json
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+# sort: (field, descending)
+SORTS = {
+    'old': ('pub_date', False),
+    'new': ('pub_date', True),
+    'top': ('points', True),
+}
+DEFAULT_SORT = 'old'
+
+# Range of the integer columns, the database drivers raise OverflowError on values out of it
+MIN_INTEGER, MAX_INTEGER = -2 ** 63, 2 ** 63 - 1
+
+
+def encode_cursor(comment, sort):
+    field, _ = SORTS[sort]
+    value = getattr(comment, field)
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    return urlsafe_base64_encode(json.dumps([value, comment.pk]).encode())
+
+
+def decode_cursor(cursor, sort):
+    '''The (sort value, id) of cursor, ValueError if it is not a cursor of that sort'''
+    field, _ = SORTS[sort]
+    try:
+        value, pk = json.loads(urlsafe_base64_decode(cursor))
+        if field == 'pub_date':
+            value = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):  # Includes the base64 and json errors
+        raise ValueError(f'Invalid cursor {cursor!r}')
+    if not is_integer(pk) or (field == 'points' and not is_integer(value)):
+        raise ValueError(f'Invalid cursor {cursor!r}')
+    return value, pk
+
+
+def is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool) and MIN_INTEGER <= value <= MAX_INTEGER
+
+
+class Page:
+    sorts = list(SORTS)
+
+    def __init__(self, comments, sort, next_cursor):
+        self.comments = comments
+        self.sort = sort
+        self.next_cursor = next_cursor  # None on the last page
+
+
+def get_page(queryset, *, sort=None, cursor=None, size=None):
+    '''
+    The page of the comments of queryset (the comments of one post, or the replies of one comment)
+    after cursor. An unknown sort is DEFAULT_SORT and an invalid cursor is the first page
+    '''
+    sort = sort if sort in SORTS else DEFAULT_SORT
+    size = size or settings.COMMENTS_PAGE_SIZE
+    field, descending = SORTS[sort]
+    order = '-' if descending else ''
+
+    if cursor:
+        try:
+            value, pk = decode_cursor(cursor, sort)
+        except ValueError:
+            pass
+        else:
+            # The first condition alone makes the index scan start at the cursor, the second one
+            # skips the comments with the same sort value that were already shown
+            before, after = ('lt', 'lte') if descending else ('gt', 'gte')
+            queryset = queryset.filter(
+                Q(**{f'{field}__{after}': value}),
+                Q(**{f'{field}__{before}': value}) | Q(**{field: value, f'pk__{before}': pk})
+                )
+
+    comments = list(queryset.order_by(f'{order}{field}', f'{order}pk')[:size + 1])
+    next_cursor = encode_cursor(comments[size - 1], sort) if len(comments) > size else None
+    return Page(add_reply_counts(comments[:size]), sort, next_cursor)
+
+
+def add_reply_counts(comments):
+    '''
+    Sets the reply_count of comments, shown by includes/show_replies.html, with one query per
+    shard instead of a count per comment. Returns comments
+    '''
+    from .models import Comment
+
+    pks_by_db = defaultdict(list)
+    for comment in comments:
+        pks_by_db[comment._state.db].append(comment.pk)
+    counts = {}
+    for db, pks in pks_by_db.items():
+        counts.update(
+            Comment.objects.using(db).filter(in_reply_to__in=pks).order_by().values_list('in_reply_to').annotate(Count('pk'))
+            )
+    for comment in comments:
+        comment.reply_count = counts.get(comment.pk, 0)
+    return comments
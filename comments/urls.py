@@ -9,6 +9,7 @@ urlpatterns = [
     path('<int:comment_id>/upvote', views.upvote_comment, name='upvote_comment'),
     path('<int:comment_id>/downvote', views.downvote_comment, name='downvote_comment'),
     path('<int:comment_id>/reply', views.reply_to_comment, name='reply_to_comment'),
+    path('<int:comment_id>/replies/', views.replies_fragment, name='replies_fragment'),
     path('<int:comment_id>/edit', views.edit_comment, name='edit_comment'),
     path('<int:comment_id>/delete', views.delete_comment, name='delete_comment')
 ]
\ No newline at end of file
@@ -1,96 +1,165 @@
+import hashlib
+
+from django.conf import settings
 from django.urls import reverse
 from django.contrib import messages
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect
 from django.core.exceptions import PermissionDenied
-from django.views.decorators.http import require_POST
-from django.shortcuts import render, get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_GET, require_POST
+from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 
+from forums import activity, duplicates, live, sharding
+from members.throttling import throttle_writes
 from forums.models import Post
+from abstract_models.vote import Vote, vote_response
+from archive.views import show_archived_comment
+from . import pagination
 from . models import Comment, CommentVote
 
+NEAR_DUPLICATE_MESSAGE = 'That looks like a copy of something recently published in this forum.'
+
 def show_comment(request, comment_id):
-    comment = get_object_or_404(Comment, pk=comment_id)
+    try:
+        comment = sharding.get_or_404(Comment, comment_id)
+    except Http404:
+        return show_archived_comment(request, comment_id)  # 404 if it is not archived either
     commenter_username = comment.commenter.user.username
-    replies = comment.comment_set.all()
+    page = pagination.get_page(comment.comment_set.all(), sort=request.GET.get('sort'), cursor=request.GET.get('after'))
 
     return render(request, 'comments/comment.html', {
         'comment': comment,
         'commenter_username': commenter_username,
-        'replies': replies
+        'replies': page.comments,
+        'page': page
     })
 
 
-def do_vote_stuff(comment, * , user, vote_record=None, upvoting=False, downvoting=False):
+@require_GET
+def replies_fragment(request, comment_id):
+    '''
+    The HTML of one page of the replies of a comment (?sort=&after=&limit=), without the rest of
+    the comment page, for static/js/load_replies.js to show deeper levels of a thread in place.
+    The ETag is the version of every reply of the page (votes and edits bump last_modified), so
+    loading the same replies again answers 304 without rendering them
+    '''
+    comment = sharding.get_or_404(Comment, comment_id)
+    try:
+        size = max(1, min(int(request.GET.get('limit', '')), settings.COMMENTS_PAGE_SIZE))
+    except ValueError:
+        size = settings.COMMENTS_PAGE_SIZE
+    page = pagination.get_page(comment.comment_set.all(), sort=request.GET.get('sort'), cursor=request.GET.get('after'), size=size)
+
+    version = [request.user.pk, page.sort, page.next_cursor]
+    version += [(reply.pk, reply.last_modified.isoformat(), reply.reply_count) for reply in page.comments]
+    etag = '"%s"' % hashlib.md5(repr(version).encode(), usedforsecurity=False).hexdigest()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = render(request, 'comments/replies_fragment.html', {
+            'comment': comment,
+            'replies': page.comments,
+            'page': page,
+            'limit': size
+        })
+        response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'  # Vote buttons of the user
+    return response
+
+
+def do_vote_stuff(comment, * , user, thread_post, vote_record=None, upvoting=False, downvoting=False):
     '''
     Function to avoid DRY in upvote and downvote comment views.
     
     Parameters:
         - Comment: a comment object (models.Comment) to be upvoted/downvoted
         - User: a User object (django.contrib.auth.models.User) whos upvoting/downvoting comment
+        - thread_post: the post at the root of the thread of comment (Comment.thread_post)
         - vote_record: a CommentVote object (models.CommentVote) if the comment was already upvoted/downvoted
         - upvoting: True if user wants to upvote comment, else False
         - downvoting: True if user wants to downvote comment, else false
+
+    Returns the kind of the vote of user once done (Vote.UPVOTE, Vote.DOWNVOTE or None)
     '''
+    removed = added = None  # Kinds of vote taken back and cast, for the activity log
     if vote_record: # Has voted before
         if vote_record.is_upvote():
             if upvoting:
                 comment.points -= 1  # Removing the upvote
                 vote_record.delete()
+                removed = Vote.UPVOTE
             elif downvoting:
                 comment.points -= 2  # Removing upvote effect and downvoting
+                removed, added = Vote.UPVOTE, Vote.DOWNVOTE
 
                 vote_record.kind_of_vote = 'D'  # Updating vote record
-                vote_record.save(update_fields=['kind_of_vote'])     
+                vote_record.voted_at = timezone.now()
+                vote_record.save(update_fields=['kind_of_vote', 'voted_at'])     
 
         elif vote_record.is_downvote():
             if upvoting:
                 comment.points += 2  # Remove downvt effects and upvoting
+                removed, added = Vote.DOWNVOTE, Vote.UPVOTE
 
                 vote_record.kind_of_vote = 'U'  # Updating vote record
-                vote_record.save(update_fields=['kind_of_vote'])
+                vote_record.voted_at = timezone.now()
+                vote_record.save(update_fields=['kind_of_vote', 'voted_at'])
                 
             elif downvoting:
                 comment.points += 1  # Removing the downvote
                 vote_record.delete()
+                removed = Vote.DOWNVOTE
 
     else:  # Voting first time
         if upvoting:
             comment.points += 1
+            added = Vote.UPVOTE
 
             # Creating vote record
-            CommentVote.objects.create(
-            comment=comment,
+            comment.commentvote_set.create(
             user=user,
             kind_of_vote='U'
         )
 
         elif downvoting:
             comment.points -= 1
+            added = Vote.DOWNVOTE
 
-            CommentVote.objects.create(
-            comment=comment,
+            comment.commentvote_set.create(
             user=user,
             kind_of_vote='D'
         )
 
-    comment.save(update_fields=['points'])  # Saving changes
+    comment.save(update_fields=['points', 'last_modified'])  # Saving changes
+    activity.record_vote_change(thread_post, removed=removed, added=added, on_comment=True)
+    live.points_changed(comment, thread_post)
+    return added  # Removing a vote leaves the user without one
 
 
 @login_required
 @require_POST
+@throttle_writes('comment')
 def reply_to_post(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = sharding.get_or_404(Post, post_id)
     if request.POST['comment_content'].strip():
+        simhash, duplicate = duplicates.check(request.POST['comment_content'], post.forum_id, post._state.db)
+        if duplicates.rejects(duplicate):
+            messages.add_message(request, messages.INFO, NEAR_DUPLICATE_MESSAGE)
+            return HttpResponseRedirect(reverse('forums:reply_post', args=(post.pk,)))
         comment = Comment(
             commenter=request.user.member, 
             post=post,
-            content=request.POST['comment_content']
+            content=request.POST['comment_content'],
+            simhash=simhash
         )
         comment.save()
+        duplicates.fingerprint(comment, post, near_duplicate=duplicate is not None)
+        activity.record_comment(post)
+        live.comment_added(comment, post)
 
         # Comments will have one upvote (made by commenter) by default
-        do_vote_stuff(comment, user=request.user, upvoting=True) 
+        do_vote_stuff(comment, thread_post=post, user=request.user, upvoting=True)
 
         return HttpResponseRedirect(reverse('comments:show_comment', args=(comment.pk,)))
     else:
@@ -103,25 +172,32 @@ def reply_to_post(request, post_id):
 
 
 @login_required
+@throttle_writes('comment')
 def reply_to_comment(request, comment_id):
-    comment_to_reply = get_object_or_404(Comment, pk=comment_id)
+    comment_to_reply = sharding.get_or_404(Comment, comment_id)
     if request.method == 'POST':
         content = request.POST.get('comment_content','').strip()
-        if content:
+        thread_post = comment_to_reply.thread_post()
+        simhash, duplicate = duplicates.check(content, thread_post.forum_id, thread_post._state.db)
+        if content and not duplicates.rejects(duplicate):
             new_comment = Comment(
                 commenter=request.user.member,
                 in_reply_to=comment_to_reply,
-                content=content
+                content=content,
+                simhash=simhash
             )
             new_comment.save()
-            do_vote_stuff(new_comment, user=request.user, upvoting=True)
+            duplicates.fingerprint(new_comment, thread_post, near_duplicate=duplicate is not None)
+            activity.record_comment(thread_post)
+            live.comment_added(new_comment, thread_post)
+            do_vote_stuff(new_comment, thread_post=thread_post, user=request.user, upvoting=True)
             return HttpResponseRedirect(reverse('comments:show_comment', args=(new_comment.pk,)))
         
-        else: # User attempted to send comment withoud content
+        else: # User attempted to send comment withoud content, or a copy of a recent one
             messages.add_message(
                 request,
                 messages.INFO,
-                'Please provide a content!'
+                'Please provide a content!' if not content else NEAR_DUPLICATE_MESSAGE
             )
             
             return render(request, 'comments/reply_to_comment.html', {
@@ -136,46 +212,52 @@ def reply_to_comment(request, comment_id):
 
 @login_required
 @require_POST
+@throttle_writes('vote')
 def upvote_comment(request, comment_id):
     redirection_url = request.META.get(
         'HTTP_REFERER', 
         reverse('comments:show_comment', args=(comment_id,))
         )
-    comment = get_object_or_404(Comment, pk=comment_id)
+    comment = sharding.get_or_404(Comment, comment_id)
 
     try:
-        vote_record = CommentVote.objects.get(comment=comment, user=request.user)
+        vote_record = comment.commentvote_set.get(user=request.user)
     except CommentVote.DoesNotExist:
         vote_record=None
 
-    do_vote_stuff(comment, vote_record=vote_record, user=request.user, upvoting=True)
+    kind_of_vote = do_vote_stuff(
+        comment, thread_post=comment.thread_post(), vote_record=vote_record, user=request.user, upvoting=True
+        )
 
-    return HttpResponseRedirect(redirection_url)
+    return vote_response(request, comment.points, kind_of_vote, redirection_url)
 
 
 @login_required
 @require_POST
+@throttle_writes('vote')
 def downvote_comment(request, comment_id):
     redirection_url = request.META.get(
         'HTTP_REFERER', 
         reverse('comments:show_comment', args=(comment_id,))
         )
-    comment = get_object_or_404(Comment, pk=comment_id)
+    comment = sharding.get_or_404(Comment, comment_id)
 
     try:
-        vote_record = CommentVote.objects.get(comment=comment, user=request.user)
+        vote_record = comment.commentvote_set.get(user=request.user)
     except CommentVote.DoesNotExist:
         vote_record=None
 
-    do_vote_stuff(comment, vote_record=vote_record, user=request.user, downvoting=True)
+    kind_of_vote = do_vote_stuff(
+        comment, thread_post=comment.thread_post(), vote_record=vote_record, user=request.user, downvoting=True
+        )
 
-    return HttpResponseRedirect(redirection_url)
+    return vote_response(request, comment.points, kind_of_vote, redirection_url)
 
 
 @login_required
 @require_POST
 def delete_comment(request, comment_id):
-    comment = get_object_or_404(Comment, pk=comment_id)
+    comment = sharding.get_or_404(Comment, comment_id)
     if comment.was_published_by(request.user.member):
         comment.delete()
         messages.add_message(
@@ -199,13 +281,17 @@ def delete_comment(request, comment_id):
 
 @login_required
 def edit_comment(request, comment_id):
-    comment = get_object_or_404(Comment, pk=comment_id)
+    comment = sharding.get_or_404(Comment, comment_id)
     if request.method == 'POST' and comment.was_published_by(request.user.member):
         new_content = request.POST.get('new_content', '').strip()
         if new_content:
             comment.content = new_content
             comment.edited = True
-            comment.save(update_fields=('content', 'edited'))
+            comment.simhash = duplicates.simhash(new_content)
+            comment.save(update_fields=('content', 'edited', 'simhash', 'last_modified'))
+            thread_post = comment.thread_post()
+            duplicates.refingerprint(comment, thread_post)
+            live.comment_edited(comment, thread_post)
 
             return HttpResponseRedirect(reverse('comments:show_comment', args=(comment.pk,)))
         else:
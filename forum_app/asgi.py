@@ -9,8 +9,27 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 
 import os
 
+from django.db import DatabaseError
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'forum_app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from forums.sse import live_updates
+
+
+async def application(scope, receive, send):
+    '''Django, but for the Server-Sent Events streams of forums.sse, which do not need a thread each'''
+    if scope['type'] == 'http' and scope['path'].startswith('/live/'):
+        return await live_updates(scope, receive, send)
+    return await django_application(scope, receive, send)
+
+# Building the forum name similarity index at startup, so the first forum creation of this process
+# does not pay for it. If the db is not ready yet it will be built on first use instead.
+from forums.name_index import forum_name_index
+
+try:
+    forum_name_index.rebuild()
+except DatabaseError:
+    pass
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path, PurePath
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -34,6 +35,8 @@ INSTALLED_APPS = [
     'comments.apps.CommentsConfig',
     'forums.apps.ForumsConfig',
     'members.apps.MembersConfig',
+    'archive.apps.ArchiveConfig',
+    'monitoring.apps.MonitoringConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -43,6 +46,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'monitoring.metrics.MetricsMiddleware',
+    'monitoring.profiling.ProfilingMiddleware',
+    'monitoring.slow_queries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,15 +60,28 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'forum_app.urls'
 
+# Production rendering profile: the cached loader keeps every compiled template (and every
+# {% include %}/inclusion tag template) in memory instead of reading and parsing it again on every
+# render. Django turns it off while DEBUG is True, set FORUM_APP_CACHED_TEMPLATES=1 to force it.
+CACHED_TEMPLATES = not DEBUG or os.environ.get('FORUM_APP_CACHED_TEMPLATES') == '1'
+
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [str( PurePath(__file__).parents[1].joinpath('templates') )],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': [
+                ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)
+            ] if CACHED_TEMPLATES else TEMPLATE_LOADERS,
             'libraries':{
                 'vote_post_form_extras': 'templatetags.vote_post_form_extras',
-                'vote_comment_form_extras' : 'templatetags.vote_comment_form_extras'
+                'vote_comment_form_extras' : 'templatetags.vote_comment_form_extras',
+                'fast_urls': 'templatetags.fast_urls'
             },
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -89,6 +108,121 @@ DATABASES = {
     }
 }
 
+# Threads nobody edited or voted in ARCHIVE_AFTER_DAYS days are moved to the archive tables by the
+# archive_threads command (see archive.archiving). By default those tables are in the default db,
+# set FORUM_APP_ARCHIVE_DB to the path of a sqlite file to keep them in their own db instead
+# (and run manage.py migrate --database archive once)
+ARCHIVE_AFTER_DAYS = 365
+
+ARCHIVE_DATABASE = 'default'
+
+if os.environ.get('FORUM_APP_ARCHIVE_DB'):
+    DATABASES['archive'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['FORUM_APP_ARCHIVE_DB'],
+    }
+    ARCHIVE_DATABASE = 'archive'
+
+# Forum content (posts, comments, votes, activity) can be spread across several databases, see
+# forums.sharding. By default the only shard is the default db. Set FORUM_APP_SHARDS to a number
+# of shards to use that many sqlite files next to db.sqlite3 (run manage.py migrate --database
+# for each of them, use export_forums/import_forums to move existing content into them and
+# rebalance_shards to move forums between them)
+FORUM_SHARDS = ['default']
+
+if int(os.environ.get('FORUM_APP_SHARDS', '0')) > 1:
+    FORUM_SHARDS = []
+    for shard_number in range(int(os.environ['FORUM_APP_SHARDS'])):
+        DATABASES[f'shard_{shard_number}'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / f'db_shard_{shard_number}.sqlite3',
+        }
+        FORUM_SHARDS.append(f'shard_{shard_number}')
+
+DATABASE_ROUTERS = ['forums.sharding.ShardRouter', 'archive.routers.ArchiveRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    # Holds the throttling counters and buckets (members.throttling). Per process by default, so
+    # every worker enforces the limits on its own: point it to a shared backend to enforce them
+    # across workers.
+    'default': {
+        'BACKEND': os.environ.get(
+            'FORUM_APP_DEFAULT_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+            ),
+        'LOCATION': os.environ.get('FORUM_APP_DEFAULT_CACHE_LOCATION', ''),
+    },
+    # Used by the {% cache %} tag. Fragments are keyed on the object's last_modified
+    # so they never go stale, old versions just get culled.
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template_fragments',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000
+        }
+    },
+    # Used by forums.forum_cache and members.profile_cache. Per process by default: changes made
+    # by another worker are seen once the entries expire (a forum created there once its "missing"
+    # entry does, after FORUM_CACHE_MISS_TIMEOUT). Point it to a shared backend to avoid that.
+    'objects': {
+        'BACKEND': os.environ.get(
+            'FORUM_APP_OBJECT_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+            ),
+        'LOCATION': os.environ.get('FORUM_APP_OBJECT_CACHE_LOCATION', 'objects'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000
+        }
+    },
+    # Used by the cached_db session profile. File based so every worker process sees the same
+    # sessions (a logout handled by one worker must not leave the session alive in another one).
+    'sessions': {
+        'BACKEND': os.environ.get(
+            'FORUM_APP_SESSION_CACHE_BACKEND', 
+            'django.core.cache.backends.filebased.FileBasedCache'
+            ),
+        'LOCATION': str(BASE_DIR / 'cache' / 'sessions'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000
+        }
+    }
+}
+
+# Seconds forums.forum_cache keeps a forum, and the names/ids that have no forum
+FORUM_CACHE_TIMEOUT = 5 * 60
+FORUM_CACHE_MISS_TIMEOUT = 60
+
+# Seconds members.profile_cache keeps the bio and recent post ids of a member
+PROFILE_CACHE_TIMEOUT = 10 * 60
+
+
+# Sessions and messages
+# https://docs.djangoproject.com/en/4.0/topics/http/sessions/#configuring-the-session-engine
+
+# With the default db engine every authenticated request reads django_session, competing with
+# votes and comments for sqlite's single writer. Set FORUM_APP_SESSION_PROFILE to choose:
+#   - 'cached_db': sessions are read from the 'sessions' cache, the db is only read on a cache miss
+#     and written when the session changes (login, logout).
+#   - 'signed_cookies': the session lives in a signed cookie, no db access at all. Sessions can not
+#     be invalidated on the server side and SECRET_KEY leaks become session forgeries.
+#   - 'db': django's default.
+SESSION_PROFILE = os.environ.get('FORUM_APP_SESSION_PROFILE', 'cached_db')
+
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_PROFILE]
+
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Messages only live in a cookie, they never overflow into the session
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -108,6 +242,104 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Sliding window limits, as (attempts, seconds), checked before hashing any password in the
+# login and singup views. See members.throttling
+AUTH_THROTTLE_RATES = {
+    'login_per_ip': (20, 60),
+    'login_per_username': (5, 60),
+    'singup_per_ip': (10, 3600),
+}
+
+# Token buckets, as (tokens, seconds), limiting the writes of every user and of every ip: bursts of
+# up to `tokens` writes go through, then one every seconds / tokens seconds. Checked before any db
+# work in the publish, reply and vote views, the buckets are kept in the default cache. See
+# members.throttling.TokenBucketThrottle
+WRITE_THROTTLE_RATES = {
+    'post_per_user': (5, 60),
+    'post_per_ip': (20, 60),
+    'comment_per_user': (20, 60),
+    'comment_per_ip': (60, 60),
+    'vote_per_user': (60, 60),
+    'vote_per_ip': (240, 60),
+}
+
+# (exports, seconds) of the personal data export (members:export_data), per member and for the
+# whole site, so heavy exports can not pile up on the db. See members.data_export
+DATA_EXPORT_THROTTLE_RATES = {
+    'data_export_per_user': (3, 24 * 3600),
+    'data_export_site_wide': (30, 60),
+}
+
+# Rows fetched from the db at a time while streaming a data export
+DATA_EXPORT_CHUNK_SIZE = 500
+
+# Size of the thread pool where the login and singup views hash passwords. See members.hashing
+PASSWORD_HASHING_WORKERS = 4
+
+# Trending forums, see forums.trending. A forum's score halves every TRENDING_HALF_LIFE seconds,
+# the renormalize_trending command has to run at least once every few days (e.g. daily from cron)
+TRENDING_HALF_LIFE = 12 * 60 * 60
+
+TRENDING_WEIGHTS = {
+    'post': 3.0,
+    'comment': 2.0,
+    'vote': 1.0,
+    'join': 2.0,
+}
+
+# Live updates of posts and comments (forums.live, forums.sse). A stream with LIVE_MAX_PENDING
+# unsent events is reset, events are sent LIVE_COALESCE_SECONDS after the first one of a burst and
+# idle streams get a keepalive every LIVE_KEEPALIVE_SECONDS
+LIVE_MAX_PENDING = 100
+LIVE_COALESCE_SECONDS = 0.5
+LIVE_KEEPALIVE_SECONDS = 15
+
+# Most posts plus comments whose scores one request to forums:bulk_points can ask for
+BULK_POINTS_MAX_IDS = 300
+
+# Comments per page of the comments of a post and of the replies of a comment, see comments.pagination
+COMMENTS_PAGE_SIZE = 50
+
+# Near-duplicate detection (forums.duplicates): a new post or comment whose SimHash is at most
+# NEAR_DUPLICATE_MAX_DISTANCE bits away from the one of something published in the
+# same forum in the last NEAR_DUPLICATE_WINDOW_HOURS is published and flagged in its Fingerprint,
+# or rejected if NEAR_DUPLICATE_ACTION is 'reject'. Texts with fewer than NEAR_DUPLICATE_MIN_WORDS
+# words that are not stop words are not checked
+NEAR_DUPLICATE_ACTION = 'flag'
+NEAR_DUPLICATE_MAX_DISTANCE = 8
+NEAR_DUPLICATE_WINDOW_HOURS = 24
+NEAR_DUPLICATE_MIN_WORDS = 8
+
+# Request profiling (monitoring.profiling): PROFILING_SAMPLE_RATE of the requests (0 to 1, off by
+# default, set FORUM_APP_PROFILING_SAMPLE_RATE) and those sending the header printed by the
+# profile_header command (valid PROFILING_TOKEN_MAX_AGE seconds) are profiled with cProfile into
+# PROFILING_DIR, keeping the PROFILING_MAX_FILES newest profiles of every URL name. The
+# PROFILING_SLOWEST slowest ones of each are listed in the admin, at monitoring:profiles
+PROFILING_SAMPLE_RATE = float(os.environ.get('FORUM_APP_PROFILING_SAMPLE_RATE', '0'))
+PROFILING_DIR = os.environ.get('FORUM_APP_PROFILING_DIR', BASE_DIR / 'profiles')
+PROFILING_MAX_FILES = 50
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+PROFILING_SLOWEST = 10
+PROFILING_SHOWN_FUNCTIONS = 60
+
+# Prometheus metrics (monitoring.metrics), served at /metrics. Every process writes its numbers
+# to its own file of METRICS_DIR (set FORUM_APP_METRICS_DIR, to a directory shared by all the
+# workers of a host) at most every METRICS_FLUSH_SECONDS, and /metrics adds them all up. Without it
+# /metrics only has the numbers of the worker that answers. Files untouched for
+# METRICS_STALE_SECONDS are deleted. Set FORUM_APP_METRICS_TOKEN to require it as a bearer token
+METRICS_DIR = os.environ.get('FORUM_APP_METRICS_DIR')
+METRICS_FLUSH_SECONDS = 10
+METRICS_STALE_SECONDS = 7 * 24 * 60 * 60
+METRICS_TOKEN = os.environ.get('FORUM_APP_METRICS_TOKEN')
+
+# Slow query log (monitoring.slow_queries): the queries of a request that take SLOW_QUERY_SECONDS
+# or more (None to turn it off) are logged as a warning, and as JSON lines to SLOW_QUERY_LOG (set
+# FORUM_APP_SLOW_QUERY_LOG), which is moved to SLOW_QUERY_LOG.1 every SLOW_QUERY_LOG_MAX_BYTES.
+# The slow_query_report command lists the query shapes that took the most time
+SLOW_QUERY_SECONDS = 0.1
+SLOW_QUERY_LOG = os.environ.get('FORUM_APP_SLOW_QUERY_LOG', BASE_DIR / 'slow_queries.log')
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.0/topics/i18n/
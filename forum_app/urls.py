@@ -16,10 +16,14 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from monitoring.views import show_metrics
+
 urlpatterns = [
+    path('admin/monitoring/', include('monitoring.urls')),  # Before the admin, that catches every admin/ url
     path('admin/', admin.site.urls),
     path('', include('members.urls')),
     path('forums/', include('forums.urls')),
-    path('comments/', include('comments.urls'))
+    path('comments/', include('comments.urls')),
+    path('metrics', show_metrics, name='metrics')
     
 ]
@@ -9,8 +9,18 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/wsgi/
 
 import os
 
+from django.db import DatabaseError
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'forum_app.settings')
 
 application = get_wsgi_application()
+
+# Building the forum name similarity index at startup, so the first forum creation of this process
+# does not pay for it. If the db is not ready yet it will be built on first use instead.
+from forums.name_index import forum_name_index
+
+try:
+    forum_name_index.rebuild()
+except DatabaseError:
+    pass
@@ -0,0 +1,176 @@
+from datetime import timedelta
+from collections import Counter, defaultdict
+
+from django.utils import timezone
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncHour
+
+from monitoring import metrics
+
+from . import sharding, trending
+from .models import Post, ActivityEvent, Activity, ForumActivity, PostActivity
+
+# Rollup field each kind of event adds to
+ROLLUP_FIELDS = {
+    ActivityEvent.POST: 'posts',
+    ActivityEvent.COMMENT: 'comments',
+    ActivityEvent.UPVOTE: 'upvotes',
+    ActivityEvent.DOWNVOTE: 'downvotes'
+}
+
+
+def record_post(post):
+    ActivityEvent.objects.using(post._state.db).create(forum_id=post.forum_id, post=post, kind=ActivityEvent.POST)
+    trending.bump(post.forum_id, 'post')
+    metrics.writes.inc('post')
+
+
+def record_comment(thread_post):
+    '''thread_post is the post at the root of the thread of the new comment, which goes up in its forum'''
+    ActivityEvent.objects.using(thread_post._state.db).create(
+        forum_id=thread_post.forum_id, post=thread_post, kind=ActivityEvent.COMMENT
+        )
+    # Not a save(): last_modified (and the cached fragments of the post) stay as they are
+    Post.objects.using(thread_post._state.db).filter(pk=thread_post.pk).update(last_comment_at=timezone.now())
+    trending.bump(thread_post.forum_id, 'comment')
+    metrics.writes.inc('comment')
+
+
+def record_vote_change(post, *, removed=None, added=None, on_comment=False):
+    '''
+    Records the outcome of a vote action on post (or on one of the comments of its thread if on_comment):
+    removed and added are the kinds of vote (Vote.UPVOTE/Vote.DOWNVOTE) the user took back and cast, if any.
+    '''
+    events = [
+        ActivityEvent(forum_id=post.forum_id, post=post, kind=kind, on_comment=on_comment, delta=delta)
+        for kind, delta in ((removed, -1), (added, 1)) if kind is not None
+    ]
+    ActivityEvent.objects.using(post._state.db).bulk_create(events)
+    if added is not None:
+        trending.bump(post.forum_id, 'vote')
+    metrics.writes.inc('vote')
+
+
+def _add_to_rollup(model, owner_field, counts, using):
+    '''
+    counts maps (owner pk, period, bucket) to a Counter of rollup field -> amount to add.
+    Existing rollup rows are fetched in one query and updated with one bulk UPDATE, the missing
+    ones are bulk created.
+    '''
+    if not counts:
+        return
+    existing = {
+        (getattr(row, f'{owner_field}_id'), row.period, row.bucket): row
+        for row in model.objects.using(using).filter(**{
+            f'{owner_field}__in': {key[0] for key in counts},
+            'bucket__in': {key[2] for key in counts}
+            })
+    }
+
+    fields = set()
+    to_create = []
+    for key, amounts in counts.items():
+        row = existing.get(key)
+        if row is None:
+            row = model(**{f'{owner_field}_id': key[0]}, period=key[1], bucket=key[2])
+            to_create.append(row)
+        for field, amount in amounts.items():
+            setattr(row, field, getattr(row, field) + amount)
+            fields.add(field)
+
+    model.objects.using(using).bulk_update([row for row in existing.values() if row.pk], fields)
+    model.objects.using(using).bulk_create(to_create)
+
+
+def compact_events(batch_size=1000):
+    '''
+    Adds the raw ActivityEvents to the hourly and daily ForumActivity/PostActivity rollups and
+    deletes them, batch_size events per transaction. Every batch is aggregated with one grouped
+    query. Returns the number of events compacted.
+
+    Only one compaction must run at a time (see the rollup_activity command).
+    '''
+    return sum(_compact_events_of(shard, batch_size) for shard in sharding.shards())
+
+
+def _compact_events_of(shard, batch_size):
+    compacted = 0
+    while True:
+        with transaction.atomic(using=shard):
+            pks = list(ActivityEvent.objects.using(shard).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            events = ActivityEvent.objects.using(shard).filter(pk__gte=pks[0], pk__lte=pks[-1])
+
+            forum_counts = defaultdict(Counter)
+            post_counts = defaultdict(Counter)
+            groups = (
+                events.order_by()
+                .values('forum_id', 'post_id', 'kind', 'on_comment', hour=TruncHour('created_at'))
+                .annotate(total=Sum('delta'))
+                )
+            for group in groups:
+                field = ROLLUP_FIELDS[group['kind']]
+                hour = group['hour']
+                for period, bucket in ((Activity.HOURLY, hour), (Activity.DAILY, hour.replace(hour=0))):
+                    forum_counts[(group['forum_id'], period, bucket)][field] += group['total']
+                    # A post rollup counts the comments of its thread and its own votes
+                    if group['kind'] == ActivityEvent.COMMENT or (field in ('upvotes', 'downvotes') and not group['on_comment']):
+                        post_counts[(group['post_id'], period, bucket)][field] += group['total']
+
+            _add_to_rollup(ForumActivity, 'forum', forum_counts, shard)
+            _add_to_rollup(PostActivity, 'post', post_counts, shard)
+            events.delete()
+            compacted += len(pks)
+    return compacted
+
+
+def top_posts(days=None, limit=10):
+    '''
+    The posts with the best score (upvotes - downvotes) cast in the last `days` days, or of all time
+    if days is None. Each post gets the score of the period as .score. Votes that have not been
+    compacted yet are not counted.
+    '''
+    if days is None:
+        posts = sharding.gather(Post.objects.all(), order_by=('-points', '-pk'), limit=limit)
+        for post in posts:
+            post.score = post.points
+        return posts
+
+    since = timezone.now() - timedelta(days=days)
+    if days <= 2:
+        period = Activity.HOURLY
+        since = since.replace(minute=0, second=0, microsecond=0)
+    else:
+        period = Activity.DAILY
+        since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    scores = []  # (score, post pk, shard) of the top posts of every shard
+    for shard in sharding.shards():
+        rows = (
+            PostActivity.objects.using(shard).filter(period=period, bucket__gte=since)
+            .values('post')
+            .annotate(score=Sum('upvotes') - Sum('downvotes'))
+            .order_by('-score', '-post')[:limit]
+            )
+        scores.extend((row['score'], row['post'], shard) for row in rows)
+    scores = sorted(scores, reverse=True)[:limit]
+
+    posts = {}
+    for shard in sharding.shards():
+        posts.update(Post.objects.using(shard).in_bulk([pk for _, pk, post_shard in scores if post_shard == shard]))
+    top = []
+    for score, pk, _ in scores:
+        post = posts[pk]
+        post.score = score
+        top.append(post)
+    return top
+
+
+def forum_activity(forum, period=Activity.HOURLY, since=None):
+    '''The rollup rows of forum for the given period, oldest first, ready to be charted'''
+    rows = ForumActivity.objects.using(sharding.shard_of(forum)).filter(forum=forum, period=period)
+    if since is not None:
+        rows = rows.filter(bucket__gte=since)
+    return rows.order_by('bucket')
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Forum, Post
+from .models import Forum, Post, Fingerprint
 
 admin.site.register(Forum)
-admin.site.register(Post)
\ No newline at end of file
+admin.site.register(Post)
+admin.site.register(Fingerprint)
\ No newline at end of file
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ForumsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'forums'
+
+    def ready(self):
+        from . import signals  # Connecting the signal receivers
+        from .sharding import seed_id_blocks
+        post_migrate.connect(seed_id_blocks, sender=self)
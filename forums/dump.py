@@ -0,0 +1,86 @@
+'''
+JSONL dumps of forums, written by manage.py export_forums and read by manage.py import_forums.
+
+Every line is a json object with a "type" key. A dump is a sequence of forum sections, every
+section starts with its "forum" record and holds everything that belongs to the forum:
+
+    forum         id, name, description, owner, creation_date
+    forum_member  forum, member
+    post          id, forum, poster, title, content, points, edited, pub_date, last_modified
+    post_vote     post, user, kind_of_vote, voted_at
+    comment       id, post, in_reply_to, commenter, content, points, edited, pub_date, last_modified
+    comment_vote  comment, user, kind_of_vote, voted_at
+
+Users are referenced by username and everything else by its id in the exporting db. A record
+always comes after the records it references (a reply after the comment it replies to), so an
+importer only has to remember the ids of the current section.
+'''
+import json
+from itertools import groupby
+from contextlib import contextmanager
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+FORUM = 'forum'
+FORUM_MEMBER = 'forum_member'
+POST = 'post'
+POST_VOTE = 'post_vote'
+COMMENT = 'comment'
+COMMENT_VOTE = 'comment_vote'
+
+
+def dump_record(record_type, **fields):
+    '''The line (newline included) of a record. Dates are written in iso format'''
+    return json.dumps({'type': record_type, **fields}, default=lambda value: value.isoformat()) + '\n'
+
+
+def load_records(lines):
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def forum_sections(records):
+    '''
+    Splits a stream of records into forum sections (iterators whose first record is the forum),
+    lazily, so only one record is in memory at a time
+    '''
+    section = 0
+
+    def section_of(record):
+        nonlocal section
+        if record['type'] == FORUM:
+            section += 1
+        return section
+
+    for _, section_records in groupby(records, section_of):
+        yield section_records
+
+
+def to_datetime(value):
+    return parse_datetime(value) if value else timezone.now()
+
+
+def to_date(value):
+    return parse_date(value) if value else timezone.now().date()
+
+
+@contextmanager
+def preserved_timestamps(*models):
+    '''
+    Turns off the auto_now and auto_now_add fields of models for the duration of the block, so the
+    timestamps read from a dump are saved as they are instead of being replaced by the current time
+    '''
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    flags = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in flags:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
@@ -0,0 +1,149 @@
+'''
+Near-duplicate detection for posts and comments, against spam and copy-paste floods.
+
+Every post and comment gets a 64-bit SimHash of its content (Post.simhash, Comment.simhash): each
+word is hashed, and bit i of the SimHash is the majority vote of bit i of those hashes. Case and
+punctuation are ignored, and texts that share most of their words get SimHashes a few bits apart,
+so "near duplicate" means a Hamming distance of at most settings.NEAR_DUPLICATE_MAX_DISTANCE.
+Posts and comments are short, so words are used alone: hashing pairs of words too would make a
+one word edit change three features out of a few dozens, too many to be seen as a near duplicate.
+STOP_WORDS, numbers and single letters are left out: they are in almost every text, so with them
+two short replies that only differ in the word that matters ("the same problem with my laptop"
+and "... with my phone") were a few bits apart.
+
+Looking for such a SimHash is an LSH lookup: the recent SimHashes of every forum are kept in the
+Fingerprint table split in BANDS bands of 8 bits, one indexed column per band. The candidates are
+the rows sharing at least one band (about BANDS / 256 of the recent ones of the forum), a few index
+range scans, and the exact distance is checked on them. SimHashes at a distance < BANDS always
+share a band; further apart they share one with a high probability (about 0.9 at 10 bits), so a
+few of the near duplicates at the largest distances are missed.
+
+On real English text (benchmarks/bench_near_duplicates.py), with the default distance of 8 about
+3 out of 4 one word edits are found, while two texts sharing less than half of their words match
+once every couple hundred thousand pairs: enough to flag copies for the moderators, which is the
+default action, not to reject them without a look.
+
+Texts with fewer than settings.NEAR_DUPLICATE_MIN_WORDS words that are not STOP_WORDS ("thanks!",
+"+1", "does anyone know how to fix this error in java") are not checked nor fingerprinted: there
+are not enough of them to tell a copy from a reply on the same subject.
+'''
+import re
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .models import Fingerprint
+
+BANDS = 8
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+WORD = re.compile(r'\w+')
+
+# The candidates of a lookup, one range scan of the index of every band. Written by hand because
+# building the equivalent queryset (an OR of BANDS filters) takes longer than running it
+CANDIDATES_SQL = ' UNION ALL '.join(
+    f'SELECT id, simhash FROM {Fingerprint._meta.db_table} WHERE forum_id = %s AND band{band} = %s AND created_at >= %s'
+    for band in range(BANDS)
+    )
+
+
+# Words found in most texts, whatever they are about
+STOP_WORDS = frozenset('''
+    a about above after again against all also am an and any anybody anyone anything are as at be
+    because been before being below between both but by can could did do does doing down during each
+    few for from further get got had has have having he her here hers herself him himself his how i
+    if in into is it its itself just know like me more most much my myself need no nor not now of off
+    ok okay on once one only or other our ours ourselves out over own please really same she should
+    so some someone something such than thank thanks that the their theirs them themselves then there
+    these they thing things this those through to too under until up use very want was way we well
+    were what when where which while who whom why will with would you your yours yourself yourselves
+'''.split())
+
+
+def features(text):
+    return [word for word in WORD.findall(text.lower()) if len(word) > 1 and not word.isdigit() and word not in STOP_WORDS]
+
+
+def simhash(text):
+    '''The SimHash of text, as a signed 64-bit integer (what a BigIntegerField holds)'''
+    counts = [0] * 64
+    for feature in features(text):
+        value = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'big')
+        for bit in range(64):
+            counts[bit] += 1 if value >> bit & 1 else -1
+    value = sum(1 << bit for bit in range(64) if counts[bit] > 0)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def bands(value):
+    '''The BANDS bands of the SimHash value, as non negative integers'''
+    value &= (1 << 64) - 1
+    return [value >> (band * BAND_BITS) & BAND_MASK for band in range(BANDS)]
+
+
+def distance(first, second):
+    '''Hamming distance between two SimHashes'''
+    return bin((first ^ second) & ((1 << 64) - 1)).count('1')
+
+
+def is_checked(text):
+    return len(features(text)) >= settings.NEAR_DUPLICATE_MIN_WORDS
+
+
+def find_near_duplicate(value, forum_id, using):
+    '''
+    The Fingerprint of a post or comment of the forum (in its shard, using), published in the last
+    NEAR_DUPLICATE_WINDOW_HOURS, whose SimHash is near value. None if there is not any
+    '''
+    since = timezone.now() - timedelta(hours=settings.NEAR_DUPLICATE_WINDOW_HOURS)
+    since = connections[using].ops.adapt_datetimefield_value(since)
+    with connections[using].cursor() as cursor:
+        cursor.execute(CANDIDATES_SQL, [
+            param for band_value in bands(value) for param in (forum_id, band_value, since)
+            ])
+        for pk, candidate in cursor.fetchall():
+            if distance(candidate, value) <= settings.NEAR_DUPLICATE_MAX_DISTANCE:
+                return Fingerprint.objects.using(using).get(pk=pk)
+    return None
+
+
+def check(text, forum_id, using):
+    '''The (SimHash, near duplicate Fingerprint or None) of text, about to be published in the forum'''
+    value = simhash(text)
+    if not is_checked(text):
+        return value, None
+    return value, find_near_duplicate(value, forum_id, using)
+
+
+def rejects(duplicate):
+    '''True if content with that near duplicate Fingerprint (or None) can not be published'''
+    return duplicate is not None and settings.NEAR_DUPLICATE_ACTION == 'reject'
+
+
+def fingerprint(obj, thread_post, *, near_duplicate=False):
+    '''
+    Saves the Fingerprint of obj (a post or comment whose simhash is set), flagged when it is a
+    near duplicate that was let through (settings.NEAR_DUPLICATE_ACTION = 'flag')
+    '''
+    if not is_checked(obj.content):
+        return None
+    comment = obj if thread_post is not obj else None
+    return Fingerprint.objects.using(thread_post._state.db).create(
+        forum_id=thread_post.forum_id,
+        post=thread_post,
+        comment=comment,
+        simhash=obj.simhash,
+        near_duplicate=near_duplicate,
+        **{f'band{band}': band_value for band, band_value in enumerate(bands(obj.simhash))}
+        )
+
+
+def refingerprint(obj, thread_post):
+    '''Replaces the Fingerprint of obj once its edited content and simhash were saved'''
+    comment = obj if thread_post is not obj else None
+    Fingerprint.objects.using(thread_post._state.db).filter(post=thread_post, comment=comment).delete()
+    fingerprint(obj, thread_post)
@@ -0,0 +1,76 @@
+'''
+Read-through cache of Forum rows, by name and by id, in the 'objects' cache.
+
+A miss reads the row from the db and caches it for settings.FORUM_CACHE_TIMEOUT seconds. Names
+and ids of forums that do not exist are cached too, for the shorter FORUM_CACHE_MISS_TIMEOUT, so
+requests for made up forum names (crawlers, typos) do not reach the db every time either.
+
+The entries of a forum are deleted when it is saved or deleted (see forums.signals) and when
+its shard changes (rebalance_shards). Forum.trending_score and last_activity_at are updated
+without saving the forum, so they are not fresh in cached forums: the pages sorted by them read
+the forums from the db.
+'''
+import hashlib
+
+from django.conf import settings
+from django.http import Http404
+from django.db import transaction
+from django.core.cache import caches
+
+from monitoring import metrics
+from .models import Forum
+
+# Cached instead of a Forum for the names and ids that have no forum
+MISSING = 'missing'
+
+
+def cache():
+    return caches['objects']
+
+
+def name_key(name):
+    # Hashing the name because forum names can contain characters that are not valid in cache keys
+    return f'forum:name:{hashlib.md5(name.encode()).hexdigest()}'
+
+
+def id_key(pk):
+    return f'forum:id:{pk}'
+
+
+def _read_through(key, lookup):
+    forum = cache().get(key)
+    metrics.cache_lookups.inc('forum', 'miss' if forum is None else 'hit')
+    if forum is None:
+        forum = Forum.objects.filter(**lookup).first()
+        if forum is None:
+            cache().set(key, MISSING, settings.FORUM_CACHE_MISS_TIMEOUT)
+        else:
+            cache().set_many({name_key(forum.name): forum, id_key(forum.pk): forum}, settings.FORUM_CACHE_TIMEOUT)
+    return forum if isinstance(forum, Forum) else None
+
+
+def get_forum_by_name(name):
+    '''The forum named name, None if there is no such forum'''
+    return _read_through(name_key(name), {'name': name})
+
+
+def get_forum(pk):
+    '''The forum with that pk, None if there is no such forum'''
+    return _read_through(id_key(pk), {'pk': pk})
+
+
+def get_forum_by_name_or_404(name):
+    forum = get_forum_by_name(name)
+    if forum is None:
+        raise Http404('No Forum matches the given query.')
+    return forum
+
+
+def invalidate(forum):
+    '''
+    Deletes the entries of forum. Once now, so the rest of the transaction sees the change, and
+    again on commit, in case another request cached the old row before the commit
+    '''
+    keys = [name_key(forum.name), id_key(forum.pk)]
+    cache().delete_many(keys)
+    transaction.on_commit(lambda: cache().delete_many(keys))
@@ -0,0 +1,148 @@
+'''
+In-process pub/sub hub for the live updates of posts and comments, streamed to the readers of a
+thread as Server-Sent Events by forums.sse.
+
+The write paths (new comments, edits, votes) publish events to topics, "post:<pk>" for a thread
+and "comment:<pk>" for a comment and its replies, once their transaction commits. Every open
+stream holds a Subscription, a small buffer owned by the event loop of the stream:
+
+- Publishing never blocks the writer: events are handed to the loop with call_soon_threadsafe.
+- Point changes of the same post/comment replace each other while they wait in the buffer, so a
+  burst of votes is sent as its last value.
+- A buffer that reaches settings.LIVE_MAX_PENDING events (a reader that does not keep up) is
+  dropped: its stream sends a "reset" event and closes, and the page reloads.
+
+Only the streams connected to this process see the events published in it: with several
+worker processes, a reader only gets the changes written through the worker holding its stream.
+'''
+import asyncio
+import itertools
+import threading
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+
+def post_topic(pk):
+    return f'post:{pk}'
+
+
+def comment_topic(pk):
+    return f'comment:{pk}'
+
+
+class Subscription:
+    '''The pending events of one stream. Everything but the constructor runs in the loop of the stream'''
+    def __init__(self, topics, loop):
+        self.topics = topics
+        self.loop = loop
+        self.pending = OrderedDict()  # coalescing key -> (kind, data)
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def put(self, key, kind, data):
+        if self.overflowed:
+            return
+        if key not in self.pending and len(self.pending) >= settings.LIVE_MAX_PENDING:
+            self.overflowed = True
+            self.pending.clear()
+        else:
+            self.pending[key] = (kind, data)
+        self.ready.set()
+
+    def take(self):
+        '''The pending events, in order, emptying the buffer'''
+        events = list(self.pending.values())
+        self.pending.clear()
+        self.ready.clear()
+        return events
+
+
+class Hub:
+    def __init__(self):
+        self._subscriptions = defaultdict(set)  # topic -> subscriptions
+        self._lock = threading.Lock()  # Publishers run in the threads of the sync views
+        self._sequence = itertools.count()
+
+    def subscribe(self, *topics):
+        '''Called from the loop of the stream'''
+        subscription = Subscription(topics, asyncio.get_running_loop())
+        with self._lock:
+            for topic in topics:
+                self._subscriptions[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscriptions[topic].discard(subscription)
+                if not self._subscriptions[topic]:
+                    del self._subscriptions[topic]
+
+    def subscribers(self, topic):
+        with self._lock:
+            return len(self._subscriptions.get(topic, ()))
+
+    def publish(self, topics, kind, data, coalesce=None):
+        '''
+        Sends the event (kind, data) to the subscribers of topics. Events with the same coalesce key
+        replace each other until they are sent, the others are all sent
+        '''
+        key = coalesce if coalesce is not None else next(self._sequence)
+        with self._lock:
+            subscriptions = set().union(*(self._subscriptions.get(topic, ()) for topic in topics))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, key, kind, data)
+            except RuntimeError:  # The loop of the stream was closed
+                self.unsubscribe(subscription)
+
+    def publish_on_commit(self, topics, kind, data, *, using, coalesce=None):
+        transaction.on_commit(lambda: self.publish(topics, kind, data, coalesce), using=using)
+
+
+hub = Hub()
+
+
+def thread_topics(comment, thread_post):
+    '''Where a change of comment is seen: its thread, itself and the comment it replies to'''
+    topics = [post_topic(thread_post.pk), comment_topic(comment.pk)]
+    if comment.in_reply_to_id is not None:
+        topics.append(comment_topic(comment.in_reply_to_id))
+    return topics
+
+
+def comment_added(comment, thread_post):
+    hub.publish_on_commit(thread_topics(comment, thread_post), 'comment', {
+        'id': comment.pk,
+        'post': comment.post_id,
+        'in_reply_to': comment.in_reply_to_id,
+        'commenter': comment.commenter.user.username,
+        'content': comment.content,
+    }, using=comment._state.db)
+
+
+def comment_edited(comment, thread_post):
+    hub.publish_on_commit(
+        thread_topics(comment, thread_post), 'edit', {'comment': comment.pk, 'content': comment.content},
+        using=comment._state.db
+        )
+
+
+def post_edited(post):
+    hub.publish_on_commit(
+        [post_topic(post.pk)], 'edit', {'post': post.pk, 'content': post.content}, using=post._state.db
+        )
+
+
+def points_changed(obj, thread_post=None):
+    '''obj is a post, or a comment of the thread of thread_post'''
+    if thread_post is None:
+        topics, kind = [post_topic(obj.pk)], 'post'
+    else:
+        topics, kind = thread_topics(obj, thread_post), 'comment'
+    hub.publish_on_commit(
+        topics, 'points', {kind: obj.pk, 'points': obj.points},
+        using=obj._state.db, coalesce=('points', kind, obj.pk)
+        )
@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.db import transaction
+from django.core.management.base import BaseCommand
+
+from forums import dump, duplicates, sharding
+from forums.models import Post, Fingerprint
+from comments.models import Comment
+
+
+class Command(BaseCommand):
+    help = (
+        'Computes the SimHash of the posts and comments that do not have one yet, fingerprinting the ones '
+        'published in the last NEAR_DUPLICATE_WINDOW_HOURS, and deletes the fingerprints older than that '
+        '(except the flagged ones). Safe to run again, and from cron to keep the lookup table small.'
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows updated per transaction')
+
+    def handle(self, *args, chunk_size, **options):
+        since = timezone.now() - timedelta(hours=settings.NEAR_DUPLICATE_WINDOW_HOURS)
+        for shard in sharding.shards():
+            posts = self.backfill(Post, self.post_threads(shard), shard, since, chunk_size)
+            comments = self.backfill(Comment, self.comment_threads(shard), shard, since, chunk_size)
+            pruned, _ = Fingerprint.objects.using(shard).filter(created_at__lt=since, near_duplicate=False).delete()
+            label = '' if len(sharding.shards()) == 1 else f' ({shard})'
+            self.stdout.write(f'{posts} posts and {comments} comments fingerprinted, {pruned} old fingerprints deleted{label}')
+
+    def post_threads(self, using):
+        '''{post pk: (post pk, forum pk)}'''
+        return {pk: (pk, forum_id) for pk, forum_id in Post.objects.using(using).values_list('pk', 'forum_id')}
+
+    def comment_threads(self, using):
+        '''{comment pk: (pk of the post of its thread, forum pk)}, walking the threads one level of nesting at a time'''
+        forum_of = dict(Post.objects.using(using).values_list('pk', 'forum_id'))
+        threads = {}
+        level = Comment.objects.using(using).filter(post__isnull=False)
+        while True:
+            rows = list(level.values_list('pk', 'post_id', 'in_reply_to_id'))
+            if not rows:
+                return threads
+            for pk, post_id, in_reply_to_id in rows:
+                threads[pk] = (post_id, forum_of[post_id]) if post_id is not None else threads[in_reply_to_id]
+            level = Comment.objects.using(using).filter(in_reply_to_id__in=[row[0] for row in rows])
+
+    def backfill(self, model, threads, using, since, chunk_size):
+        count = 0
+        pending = model.objects.using(using).filter(simhash__isnull=True).order_by('pk')
+        while True:
+            chunk = list(pending.only('pk', 'content', 'pub_date')[:chunk_size])
+            if not chunk:
+                return count
+            fingerprints = []
+            for obj in chunk:
+                obj.simhash = duplicates.simhash(obj.content)
+                post_pk, forum_pk = threads.get(obj.pk, (None, None))  # None if published after threads was read
+                if post_pk is not None and obj.pub_date >= since and duplicates.is_checked(obj.content):
+                    fingerprints.append(Fingerprint(
+                        forum_id=forum_pk,
+                        post_id=post_pk,
+                        comment_id=obj.pk if model is Comment else None,
+                        simhash=obj.simhash,
+                        created_at=obj.pub_date,
+                        **{f'band{band}': value for band, value in enumerate(duplicates.bands(obj.simhash))}
+                        ))
+            with transaction.atomic(using=using), dump.preserved_timestamps(Fingerprint):
+                model.objects.using(using).bulk_update(chunk, ['simhash'])
+                Fingerprint.objects.using(using).bulk_create(fingerprints)
+            count += len(chunk)
@@ -0,0 +1,126 @@
+import os
+
+from django.utils.text import slugify
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from forums import dump, sharding
+from forums.models import Forum, Post, PostVote
+from comments.models import Comment, CommentVote
+
+
+class Command(BaseCommand):
+    help = (
+        'Writes forums, with their members, posts, comments and votes, as a JSONL dump that '
+        'import_forums can load. Rows are read in chunks and written as they come, so memory use '
+        'does not grow with the size of the dump.'
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('forums', nargs='*', metavar='forum', help='Names of the forums to export (all by default)')
+        parser.add_argument('-o', '--output', help='File to write the dump to (stdout by default)')
+        parser.add_argument(
+            '--split-dir',
+            help='Write one dump per forum in this directory instead, so they can be imported in parallel'
+            )
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the db at a time')
+
+    def handle(self, *args, forums, output, split_dir, chunk_size, **options):
+        if output and split_dir:
+            raise CommandError('--output and --split-dir can not be used together')
+        self.chunk_size = chunk_size
+
+        forum_pks = Forum.objects.order_by('pk')
+        if forums:
+            forum_pks = forum_pks.filter(name__in=forums)
+        forum_pks = list(forum_pks.values_list('pk', flat=True))
+
+        if split_dir:
+            os.makedirs(split_dir, exist_ok=True)
+            for forum_pk in forum_pks:
+                name = Forum.objects.values_list('name', flat=True).get(pk=forum_pk)
+                with open(os.path.join(split_dir, f'{forum_pk}-{slugify(name)}.jsonl'), 'w', encoding='utf-8') as out:
+                    self.export_forum(forum_pk, out)
+        elif output:
+            with open(output, 'w', encoding='utf-8') as out:
+                for forum_pk in forum_pks:
+                    self.export_forum(forum_pk, out)
+        else:
+            for forum_pk in forum_pks:
+                self.export_forum(forum_pk, self.stdout)  # Lines already end with \n, nothing is added
+
+        if output or split_dir:
+            self.stdout.write(f'Exported {len(forum_pks)} forums to {output or split_dir}')
+
+    def rows(self, queryset, *fields):
+        return queryset.order_by('pk').values(*fields).iterator(chunk_size=self.chunk_size)
+
+    def username(self, user_pk):
+        '''Users are in the primary db, not in the shard of the content, so they can not be joined'''
+        if user_pk not in self.usernames:
+            self.usernames[user_pk] = User.objects.values_list('username', flat=True).get(pk=user_pk)
+        return self.usernames[user_pk]
+
+    def export_forum(self, forum_pk, out):
+        self.usernames = {}  # user pk -> username, only for the current forum
+        shard = sharding.shard_of_forum_id(forum_pk)
+        forum = Forum.objects.values('pk', 'name', 'description', 'creation_date', 'last_activity_at', 'owner__username').get(pk=forum_pk)
+        out.write(dump.dump_record(
+            dump.FORUM,
+            id=forum['pk'], name=forum['name'], description=forum['description'],
+            owner=forum['owner__username'], creation_date=forum['creation_date'],
+            last_activity_at=forum['last_activity_at']
+            ))
+
+        for row in self.rows(Forum.members.through.objects.filter(forum_id=forum_pk), 'member__user__username'):
+            out.write(dump.dump_record(dump.FORUM_MEMBER, forum=forum_pk, member=row['member__user__username']))
+
+        posts = Post.objects.using(shard).filter(forum_id=forum_pk)
+        post_fields = (
+            'pk', 'poster_id', 'title', 'content', 'points', 'edited', 'pub_date', 'last_modified', 'last_comment_at'
+            )
+        for row in self.rows(posts, *post_fields):
+            out.write(dump.dump_record(
+                dump.POST,
+                id=row['pk'], forum=forum_pk, poster=self.username(row['poster_id']), title=row['title'],
+                content=row['content'], points=row['points'], edited=row['edited'],
+                pub_date=row['pub_date'], last_modified=row['last_modified'], last_comment_at=row['last_comment_at']
+                ))
+
+        post_votes = PostVote.objects.using(shard).filter(post__forum_id=forum_pk)
+        for row in self.rows(post_votes, 'post_id', 'user_id', 'kind_of_vote', 'voted_at'):
+            out.write(dump.dump_record(
+                dump.POST_VOTE,
+                post=row['post_id'], user=self.username(row['user_id']),
+                kind_of_vote=row['kind_of_vote'], voted_at=row['voted_at']
+                ))
+
+        # Replies only point to their parent comment, so the threads are walked one level of
+        # nesting at a time, which also writes every comment after the one it replies to
+        level = Comment.objects.using(shard).filter(post__forum_id=forum_pk)
+        comment_fields = (
+            'pk', 'post_id', 'in_reply_to_id', 'commenter_id',
+            'content', 'points', 'edited', 'pub_date', 'last_modified'
+            )
+        while True:
+            exported = 0
+            for row in self.rows(level, *comment_fields):
+                out.write(dump.dump_record(
+                    dump.COMMENT,
+                    id=row['pk'], post=row['post_id'], in_reply_to=row['in_reply_to_id'],
+                    commenter=self.username(row['commenter_id']), content=row['content'], points=row['points'],
+                    edited=row['edited'], pub_date=row['pub_date'], last_modified=row['last_modified']
+                    ))
+                exported += 1
+            if not exported:
+                break
+
+            votes = CommentVote.objects.using(shard).filter(comment__in=level.values('pk'))
+            for row in self.rows(votes, 'comment_id', 'user_id', 'kind_of_vote', 'voted_at'):
+                out.write(dump.dump_record(
+                    dump.COMMENT_VOTE,
+                    comment=row['comment_id'], user=self.username(row['user_id']),
+                    kind_of_vote=row['kind_of_vote'], voted_at=row['voted_at']
+                    ))
+
+            level = Comment.objects.using(shard).filter(in_reply_to__in=level.values('pk'))
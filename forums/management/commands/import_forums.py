@@ -0,0 +1,277 @@
+import sys
+import threading
+from collections import Counter
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections, transaction
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from forums import dump, sharding
+from members.models import Member
+from forums.models import Forum, Post, PostVote, TooSimilarNameException
+from comments.models import Comment, CommentVote
+
+
+class ForumImporter:
+    '''
+    Loads the forum sections of a dump, each one in its own transaction.
+
+    Posts and comments are buffered and saved with bulk_create, batch_size at a time. The ids
+    they had in the exporting db are mapped to the new ones in a remap table that only lives
+    for the current section, so memory use is bounded by the biggest forum, not by the dump.
+    When a record references a post/comment that is still in the buffer (a reply to a comment
+    of the same batch), the buffer is saved first to know its new id.
+
+    Votes are saved ignoring conflicts, so a dump with repeated votes can not break the
+    one vote per user constraints. Users that do not exist are created, with an unusable password.
+
+    write_locks (see Command.write_locks) are held around the sections by the importers of
+    parallel jobs, so only one of them writes to a database that only takes one writer at a time.
+    '''
+    def __init__(self, batch_size, log, write_locks=None):
+        self.batch_size = batch_size
+        self.log = log
+        self.write_locks = write_locks or {}
+        self.stats = Counter()
+        self.user_ids = {}  # username -> user id, shared by all the sections
+        self.section_user_ids = {}  # The ones looked up by the current section, until it is committed
+        self.section_stats = Counter()  # Users created by the current section, until it is committed
+
+    def import_records(self, records):
+        for section in dump.forum_sections(records):
+            forum_record = next(section)
+            if forum_record['type'] != dump.FORUM:
+                raise CommandError(f'Expected a forum record, found a "{forum_record["type"]}" one')
+            self.section_user_ids, self.section_stats = {}, Counter()
+            try:
+                # The primary database first and then the shard in every thread, so two threads never
+                # wait for each other. They can be the same database, the locks are reentrant
+                with self.locked(sharding.PRIMARY):
+                    shard = self.shard_for(forum_record)
+                    with self.locked(shard), transaction.atomic(), transaction.atomic(using=shard):
+                        self.import_forum(forum_record, section)
+            except TooSimilarNameException as e:
+                # The users created by the section were rolled back with it
+                self.stats['skipped forums'] += 1
+                self.log(f'Skipped forum "{forum_record["name"]}": {e}')
+            else:
+                self.user_ids.update(self.section_user_ids)
+                self.stats.update(self.section_stats)
+        return self.stats
+
+    def locked(self, alias):
+        '''Context manager holding the write lock of the database of alias, if it has one'''
+        return self.write_locks.get(str(connections[alias].settings_dict['NAME'])) or nullcontext()
+
+    def shard_for(self, forum_record):
+        '''Picks the shard of the forum before creating it, so its content can be saved in the same transaction'''
+        self.shard = sharding.pick_shard()
+        return self.shard
+
+    def import_forum(self, forum_record, records):
+        forum = Forum(
+            shard=self.shard,
+            owner_id=self.user_id(forum_record['owner']),
+            name=forum_record['name'],
+            description=forum_record['description'],
+            creation_date=dump.to_date(forum_record.get('creation_date')),
+            last_activity_at=dump.to_datetime(forum_record.get('last_activity_at'))
+            )
+        forum.save()  # Not bulk, so the name is checked against the similar ones
+        self.stats[dump.FORUM] += 1
+
+        self.remap = {dump.POST: {}, dump.COMMENT: {}}
+        self.pending = {dump.POST: {}, dump.COMMENT: {}}  # old id -> unsaved object
+        self.pending_rows = {dump.FORUM_MEMBER: [], dump.POST_VOTE: [], dump.COMMENT_VOTE: []}
+
+        for record in records:
+            handler = getattr(self, f'add_{record["type"]}', None)
+            if handler is None:
+                raise CommandError(f'Unknown record type "{record["type"]}"')
+            handler(forum, record)
+
+        for record_type in (*self.pending, *self.pending_rows):
+            self.flush(record_type)
+
+    def user_id(self, username):
+        '''
+        Id of the user, created if it does not exist. Ids found by a section are only shared with the
+        following ones once it is committed, a rolled back section can take its new users with it
+        '''
+        if username in self.user_ids:
+            return self.user_ids[username]
+        if username not in self.section_user_ids:
+            user, created = User.objects.get_or_create(username=username)
+            if created:
+                user.set_unusable_password()
+                user.save(update_fields=['password'])
+                Member.objects.create(user=user)
+                self.section_stats['created users'] += 1
+            self.section_user_ids[username] = user.pk
+        return self.section_user_ids[username]
+
+    def resolve(self, record_type, old_id):
+        '''New id of the post/comment that had old_id in the exporting db, None if it is not in the section'''
+        if old_id not in self.remap[record_type] and old_id in self.pending[record_type]:
+            self.flush(record_type)
+        return self.remap[record_type].get(old_id)
+
+    def add_pending(self, record_type, old_id, obj):
+        self.pending[record_type][old_id] = obj
+        if len(self.pending[record_type]) >= self.batch_size:
+            self.flush(record_type)
+
+    def add_pending_row(self, record_type, obj):
+        self.pending_rows[record_type].append(obj)
+        if len(self.pending_rows[record_type]) >= self.batch_size:
+            self.flush(record_type)
+
+    def flush(self, record_type):
+        if record_type in self.pending:
+            pending = self.pending[record_type]
+            model = Post if record_type == dump.POST else Comment
+            model.objects.using(self.shard).bulk_create(pending.values())  # Sets the new pks on the objects
+            self.remap[record_type].update((old_id, obj.pk) for old_id, obj in pending.items())
+            self.stats[record_type] += len(pending)
+            self.pending[record_type] = {}
+        else:
+            rows = self.pending_rows[record_type]
+            model = {
+                dump.FORUM_MEMBER: Forum.members.through,
+                dump.POST_VOTE: PostVote,
+                dump.COMMENT_VOTE: CommentVote
+            }[record_type]
+            using = sharding.PRIMARY if record_type == dump.FORUM_MEMBER else self.shard
+            model.objects.using(using).bulk_create(rows, ignore_conflicts=True)
+            self.stats[record_type] += len(rows)
+            self.pending_rows[record_type] = []
+
+    def orphan(self, record):
+        self.stats['orphan records'] += 1
+        self.log(f'Skipped a {record["type"]} record that references something out of its forum: {record}', verbosity=2)
+
+    def add_forum_member(self, forum, record):
+        self.add_pending_row(
+            dump.FORUM_MEMBER,
+            Forum.members.through(forum_id=forum.pk, member_id=self.user_id(record['member']))
+            )
+
+    def add_post(self, forum, record):
+        self.add_pending(dump.POST, record['id'], Post(
+            forum=forum,
+            poster_id=self.user_id(record['poster']),
+            title=record['title'],
+            content=record['content'],
+            points=record.get('points', 0),
+            edited=record.get('edited', False),
+            pub_date=dump.to_datetime(record.get('pub_date')),
+            last_modified=dump.to_datetime(record.get('last_modified')),
+            last_comment_at=dump.to_datetime(record.get('last_comment_at') or record.get('pub_date'))
+            ))
+
+    def add_post_vote(self, forum, record):
+        post_id = self.resolve(dump.POST, record['post'])
+        if post_id is None:
+            return self.orphan(record)
+        self.add_pending_row(dump.POST_VOTE, PostVote(
+            post_id=post_id,
+            user_id=self.user_id(record['user']),
+            kind_of_vote=record['kind_of_vote'],
+            voted_at=dump.to_datetime(record.get('voted_at'))
+            ))
+
+    def add_comment(self, forum, record):
+        post_id = in_reply_to_id = None
+        if record.get('post') is not None:
+            post_id = self.resolve(dump.POST, record['post'])
+        elif record.get('in_reply_to') is not None:
+            in_reply_to_id = self.resolve(dump.COMMENT, record['in_reply_to'])
+        if post_id is None and in_reply_to_id is None:
+            return self.orphan(record)
+
+        self.add_pending(dump.COMMENT, record['id'], Comment(
+            post_id=post_id,
+            in_reply_to_id=in_reply_to_id,
+            commenter_id=self.user_id(record['commenter']),
+            content=record['content'],
+            points=record.get('points', 0),
+            edited=record.get('edited', False),
+            pub_date=dump.to_datetime(record.get('pub_date')),
+            last_modified=dump.to_datetime(record.get('last_modified'))
+            ))
+
+    def add_comment_vote(self, forum, record):
+        comment_id = self.resolve(dump.COMMENT, record['comment'])
+        if comment_id is None:
+            return self.orphan(record)
+        self.add_pending_row(dump.COMMENT_VOTE, CommentVote(
+            comment_id=comment_id,
+            user_id=self.user_id(record['user']),
+            kind_of_vote=record['kind_of_vote'],
+            voted_at=dump.to_datetime(record.get('voted_at'))
+            ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Loads JSONL dumps written by export_forums. The dumps are read line by line and saved in '
+        'batches, one transaction per forum, so memory use does not grow with the size of the dump. '
+        'Every forum gets new ids, forums whose name is too similar to an existent one are skipped.'
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dumps', nargs='+', metavar='dump', help='Dump files to load ("-" for stdin)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows saved per INSERT')
+        parser.add_argument(
+            '--jobs', type=int, default=1,
+            help='Dumps loaded at the same time, each one in its own thread and db connection '
+                 '(export_forums --split-dir writes one dump per forum). Forums going to the same '
+                 'sqlite database are still written one at a time'
+            )
+
+    def handle(self, *args, dumps, batch_size, jobs, verbosity, **options):
+        if dumps.count('-') > 1 or ('-' in dumps and jobs > 1):
+            raise CommandError('stdin can only be read once, and not in parallel')
+
+        def log(message, verbosity=1):
+            if verbosity <= self.verbosity:
+                self.stderr.write(message)
+        self.verbosity = verbosity
+
+        stats = Counter()
+        with dump.preserved_timestamps(Forum, Post, PostVote, Comment, CommentVote):
+            if jobs > 1:
+                write_locks = self.write_locks()
+                with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='import-forums') as executor:
+                    for dump_stats in executor.map(lambda path: self.import_in_thread(path, batch_size, log, write_locks), dumps):
+                        stats.update(dump_stats)
+            else:
+                for path in dumps:
+                    stats.update(self.import_dump(path, batch_size, log))
+
+        self.stdout.write(', '.join(f'{count} {name}' for name, count in sorted(stats.items())) or 'Nothing imported')
+
+    def write_locks(self):
+        '''
+        A lock per sqlite database (by file, as several aliases can share one): sqlite takes one
+        writer at a time, and the transactions of other threads would fail with "database is locked"
+        '''
+        return {
+            str(connections[alias].settings_dict['NAME']): threading.RLock()
+            for alias in connections if connections[alias].vendor == 'sqlite'
+        }
+
+    def import_dump(self, path, batch_size, log, write_locks=None):
+        importer = ForumImporter(batch_size, log, write_locks)
+        if path == '-':
+            return importer.import_records(dump.load_records(sys.stdin))
+        with open(path, encoding='utf-8') as lines:
+            return importer.import_records(dump.load_records(lines))
+
+    def import_in_thread(self, path, batch_size, log, write_locks):
+        try:
+            return self.import_dump(path, batch_size, log, write_locks)
+        finally:
+            connections.close_all()  # Only the connections of this thread
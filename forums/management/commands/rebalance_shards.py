@@ -0,0 +1,135 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.core.management.base import BaseCommand, CommandError
+
+from forums import dump, forum_cache, sharding
+from forums.models import Forum, Post, PostVote, ActivityEvent, ForumActivity, PostActivity, Fingerprint
+from comments.models import Comment, CommentVote
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves forums, with all their content, between the shards of settings.FORUM_SHARDS. With --to, '
+        'moves the given forums to that shard. Otherwise moves forums from the shard with the most posts '
+        'to the one with the fewest while that makes them closer. Posts and comments keep their ids.'
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('forums', nargs='*', metavar='forum', help='Names of the forums to move (needs --to)')
+        parser.add_argument('--to', dest='destination', help='Shard to move the forums to')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows copied per INSERT')
+        parser.add_argument('--dry-run', action='store_true', help='Only tell which forums would be moved')
+
+    def handle(self, *args, forums, destination, chunk_size, dry_run, **options):
+        if bool(forums) != bool(destination):
+            raise CommandError('Forums to move and --to have to be given together')
+        if destination is not None and destination not in sharding.shards():
+            raise CommandError(f'"{destination}" is not one of the shards: {", ".join(sharding.shards())}')
+        self.chunk_size = chunk_size
+
+        if forums:
+            moves = []
+            for name in forums:
+                forum = Forum.objects.filter(name=name).first()
+                if forum is None:
+                    raise CommandError(f'There is no forum named "{name}"')
+                if sharding.shard_of(forum) != destination:
+                    moves.append((forum, destination))
+        else:
+            moves = self.balancing_moves()
+
+        for forum, destination in moves:
+            self.stdout.write(f'{"Would move" if dry_run else "Moving"} "{forum.name}" from {sharding.shard_of(forum)} to {destination}')
+            if not dry_run:
+                self.move(forum, destination)
+        if not moves:
+            self.stdout.write('Nothing to move')
+
+    def balancing_moves(self):
+        '''
+        Greedily moves the biggest forum of the shard with the most posts that makes it closer to
+        the shard with the fewest, until there are no such forums
+        '''
+        forum_posts = {}  # forum -> posts
+        shard_posts = Counter(dict.fromkeys(sharding.shards(), 0))
+        forums = {forum.pk: forum for forum in Forum.objects.all()}
+        for shard in sharding.shards():
+            counts = Post.objects.using(shard).order_by().values_list('forum_id').annotate(Count('pk'))
+            for forum_id, posts in counts:
+                forum = forums.get(forum_id)
+                if forum is not None and sharding.shard_of(forum) == shard:  # Not leftovers of a move
+                    forum_posts[forum] = posts
+                    shard_posts[shard] += posts
+
+        moves = []
+        placement = {forum: sharding.shard_of(forum) for forum in forum_posts}
+        while True:
+            fullest = max(shard_posts, key=shard_posts.get)
+            emptiest = min(shard_posts, key=shard_posts.get)
+            gap = shard_posts[fullest] - shard_posts[emptiest]
+            candidates = [
+                forum for forum, shard in placement.items()
+                if shard == fullest and 0 < forum_posts[forum] < gap
+            ]
+            if not candidates:
+                return moves
+            forum = max(candidates, key=forum_posts.get)
+            placement[forum] = emptiest
+            shard_posts[fullest] -= forum_posts[forum]
+            shard_posts[emptiest] += forum_posts[forum]
+            moves.append((forum, emptiest))
+
+    def copy(self, queryset, destination, keep_ids=True):
+        '''Saves the objects of queryset in destination, chunk_size at a time'''
+        objs = []
+        for obj in queryset.order_by('pk').iterator(chunk_size=self.chunk_size):
+            if not keep_ids:
+                obj.pk = None  # Only posts and comments have ids unique across the shards
+            objs.append(obj)
+            if len(objs) >= self.chunk_size:
+                queryset.model.objects.using(destination).bulk_create(objs)
+                objs = []
+        queryset.model.objects.using(destination).bulk_create(objs)
+
+    def move(self, forum, destination):
+        '''
+        Copies the content of forum to destination and deletes it from its shard, switching
+        Forum.shard in between. The transactions are nested so they commit in that order: when one
+        of the commits fails, what is left behind is a copy in the shard the forum is not in,
+        which is ignored and replaced by the next move
+        '''
+        source = sharding.shard_of(forum)
+        posts = Post.objects.using(source).filter(forum_id=forum.pk)
+        with transaction.atomic(using=source), transaction.atomic(using=sharding.PRIMARY), \
+                transaction.atomic(using=destination), dump.preserved_timestamps(Post, Comment, ActivityEvent, PostVote, CommentVote, Fingerprint):
+            posts.update(forum_id=F('forum_id'))  # Keeps new posts and replies out until the move is done
+            Post.objects.using(destination).filter(forum_id=forum.pk).delete()  # Leftovers of a failed move
+            ActivityEvent.objects.using(destination).filter(forum_id=forum.pk).delete()
+            ForumActivity.objects.using(destination).filter(forum_id=forum.pk).delete()
+
+            with sharding.keeping_id_blocks(destination):
+                self.copy(posts, destination)
+                # Replies only point to their parent comment, so the threads are copied one level
+                # of nesting at a time, every comment after the one it replies to
+                level = Comment.objects.using(source).filter(post__forum_id=forum.pk)
+                while level.exists():
+                    self.copy(level, destination)
+                    self.copy(CommentVote.objects.using(source).filter(comment__in=level.values('pk')), destination, keep_ids=False)
+                    level = Comment.objects.using(source).filter(in_reply_to__in=level.values('pk'))
+
+            self.copy(PostVote.objects.using(source).filter(post__forum_id=forum.pk), destination, keep_ids=False)
+            self.copy(Fingerprint.objects.using(source).filter(forum_id=forum.pk), destination, keep_ids=False)
+            self.copy(ActivityEvent.objects.using(source).filter(forum_id=forum.pk), destination, keep_ids=False)
+            self.copy(ForumActivity.objects.using(source).filter(forum_id=forum.pk), destination, keep_ids=False)
+            self.copy(PostActivity.objects.using(source).filter(post__forum_id=forum.pk), destination, keep_ids=False)
+
+            Forum.objects.filter(pk=forum.pk).update(shard=destination)
+            forum.shard = destination
+            forum_cache.invalidate(forum)
+
+            # Deleting the posts deletes their comment trees, votes and activity too
+            posts.delete()
+            ActivityEvent.objects.using(source).filter(forum_id=forum.pk).delete()
+            ForumActivity.objects.using(source).filter(forum_id=forum.pk).delete()
@@ -0,0 +1,98 @@
+import time
+from collections import defaultdict
+
+from django.utils import timezone
+from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.core.management.base import BaseCommand
+
+from forums import sharding
+from abstract_models.vote import Vote
+from forums.models import Post, PostVote
+from comments.models import Comment, CommentVote
+
+# +1 for upvotes, -1 for downvotes
+VOTE_VALUE = Case(When(kind_of_vote=Vote.UPVOTE, then=Value(1)), default=Value(-1))
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes Post.points and Comment.points from their vote records and fixes the ones that drifted. '
+        'Works in primary key chunks, so it can run while the site is serving traffic.'
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows checked per transaction')
+        parser.add_argument(
+            '--pause', type=float, default=0.0, 
+            help='Seconds to sleep between chunks, to leave room for other writers'
+            )
+        parser.add_argument('--dry-run', action='store_true', help='Only report the drift, do not fix it')
+
+    def handle(self, *args, chunk_size, pause, dry_run, verbosity, **options):
+        for shard in sharding.shards():
+            for model, vote_model, vote_fk in ((Post, PostVote, 'post'), (Comment, CommentVote, 'comment')):
+                checked, drifted, total_drift = self.reconcile(
+                    model, vote_model, vote_fk, shard,
+                    chunk_size=chunk_size, pause=pause, dry_run=dry_run, verbosity=verbosity
+                    )
+                label = model.__name__ if len(sharding.shards()) == 1 else f'{model.__name__} ({shard})'
+                self.stdout.write(
+                    f'{label}: checked {checked}, {drifted} with wrong points '
+                    f'(total drift {total_drift}){"" if dry_run or not drifted else ", fixed"}'
+                    )
+
+    def reconcile(self, model, vote_model, vote_fk, shard, *, chunk_size, pause, dry_run, verbosity):
+        '''
+        Walks model by primary key chunks. For every chunk the expected points come from a single
+        grouped SUM over the vote records of the chunk, and the drifted rows are fixed with one
+        UPDATE per distinct correction.
+
+        The corrections are applied as points = points + correction (not as points = expected) and
+        the points are read in the same transaction as the votes, so a vote that lands between
+        our read and our write is not overwritten.
+        '''
+        checked = drifted = total_drift = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic(using=shard):
+                rows = list(
+                    model.objects.using(shard).filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'points')[:chunk_size]
+                    )
+                if not rows:
+                    break
+                first_pk, last_pk = rows[0][0], rows[-1][0]
+
+                expected_points = dict(
+                    vote_model.objects.using(shard).filter(**{f'{vote_fk}__gte': first_pk, f'{vote_fk}__lte': last_pk})
+                    .order_by()
+                    .values(vote_fk)
+                    .annotate(total=Sum(VOTE_VALUE))
+                    .values_list(vote_fk, 'total')
+                    )
+
+                corrections = defaultdict(list)  # correction -> pks that need it
+                for pk, points in rows:
+                    correction = expected_points.get(pk, 0) - points
+                    if correction:
+                        corrections[correction].append(pk)
+                        if verbosity >= 2:
+                            self.stdout.write(
+                                f'  {model.__name__} {pk}: stored {points}, votes say {points + correction}'
+                                )
+
+                if not dry_run:
+                    for correction, pks in corrections.items():
+                        # last_modified is bumped so the cached fragments show the fixed points
+                        model.objects.using(shard).filter(pk__in=pks).update(
+                            points=F('points') + correction, 
+                            last_modified=timezone.now()
+                            )
+
+            checked += len(rows)
+            drifted += sum(len(pks) for pks in corrections.values())
+            total_drift += sum(abs(correction) * len(pks) for correction, pks in corrections.items())
+            if pause:
+                time.sleep(pause)
+
+        return checked, drifted, total_drift
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from forums.trending import renormalize
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves the epoch of the trending forum scores to now, scaling them down so they do not overflow. '
+        'Meant to be run periodically, e.g. daily from cron.'
+        )
+
+    def handle(self, *args, **options):
+        renormalize()
+        self.stdout.write('Trending scores renormalized')
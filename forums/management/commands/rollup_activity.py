@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from forums.activity import compact_events
+
+
+class Command(BaseCommand):
+    help = (
+        'Compacts the raw activity events into the hourly and daily forum/post activity rollups. '
+        'Meant to be run periodically (e.g. every few minutes from cron), never twice at the same time.'
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Events compacted per transaction')
+
+    def handle(self, *args, batch_size, **options):
+        compacted = compact_events(batch_size=batch_size)
+        self.stdout.write(f'Compacted {compacted} activity events')
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from django.core.management.base import BaseCommand
+
+from forums.models import Forum
+
+
+class Command(BaseCommand):
+    help = (
+        'Lists the forums where nothing was posted or commented in the last DAYS days, the least '
+        'recently active first. A range scan of the Forum.last_activity_at index.'
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=180, help='Days without posts or comments (180 by default)')
+
+    def handle(self, *args, days, **options):
+        cutoff = timezone.now() - timedelta(days=days)
+        stale = Forum.objects.filter(last_activity_at__lt=cutoff).order_by('last_activity_at')
+        count = 0
+        for name, last_activity_at in stale.values_list('name', 'last_activity_at').iterator():
+            self.stdout.write(f'{name}\tlast active {last_activity_at:%Y-%m-%d %H:%M}')
+            count += 1
+        self.stdout.write(f'{count} forums without activity in the last {days} days')
@@ -0,0 +1,20 @@
+# Generated by Django 4.0.10 on 2026-10-19 10:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forums', '0006_forum_real_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='last_modified'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-19 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forums', '0007_post_last_modified'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='forum',
+            name='real_name',
+            field=models.CharField(max_length=15, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.0.10 on 2026-10-19 13:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forums', '0008_forum_real_name_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postvote',
+            name='voted_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='voted_at'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='PostActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('H', 'hourly'), ('D', 'daily')], max_length=1)),
+                ('bucket', models.DateTimeField(verbose_name='bucket')),
+                ('comments', models.IntegerField(default=0)),
+                ('upvotes', models.IntegerField(default=0)),
+                ('downvotes', models.IntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='forums.post')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ForumActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('H', 'hourly'), ('D', 'daily')], max_length=1)),
+                ('bucket', models.DateTimeField(verbose_name='bucket')),
+                ('comments', models.IntegerField(default=0)),
+                ('upvotes', models.IntegerField(default=0)),
+                ('downvotes', models.IntegerField(default=0)),
+                ('posts', models.IntegerField(default=0)),
+                ('forum', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='forums.forum')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('P', 'post'), ('C', 'comment'), ('U', 'upvote'), ('D', 'downvote')], max_length=1)),
+                ('on_comment', models.BooleanField(default=False)),
+                ('delta', models.SmallIntegerField(default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created_at')),
+                ('forum', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='forums.forum')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='forums.post')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='postactivity',
+            index=models.Index(fields=['period', 'bucket'], name='post_activity_period_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='postactivity',
+            constraint=models.UniqueConstraint(fields=('post', 'period', 'bucket'), name='unique_post_activity_per_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='forumactivity',
+            constraint=models.UniqueConstraint(fields=('forum', 'period', 'bucket'), name='unique_forum_activity_per_bucket'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.0.10 on 2026-10-19 13:11
+
+import time
+
+from django.db import migrations, models
+
+
+def create_epoch(apps, schema_editor):
+    TrendingEpoch = apps.get_model('forums', 'TrendingEpoch')
+    TrendingEpoch.objects.using(schema_editor.connection.alias).create(started_at=time.time())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forums', '0009_activity_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingEpoch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.FloatField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='forum',
+            name='trending_score',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.RunPython(create_epoch, migrations.RunPython.noop, hints={'model_name': 'trendingepoch'}),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.0.10 on 2026-10-19 13:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('forums', '0010_forum_trending_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forum',
+            name='shard',
+            field=models.CharField(blank=True, default='', max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='activityevent',
+            name='forum',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='forums.forum'),
+        ),
+        migrations.AlterField(
+            model_name='forumactivity',
+            name='forum',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='forums.forum'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='forum',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='forums.forum'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='poster',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='members.member'),
+        ),
+        migrations.AlterField(
+            model_name='postvote',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.0.10 on 2026-10-19 13:37
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models import F, Max
+import django.utils.timezone
+
+
+def backfill_last_comment_at(apps, schema_editor):
+    '''Post.last_comment_at from the comments of every thread, walked one level of nesting at a time'''
+    Post = apps.get_model('forums', 'Post')
+    Comment = apps.get_model('comments', 'Comment')
+    db = schema_editor.connection.alias
+
+    Post.objects.using(db).update(last_comment_at=F('pub_date'))
+    latest = {}  # post pk -> pub_date of the last comment of its thread
+    thread_of = {}
+    level = Comment.objects.using(db).filter(post__isnull=False)
+    while True:
+        rows = list(level.values_list('pk', 'post_id', 'in_reply_to_id', 'pub_date'))
+        if not rows:
+            break
+        for pk, post_id, in_reply_to_id, pub_date in rows:
+            thread_of[pk] = post_id if post_id is not None else thread_of[in_reply_to_id]
+            latest[thread_of[pk]] = max(latest.get(thread_of[pk], pub_date), pub_date)
+        level = Comment.objects.using(db).filter(in_reply_to_id__in=[row[0] for row in rows])
+    for post_pk, last_comment_at in latest.items():
+        Post.objects.using(db).filter(pk=post_pk).update(last_comment_at=last_comment_at)
+
+
+def backfill_last_activity_at(apps, schema_editor):
+    '''
+    Forum.last_activity_at from the creation date of the forum and, when the posts are in the
+    same db (a single shard), the last post or comment of its threads
+    '''
+    Forum = apps.get_model('forums', 'Forum')
+    db = schema_editor.connection.alias
+
+    for forum in Forum.objects.using(db).only('pk', 'creation_date').iterator():
+        created = datetime.datetime.combine(forum.creation_date, datetime.time(), tzinfo=datetime.timezone.utc)
+        Forum.objects.using(db).filter(pk=forum.pk).update(last_activity_at=created)
+    if 'forums_post' in schema_editor.connection.introspection.table_names():
+        Post = apps.get_model('forums', 'Post')
+        latest = Post.objects.using(db).values('forum_id').annotate(latest=Max('last_comment_at'))
+        for row in latest:
+            Forum.objects.using(db).filter(pk=row['forum_id']).update(last_activity_at=row['latest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0008_sharding'),
+        ('forums', '0011_sharding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forum',
+            name='last_activity_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='last_activity_at'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='last_comment_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='last_comment_at'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['forum', '-last_comment_at'], name='post_forum_last_comment_idx'),
+        ),
+        migrations.RunPython(backfill_last_comment_at, migrations.RunPython.noop, hints={'model_name': 'post'}),
+        migrations.RunPython(backfill_last_activity_at, migrations.RunPython.noop, hints={'model_name': 'forum'}),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.0.10 on 2026-10-19 13:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0009_simhash'),
+        ('forums', '0012_last_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='simhash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='Fingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('simhash', models.BigIntegerField()),
+                ('band0', models.PositiveSmallIntegerField()),
+                ('band1', models.PositiveSmallIntegerField()),
+                ('band2', models.PositiveSmallIntegerField()),
+                ('band3', models.PositiveSmallIntegerField()),
+                ('band4', models.PositiveSmallIntegerField()),
+                ('band5', models.PositiveSmallIntegerField()),
+                ('band6', models.PositiveSmallIntegerField()),
+                ('band7', models.PositiveSmallIntegerField()),
+                ('near_duplicate', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created_at')),
+                ('comment', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='comments.comment')),
+                ('forum', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='forums.forum')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='forums.post')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='fingerprint',
+            index=models.Index(fields=['forum', 'band0', 'created_at'], name='fingerprint_band0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fingerprint',
+            index=models.Index(fields=['forum', 'band1', 'created_at'], name='fingerprint_band1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fingerprint',
+            index=models.Index(fields=['forum', 'band2', 'created_at'], name='fingerprint_band2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fingerprint',
+            index=models.Index(fields=['forum', 'band3', 'created_at'], name='fingerprint_band3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fingerprint',
+            index=models.Index(fields=['forum', 'band4', 'created_at'], name='fingerprint_band4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fingerprint',
+            index=models.Index(fields=['forum', 'band5', 'created_at'], name='fingerprint_band5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fingerprint',
+            index=models.Index(fields=['forum', 'band6', 'created_at'], name='fingerprint_band6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fingerprint',
+            index=models.Index(fields=['forum', 'band7', 'created_at'], name='fingerprint_band7_idx'),
+        ),
+    ]
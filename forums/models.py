@@ -1,10 +1,12 @@
-import re
-
-from django.db import models
+from django.utils import timezone
+from django.db import models, transaction
+from django.db.utils import IntegrityError
 from django.contrib.auth.models import User
 
 from members.models import Member
 from abstract_models.vote import Vote
+from .name_index import forum_name_index, get_real_name
+from . import sharding
 
 
 class TooSimilarNameException(Exception):
@@ -27,10 +29,16 @@ class TooSimilarNameException(Exception):
 class Forum(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=15, unique=True)
-    real_name = models.CharField(max_length=15, null=True)
+    real_name = models.CharField(max_length=15, null=True, unique=True)
     description = models.CharField(max_length=255)
     creation_date = models.DateField('creation_date', auto_now_add=True)
     members = models.ManyToManyField(Member)
+    # Exponentially decayed activity, relative to TrendingEpoch. See forums.trending
+    trending_score = models.FloatField(default=0, db_index=True)
+    # Database alias of the shard holding the content of the forum, see forums.sharding
+    shard = models.CharField(max_length=30, blank=True, default='')
+    # When the last post or comment was published in the forum, moved by forums.trending.bump
+    last_activity_at = models.DateTimeField('last_activity_at', default=timezone.now, db_index=True)
 
     def __str__(self):
         return f'forum: {self.name}, owner {self.owner.username}'
@@ -49,23 +57,58 @@ class Forum(models.Model):
 
         If we find that there is at least one forum with the same "ral_name" in the db, we will not
         add the new one to the db and raise a TooSimilarNameException
+
+        Names that are just a typo away (like tiktoknews and tiktoknewz) are too similar as well, those
+        are looked up in forums.name_index.forum_name_index. The index lives in memory and might hold
+        names of forums that do not exist anymore, so its matches are confirmed against the db, in the
+        same query we use for the exact match.
+
+        real_name is unique in the db, so if another forum with the same real name is inserted
+        between our check and our insert, the IntegrityError is turned into a TooSimilarNameException too.
         '''
         
-        self.real_name = re.sub('[^a-zA-Z]', '', self.name).lower()
-        if Forum.objects.filter(real_name=self.real_name).exists():
+        if not self.shard:
+            self.shard = sharding.pick_shard()
+
+        self.real_name = get_real_name(self.name)
+        too_similar = forum_name_index.similar_to(self.real_name) | {self.real_name}
+        if Forum.objects.filter(real_name__in=too_similar).exists():
             raise TooSimilarNameException(self.name)
 
-        super().save(*args, **kwargs)
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except IntegrityError:
+            if Forum.objects.filter(real_name=self.real_name).exists():
+                raise TooSimilarNameException(self.name)
+            raise
+
+
+class TrendingEpoch(models.Model):
+    '''
+    Single row table holding the instant (unix timestamp) the Forum.trending_score values are
+    currently expressed relative to. Created by a migration, moved by forums.trending.renormalize
+    '''
+    started_at = models.FloatField()
 
 
 class Post(models.Model):
-    forum = models.ForeignKey(Forum, on_delete=models.CASCADE)
-    poster = models.ForeignKey(Member, on_delete=models.CASCADE)
+    # Posts might be in a shard and forums and members are always in the primary db, so these
+    # foreign keys have no db constraint and are deleted by forums.signals instead of cascading
+    forum = models.ForeignKey(Forum, on_delete=models.DO_NOTHING, db_constraint=False)
+    poster = models.ForeignKey(Member, on_delete=models.DO_NOTHING, db_constraint=False)
     title = models.CharField(max_length=30)
     content = models.CharField(max_length=255)
     points = models.IntegerField(default=0)
     edited = models.BooleanField(default=False)
     pub_date = models.DateTimeField('pub_date', auto_now_add=True)
+    # Bumped on every save, cached template fragments of the post are keyed on it
+    last_modified = models.DateTimeField('last_modified', auto_now=True)
+    # When the last comment of the thread was published (pub_date until then), threads with new
+    # comments go up in the forum. Moved by forums.activity.record_comment
+    last_comment_at = models.DateTimeField('last_comment_at', default=timezone.now)
+    # SimHash of the content, see forums.duplicates. Null until backfill_fingerprints fills it
+    simhash = models.BigIntegerField(null=True, blank=True)
 
     def __str__(self):
         return f'tittle: {self.title}, from: {self.forum}, by: {self.poster.user.username}'
@@ -74,11 +117,22 @@ class Post(models.Model):
         '''Utility function to know if a given member was the one who post this post'''
         return self.poster == member
 
+    @property
+    def cached_forum(self):
+        '''self.forum from forums.forum_cache, for displaying it without a query per post'''
+        from .forum_cache import get_forum
+        return get_forum(self.forum_id)
+
     # class Meta:
     #     permissions = [
     #         ('comment', 'Can send coments to the post')
     #     ]
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['forum', '-last_comment_at'], name='post_forum_last_comment_idx')
+        ]
+
 
 class PostVote(Vote):
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
@@ -89,4 +143,113 @@ class PostVote(Vote):
                 fields=['user', 'post'], 
                 name='unique_vote_per_post'
                 )
-        ]
\ No newline at end of file
+        ]
+
+
+class Fingerprint(models.Model):
+    '''
+    LSH lookup row of the SimHash of a recent post or comment, split in bands that are looked up
+    by equality. See forums.duplicates
+    '''
+    # The band indexes start with the forum, one for it alone is not needed
+    forum = models.ForeignKey(Forum, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)  # For comments, the post of the thread
+    comment = models.ForeignKey('comments.Comment', on_delete=models.CASCADE, null=True)
+    simhash = models.BigIntegerField()
+    band0 = models.PositiveSmallIntegerField()
+    band1 = models.PositiveSmallIntegerField()
+    band2 = models.PositiveSmallIntegerField()
+    band3 = models.PositiveSmallIntegerField()
+    band4 = models.PositiveSmallIntegerField()
+    band5 = models.PositiveSmallIntegerField()
+    band6 = models.PositiveSmallIntegerField()
+    band7 = models.PositiveSmallIntegerField()
+    # A near duplicate that was published anyway (settings.NEAR_DUPLICATE_ACTION = 'flag')
+    near_duplicate = models.BooleanField(default=False)
+    created_at = models.DateTimeField('created_at', auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['forum', f'band{band}', 'created_at'], name=f'fingerprint_band{band}_idx')
+            for band in range(8)
+        ]
+
+
+class ActivityEvent(models.Model):
+    '''
+    Raw log of the activity of the forums: one row per new post, new comment and vote change.
+    Writing one of these is a single cheap INSERT, they are periodically compacted into the
+    ForumActivity and PostActivity rollups (and deleted) by forums.activity.compact_events
+    '''
+    POST = 'P'
+    COMMENT = 'C'
+    UPVOTE = 'U'
+    DOWNVOTE = 'D'
+
+    KIND_CHOICES = [
+        (POST, 'post'),
+        (COMMENT, 'comment'),
+        (UPVOTE, 'upvote'),
+        (DOWNVOTE, 'downvote')
+    ]
+
+    forum = models.ForeignKey(Forum, on_delete=models.DO_NOTHING, db_constraint=False)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)  # For comments and their votes, the post of the thread
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES)
+    on_comment = models.BooleanField(default=False)  # True for votes on comments
+    delta = models.SmallIntegerField(default=1)  # -1 when a vote is removed
+    created_at = models.DateTimeField('created_at', auto_now_add=True)
+
+
+class Activity(models.Model):
+    HOURLY = 'H'
+    DAILY = 'D'
+
+    PERIOD_CHOICES = [
+        (HOURLY, 'hourly'),
+        (DAILY, 'daily')
+    ]
+
+    period = models.CharField(max_length=1, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField('bucket')  # Start of the hour/day
+    comments = models.IntegerField(default=0)
+    # Net votes cast during the bucket (removing an upvote counts as -1 upvotes)
+    upvotes = models.IntegerField(default=0)
+    downvotes = models.IntegerField(default=0)
+
+    @property
+    def score(self):
+        return self.upvotes - self.downvotes
+
+    class Meta:
+        abstract = True
+
+
+class ForumActivity(Activity):
+    '''Activity of a forum per hour/day, votes on its posts and on their comments included'''
+    forum = models.ForeignKey(Forum, on_delete=models.DO_NOTHING, db_constraint=False)
+    posts = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['forum', 'period', 'bucket'],
+                name='unique_forum_activity_per_bucket'
+                )
+        ]
+
+
+class PostActivity(Activity):
+    '''Activity of a post per hour/day: comments in its thread and its own votes'''
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'period', 'bucket'],
+                name='unique_post_activity_per_bucket'
+                )
+        ]
+        indexes = [
+            models.Index(fields=['period', 'bucket'], name='post_activity_period_bucket')
+        ]
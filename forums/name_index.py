@@ -0,0 +1,161 @@
+import re
+import threading
+
+from django.db import transaction
+
+# Names whose "real name" is shorter than this are only compared exactly, otherwise "news" and
+# "nets" (or any pair of 3 letters names) would be considered too similar.
+FUZZY_MIN_LENGTH = 5
+
+
+def get_real_name(name):
+    '''The "real name" signature of a forum name: its letters, lowercased. See Forum.save()'''
+    return re.sub('[^a-zA-Z]', '', name).lower()
+
+
+def max_edit_distance(real_name):
+    '''How many edits away from real_name another real name has to be to not be too similar to it'''
+    if len(real_name) < FUZZY_MIN_LENGTH:
+        return 0
+    elif len(real_name) < 8:
+        return 1
+    else:
+        return 2
+
+
+def edit_distance(a, b, limit):
+    '''Levenshtein distance between a and b, or limit + 1 as soon as it is known to be greater than limit'''
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,  # deletion
+                current[j - 1] + 1,  # insertion
+                previous[j - 1] + (char_a != char_b)  # substitution
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def deletion_variants(real_name, deletions=1):
+    '''real_name itself and every string we get by deleting up to `deletions` of its letters'''
+    variants = {real_name}
+    for _ in range(deletions):
+        variants |= {variant[:i] + variant[i + 1:] for variant in variants for i in range(len(variant))}
+    return variants
+
+
+def indexed_variants(real_name):
+    '''The keys real_name is stored under: its variants with as many deletions as its max_edit_distance'''
+    return deletion_variants(real_name, max_edit_distance(real_name))
+
+
+def _add(variants, variant, real_name):
+    '''Most variants are the variant of only one name: they map to it, the others to the set of them'''
+    names = variants.get(variant)
+    if names is None:
+        variants[variant] = real_name
+    elif isinstance(names, set):
+        names.add(real_name)
+    elif names != real_name:
+        variants[variant] = {names, real_name}
+
+
+def _discard(variants, variant, real_name):
+    names = variants.get(variant)
+    if names == real_name:
+        del variants[variant]
+    elif isinstance(names, set):
+        names.discard(real_name)
+        if len(names) == 1:
+            variants[variant] = names.pop()
+
+
+class ForumNameIndex:
+    '''
+    In memory index of the real names of every forum, used to find names that are too similar to
+    a new one without scanning the forums table.
+
+    A BK-tree still visits a big part of the tree for a distance of 2, so instead we use a
+    "symmetric deletion" index: every real name is stored under itself and under each string
+    obtained by deleting up to max_edit_distance(name) of its letters (none for the short names,
+    one or two for the longer ones). Two names that are k edits apart (substitutions,
+    insertions or deletions, like "tiktoknews" and "tiktoknewz", or "tiktokmewz" two
+    substitutions away) always share a key with at most k deletions on each side, so finding
+    them takes as many dict lookups as the name has variants (about len(name) ** 2 / 2 for a
+    long name) no matter how many forums there are. The candidates are then checked with the
+    real edit distance.
+
+    The index is built from the database the first time it is used in a process, and kept up to
+    date by the Forum post_save/post_delete signals (see forums.signals) once their transaction
+    commits. Forums created by other processes are not seen until the index is rebuilt, the unique
+    index over Forum.real_name still rejects exact matches in that case.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._variants = None  # deletion variant -> real name, or set of real names (see _add)
+
+    def rebuild(self, real_names=None):
+        '''Builds the index from scratch, with the real names of every forum in the db by default'''
+        if real_names is None:
+            from .models import Forum
+            real_names = Forum.objects.exclude(real_name=None).values_list('real_name', flat=True).iterator()
+
+        variants = {}
+        for real_name in real_names:
+            for variant in indexed_variants(real_name):
+                _add(variants, variant, real_name)
+
+        with self._lock:
+            self._variants = variants
+
+    def _ensure_built(self):
+        if self._variants is None:
+            self.rebuild()
+
+    def add(self, real_name):
+        self._ensure_built()
+        with self._lock:
+            for variant in indexed_variants(real_name):
+                _add(self._variants, variant, real_name)
+
+    def remove(self, real_name):
+        self._ensure_built()
+        with self._lock:
+            for variant in indexed_variants(real_name):
+                _discard(self._variants, variant, real_name)
+
+    def similar_to(self, real_name):
+        '''Returns the set of indexed real names that are too similar to real_name'''
+        self._ensure_built()
+        limit = max_edit_distance(real_name)
+        variants = deletion_variants(real_name, limit)
+
+        candidates = set()
+        with self._lock:
+            for variant in variants:
+                names = self._variants.get(variant)
+                if isinstance(names, str):
+                    candidates.add(names)
+                elif names is not None:
+                    candidates |= names
+
+        return {
+            candidate for candidate in candidates 
+            if edit_distance(real_name, candidate, limit) <= min(limit, max_edit_distance(candidate))
+        }
+
+    def add_on_commit(self, real_name):
+        transaction.on_commit(lambda: self.add(real_name))
+
+    def remove_on_commit(self, real_name):
+        transaction.on_commit(lambda: self.remove(real_name))
+
+
+forum_name_index = ForumNameIndex()
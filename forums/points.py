@@ -0,0 +1,52 @@
+'''
+Current points, number of replies and vote of the user for many posts and comments at once, for
+pages that refresh the scores they show without reloading (see views.bulk_points).
+
+Every table is read with a single query per shard, whatever the number of ids: the points, the
+replies grouped by the post/comment they reply to, and the votes of the user. Replies are the
+direct ones (comments of a post, replies of a comment), the ones the pages show next to the score.
+'''
+from django.db.models import Count
+
+from . import sharding
+from .models import Post, PostVote
+
+
+def _scores(model, ids, user, *, vote_model, vote_field, replies_field):
+    '''{pk: [points, replies, vote]} of the objects of model with those ids, vote being 'U', 'D' or None'''
+    from comments.models import Comment
+
+    scores = {}
+    for alias in sharding.shards():
+        rows = model.objects.using(alias).filter(pk__in=ids).values_list('pk', 'points')
+        scores.update((pk, [points, 0, None]) for pk, points in rows)
+    if not scores:
+        return scores
+
+    for alias in sharding.shards():
+        replies = (
+            Comment.objects.using(alias)
+            .filter(**{f'{replies_field}__in': scores})
+            .order_by()
+            .values_list(replies_field)
+            .annotate(Count('pk'))
+            )
+        for pk, count in replies:
+            scores[pk][1] += count
+
+        if user.is_authenticated:
+            votes = vote_model.objects.using(alias).filter(user=user, **{f'{vote_field}__in': scores})
+            for pk, kind in votes.values_list(vote_field, 'kind_of_vote'):
+                scores[pk][2] = kind
+    return scores
+
+
+def post_scores(ids, user):
+    return _scores(Post, ids, user, vote_model=PostVote, vote_field='post_id', replies_field='post_id')
+
+
+def comment_scores(ids, user):
+    from comments.models import Comment, CommentVote
+    return _scores(
+        Comment, ids, user, vote_model=CommentVote, vote_field='comment_id', replies_field='in_reply_to_id'
+        )
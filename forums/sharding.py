@@ -0,0 +1,242 @@
+'''
+Forum based sharding.
+
+The content of a forum (its posts, comments, votes and activity, the SHARDED_MODELS) lives in
+one of the settings.FORUM_SHARDS databases, the one named by Forum.shard. Everything else (users,
+members, forums, sessions...) lives in the primary ('default') db. With the default settings
+there is a single shard, the primary itself, and nothing of this changes any query.
+
+ShardRouter picks the shard from the forum whenever django gives it something to pick from: a
+Forum (forum.post_set), an object already loaded from a shard (post.comment_set, post.postvote_set)
+or a new object linked to one of those (Post(forum=forum), Comment(post=post)). The queries that
+have none of those (looking a post up by id, everything a member wrote) go through the helpers
+of this module, which ask every shard and merge the results.
+
+Post and comment ids are unique across the shards (they appear in urls and in the archive): the
+ids of shard number i start at i * SHARD_ID_BLOCK (see seed_id_blocks), so the shard where a
+post was created can be known from its id. rebalance_shards moves forums between shards keeping
+their ids (see keeping_id_blocks), so a lookup by id tries that shard first and the others after it.
+'''
+import heapq
+from itertools import islice
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import Http404
+from django.db.models import Count
+
+SHARDED_MODELS = {
+    ('forums', 'post'), ('forums', 'postvote'), ('forums', 'activityevent'),
+    ('forums', 'forumactivity'), ('forums', 'postactivity'), ('forums', 'fingerprint'),
+    ('comments', 'comment'), ('comments', 'commentvote'),
+}
+
+PRIMARY = 'default'
+
+SHARD_ID_BLOCK = 10 ** 12
+
+# Tables whose ids have to be unique across the shards
+ID_BLOCK_TABLES = ('forums_post', 'comments_comment')
+
+
+def is_sharded(model):
+    '''model is a model class or instance'''
+    return (model._meta.app_label, model._meta.model_name) in SHARDED_MODELS
+
+
+def shards():
+    return settings.FORUM_SHARDS
+
+
+def shard_of(forum):
+    return forum.shard or shards()[0]
+
+
+def shard_of_forum_id(forum_id):
+    from .models import Forum
+    return Forum.objects.values_list('shard', flat=True).get(pk=forum_id) or shards()[0]
+
+
+def pick_shard():
+    '''The shard for a new forum: the one with less forums'''
+    from .models import Forum
+    counts = dict.fromkeys(shards(), 0)
+    for shard, count in Forum.objects.order_by().values_list('shard').annotate(Count('pk')):
+        shard = shard or shards()[0]
+        counts[shard] = counts.get(shard, 0) + count
+    return min(shards(), key=counts.get)
+
+
+def shards_for_id(pk):
+    '''Every shard, starting by the one where the object with that id was created'''
+    aliases = list(shards())
+    home = pk // SHARD_ID_BLOCK
+    if 0 < home < len(aliases):
+        aliases.insert(0, aliases.pop(home))
+    return aliases
+
+
+def get_or_404(model, pk):
+    '''
+    model.objects.get(pk=pk) from the shard that holds it. A copy left in a shard the forum
+    was moved out of (see rebalance_shards) is ignored, checking the shard of its forum
+    '''
+    for alias in shards_for_id(pk):
+        obj = model.objects.using(alias).filter(pk=pk).first()
+        if obj is not None and (len(shards()) == 1 or shard_of_forum_id(forum_id_of(obj)) == alias):
+            return obj
+    raise Http404(f'No {model._meta.object_name} matches the given query.')
+
+
+def is_forum(obj):
+    return obj._meta.app_label == 'forums' and obj._meta.model_name == 'forum'
+
+
+def shard_of_new(instance):
+    '''The shard of an unsaved object: the one of the forum or content its foreign keys point to'''
+    for field in instance._meta.concrete_fields:
+        if field.is_relation:
+            related = field.get_cached_value(instance, default=None)
+            if related is not None and is_forum(related):
+                return shard_of(related)
+            if related is not None and is_sharded(related) and related._state.db is not None:
+                return related._state.db
+    if getattr(instance, 'forum_id', None) is not None:
+        return shard_of_forum_id(instance.forum_id)
+    return None
+
+
+def forum_id_of(obj):
+    if hasattr(obj, 'forum_id'):
+        return obj.forum_id
+    return obj.thread_post().forum_id  # A comment
+
+
+def gather(queryset, *, order_by, limit):
+    '''
+    Runs queryset in every shard and merges the results: the first limit objects according
+    to order_by (field names, with - for descending order, like in QuerySet.order_by)
+    '''
+    queryset = queryset.order_by(*order_by)[:limit]
+    if len(shards()) == 1:
+        return list(queryset.using(shards()[0]))
+
+    def sort_key(obj):
+        return tuple(
+            Descending(getattr(obj, field[1:])) if field.startswith('-') else getattr(obj, field)
+            for field in order_by
+            )
+
+    results = [list(queryset.using(alias)) for alias in shards()]
+    return list(islice(heapq.merge(*results, key=sort_key), limit))
+
+
+class Descending:
+    '''Wraps a value so it sorts in reverse order'''
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+class ShardRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'archive':
+            return None  # See archive.routers
+        if not is_sharded(model):
+            return PRIMARY
+
+        if len(shards()) == 1:
+            return shards()[0]
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if is_forum(instance):
+            return shard_of(instance)
+        if is_sharded(instance):
+            if not instance._state.adding:
+                return instance._state.db
+            return shard_of_new(instance)
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded(obj1) and is_sharded(obj2):
+            # A new object might not know its shard until all its foreign keys are set
+            return obj1._state.adding or obj2._state.adding or obj1._state.db == obj2._state.db
+        return True  # Content is linked to users, members and forums of the primary by id
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'archive' or model_name is None:
+            return None
+        if (app_label, model_name) in SHARDED_MODELS:
+            return db in shards()
+        return db == PRIMARY
+
+
+def last_id(using, table):
+    '''The last id given in table of the shard using (the biggest one for dbs other than sqlite)'''
+    from django.db import connections
+
+    with connections[using].cursor() as cursor:
+        if connections[using].vendor == 'sqlite':
+            cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = %s', [table])
+        else:
+            cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+        return cursor.fetchone()[0]
+
+
+@contextmanager
+def keeping_id_blocks(using):
+    '''
+    For copying content with its ids from another shard into the shard using. SQLite would go on
+    numbering the new rows of a table after the biggest id in it, which can be one of the block
+    of the other shard, so when the copy moves the numbering of using forward it is moved again,
+    to the start of a block none of the shards has reached yet
+    '''
+    from django.db import connections
+
+    if connections[using].vendor != 'sqlite':
+        yield  # PostgreSQL sequences do not change when ids are given explicitly
+        return
+    before = {table: last_id(using, table) for table in ID_BLOCK_TABLES}
+    yield
+    for table in ID_BLOCK_TABLES:
+        if last_id(using, table) > before[table]:
+            start = (max(last_id(alias, table) for alias in shards()) // SHARD_ID_BLOCK + 1) * SHARD_ID_BLOCK
+            with connections[using].cursor() as cursor:
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [start, table])
+
+
+def seed_id_blocks(using, **kwargs):
+    '''
+    post_migrate receiver: makes the ids of the posts and comments of shard number i start at
+    i * SHARD_ID_BLOCK. Only needed, and only done, for sqlite and postgresql shards
+    '''
+    from django.db import connections
+
+    if using not in shards() or shards().index(using) == 0:
+        return
+    start = shards().index(using) * SHARD_ID_BLOCK
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for table in ID_BLOCK_TABLES:
+            if connection.vendor == 'sqlite':
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) SELECT %s, 0 '
+                    'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                    [table, table]
+                    )
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s', [start, table, start])
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'SELECT setval(pg_get_serial_sequence(%s, \'id\'), GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {table})))',
+                    [table, start]
+                    )
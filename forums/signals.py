@@ -0,0 +1,53 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.contrib.auth.models import User
+
+from . import forum_cache, sharding
+from members.models import Member
+from comments.models import Comment, CommentVote
+from .models import Forum, Post, PostVote, ActivityEvent, ForumActivity
+from .name_index import forum_name_index
+
+
+@receiver(post_save, sender=Forum)
+def index_forum_name(sender, instance, created, **kwargs):
+    if created and instance.real_name is not None:
+        forum_name_index.add_on_commit(instance.real_name)
+
+
+@receiver(post_delete, sender=Forum)
+def unindex_forum_name(sender, instance, **kwargs):
+    if instance.real_name is not None:
+        forum_name_index.remove_on_commit(instance.real_name)
+
+
+@receiver(post_save, sender=Forum)
+@receiver(post_delete, sender=Forum)
+def uncache_forum(sender, instance, **kwargs):
+    forum_cache.invalidate(instance)
+
+
+# Forums, members and users are in the primary db and their content might be in the shards (see
+# forums.sharding), so the content is deleted here instead of by an ON DELETE CASCADE. Deleting
+# posts and comments still cascades to their replies, votes and activity, inside their shard
+
+@receiver(pre_delete, sender=Forum)
+def delete_forum_content(sender, instance, **kwargs):
+    shard = sharding.shard_of(instance)
+    Post.objects.using(shard).filter(forum_id=instance.pk).delete()
+    ActivityEvent.objects.using(shard).filter(forum_id=instance.pk).delete()
+    ForumActivity.objects.using(shard).filter(forum_id=instance.pk).delete()
+
+
+@receiver(pre_delete, sender=Member)
+def delete_member_content(sender, instance, **kwargs):
+    for shard in sharding.shards():
+        Post.objects.using(shard).filter(poster_id=instance.pk).delete()
+        Comment.objects.using(shard).filter(commenter_id=instance.pk).delete()
+
+
+@receiver(pre_delete, sender=User)
+def delete_user_votes(sender, instance, **kwargs):
+    for shard in sharding.shards():
+        PostVote.objects.using(shard).filter(user_id=instance.pk).delete()
+        CommentVote.objects.using(shard).filter(user_id=instance.pk).delete()
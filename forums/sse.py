@@ -0,0 +1,94 @@
+'''
+ASGI app streaming the live updates of a post (/live/post/<pk>/) or of a comment and its replies
+(/live/comment/<pk>/) as Server-Sent Events. Mounted in front of django by forum_app.asgi.
+
+Django 4.0 can only stream responses from a sync iterator, which would hold a thread per open
+stream, so this is a plain ASGI app: an idle stream is a coroutine waiting on its Subscription
+(see forums.live), and one worker can hold thousands of them. The db is only used once per
+stream, to check that the post/comment exists.
+
+Events are "comment", "edit" and "points" (data is json), and "reset" when the reader fell too
+far behind. After LIVE_KEEPALIVE_SECONDS without events a comment line is sent, so proxies do
+not close idle streams.
+'''
+import re
+import json
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
+from django.db import close_old_connections
+
+from . import live, sharding
+from .models import Post
+from comments.models import Comment
+
+PATH = re.compile(r'^/live/(post|comment)/(\d+)/$')
+
+HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),  # nginx would buffer the stream otherwise
+]
+
+
+def exists(kind, pk):
+    try:
+        sharding.get_or_404(Post if kind == 'post' else Comment, pk)
+        return True
+    except Http404:
+        return False
+    finally:
+        close_old_connections()
+
+
+def format_event(kind, data=None):
+    return f'event: {kind}\ndata: {json.dumps(data)}\n\n'.encode()
+
+
+async def send_status(send, status, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def live_updates(scope, receive, send):
+    match = PATH.match(scope['path'])
+    if match is None:
+        return await send_status(send, 404, b'Not Found')
+    if scope['method'] != 'GET':
+        return await send_status(send, 405, b'Method Not Allowed')
+    kind, pk = match[1], int(match[2])
+    if not await sync_to_async(exists)(kind, pk):
+        return await send_status(send, 404, b'Not Found')
+
+    topic = live.post_topic(pk) if kind == 'post' else live.comment_topic(pk)
+    subscription = live.hub.subscribe(topic)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': HEADERS})
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+        while True:
+            ready = asyncio.ensure_future(subscription.ready.wait())
+            await asyncio.wait({ready, disconnected}, timeout=settings.LIVE_KEEPALIVE_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+            ready.cancel()
+            if disconnected.done():
+                return
+            if not subscription.ready.is_set():
+                await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                continue
+
+            await asyncio.sleep(settings.LIVE_COALESCE_SECONDS)  # Lets a burst of votes pile up
+            if subscription.overflowed:
+                await send({'type': 'http.response.body', 'body': format_event('reset'), 'more_body': False})
+                return
+            body = b''.join(format_event(event_kind, data) for event_kind, data in subscription.take())
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        live.hub.unsubscribe(subscription)
+        disconnected.cancel()
@@ -0,0 +1,68 @@
+import math
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from django.db import transaction
+from django.db.models import F, FloatField, Subquery, Value
+from django.db.models.functions import Coalesce, Exp
+
+from .models import Forum, TrendingEpoch
+
+# How trending a forum is: every post, comment, vote and join adds its weight
+# (settings.TRENDING_WEIGHTS) to the forum's score, and the score halves every
+# settings.TRENDING_HALF_LIFE seconds.
+#
+# Decaying every score all the time would mean rewriting every forum row, so instead we store
+# the scores relative to an epoch: an event at time t adds weight * e^(decay_rate * (t - epoch)).
+# Every stored score is the real score multiplied by the same factor e^(decay_rate * (now - epoch)),
+# so ordering by the stored score is ordering by the real one: the top-N is a single scan of the
+# index over Forum.trending_score, and an event is a single UPDATE of one row.
+#
+# The stored values grow exponentially, so renormalize() (the renormalize_trending command) must run
+# periodically: it moves the epoch to now and scales every score down accordingly.
+
+
+def decay_rate():
+    return math.log(2) / settings.TRENDING_HALF_LIFE
+
+
+def bump(forum_id, kind):
+    '''
+    Adds the weight of an event of the given kind ('post', 'comment', 'vote' or 'join') to the forum's
+    score. New posts and comments also move the forum's last_activity_at to now, in the same UPDATE
+    '''
+    epoch = Subquery(TrendingEpoch.objects.values('started_at')[:1])
+    increment = Value(settings.TRENDING_WEIGHTS[kind]) * Exp(
+        (Value(time.time()) - epoch) * Value(decay_rate()), 
+        output_field=FloatField()
+        )
+    # If the epoch row is missing the score is left as it is instead of becoming NULL
+    updates = {'trending_score': F('trending_score') + Coalesce(increment, Value(0.0))}
+    if kind in ('post', 'comment'):
+        updates['last_activity_at'] = timezone.now()
+    Forum.objects.filter(pk=forum_id).update(**updates)
+
+
+def renormalize():
+    '''Moves the epoch to now, scaling every score so the order and the real scores stay the same'''
+    now = time.time()
+    with transaction.atomic():
+        epoch = TrendingEpoch.objects.select_for_update().first()
+        if epoch is None:
+            TrendingEpoch.objects.create(started_at=now)
+            return
+        factor = math.exp(-decay_rate() * (now - epoch.started_at))
+        Forum.objects.exclude(trending_score=0).update(trending_score=F('trending_score') * factor)
+        epoch.started_at = now
+        epoch.save(update_fields=['started_at'])
+
+
+def trending_forums(limit=20):
+    '''The limit most trending forums, each with its current (decayed) score as .current_trending_score'''
+    forums = list(Forum.objects.order_by('-trending_score', 'pk')[:limit])
+    epoch = TrendingEpoch.objects.first()
+    factor = math.exp(-decay_rate() * (time.time() - epoch.started_at)) if epoch else 0
+    for forum in forums:
+        forum.current_trending_score = forum.trending_score * factor
+    return forums
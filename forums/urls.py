@@ -6,6 +6,8 @@ app_name = 'forums'
 urlpatterns = [
     path('', views.show_forums, name='forums_home'),
     path('create/', views.create_forum, name='create_forum'),
+    path('trending/', views.show_trending_forums, name='trending_forums'),
+    path('points/', views.bulk_points, name='bulk_points'),
     path('post/<int:post_id>/', views.show_post, name='show_post'),
     path('post/<int:post_id>/reply/', views.reply_post, name='reply_post'),
     path('post/<int:post_id>/edit', views.edit_post, name='edit_post'),
@@ -1,28 +1,72 @@
 from django.db.models import Q
 from django.urls import reverse
 from django.contrib import messages
-from django.http import HttpResponseRedirect
+from django.conf import settings
+from django.http import Http404, HttpResponseRedirect, HttpResponseBadRequest, JsonResponse
+from django.utils import timezone
 from django.core.exceptions import PermissionDenied
-from django.views.decorators.http import require_POST
-from django.shortcuts import render, get_object_or_404
+from django.views.decorators.http import require_GET, require_POST
+from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 
+from . import activity, duplicates, forum_cache, live, points, sharding, trending
+from abstract_models.vote import Vote, vote_response
+from archive.views import show_archived_post
+from comments import pagination
+from members import profile_cache
+from members.throttling import throttle_writes
 from .models import Forum, Post, PostVote, TooSimilarNameException
 
 def show_forums(request):
     like = request.GET.get('q', None)
-    if like:
-        return render(request, 'forums/forums.html',{
-            'forums_list': Forum.objects.filter(name__icontains = like)
-        })
-    else:
-        return render(request, 'forums/forums.html', {
-            'forums_list': Forum.objects.all()
-        })
+    forums = Forum.objects.filter(name__icontains = like) if like else Forum.objects.all()
+    if request.GET.get('sort') == 'active':  # Most recently active first, an index scan
+        forums = forums.order_by('-last_activity_at')
+    return render(request, 'forums/forums.html', {
+        'forums_list': forums
+    })
+
+
+def show_trending_forums(request):
+    return render(request, 'forums/trending.html', {
+        'forums_list': trending.trending_forums()
+    })
+
+
+def parse_ids(value):
+    '''"1,2,3" -> [1, 2, 3], ValueError if any of them is not a number that fits in the db'''
+    ids = [int(pk) for pk in value.split(',') if pk] if value else []
+    if not all(map(pagination.is_integer, ids)):
+        raise ValueError(f'Invalid ids {value!r}')
+    return ids
+
+
+@require_GET
+def bulk_points(request):
+    '''
+    Current scores of the posts and comments with the given ids (?posts=1,2&comments=3), to refresh
+    the ones a page shows in a single request. Answers
+    {"posts": {"1": [points, replies, vote], ...}, "comments": {...}}, where vote is the one of the
+    user ('U', 'D' or null). Ids that do not exist are left out.
+    '''
+    try:
+        post_ids = parse_ids(request.GET.get('posts'))
+        comment_ids = parse_ids(request.GET.get('comments'))
+    except ValueError:
+        return HttpResponseBadRequest('posts and comments must be comma separated ids')
+    if len(post_ids) + len(comment_ids) > settings.BULK_POINTS_MAX_IDS:
+        return HttpResponseBadRequest(f'At most {settings.BULK_POINTS_MAX_IDS} ids per request')
+
+    response = JsonResponse({
+        'posts': points.post_scores(post_ids, request.user) if post_ids else {},
+        'comments': points.comment_scores(comment_ids, request.user) if comment_ids else {},
+    }, json_dumps_params={'separators': (',', ':')})
+    response['Cache-Control'] = 'private, no-cache'  # Votes of the user
+    return response
 
 
 def show_forum(request, forum_name):
-    forum = get_object_or_404(Forum, name=forum_name)
+    forum = forum_cache.get_forum_by_name_or_404(forum_name)
     if request.user.is_authenticated:
         member = request.user.member
         belongs = forum.members.all().contains(member)
@@ -35,7 +79,7 @@ def show_forum(request, forum_name):
             Q(content__icontains = request.GET['q'])
             ).order_by('points')
     else:
-        posts = forum.post_set.order_by('-pub_date')[:15]
+        posts = forum.post_set.order_by('-last_comment_at')[:15]  # Threads with new comments go up
 
     return render(request, 'forums/forum.html', {
         'forum': forum,
@@ -47,10 +91,11 @@ def show_forum(request, forum_name):
 @login_required
 @require_POST
 def join_forum(request, forum_name):
-    forum = get_object_or_404(Forum, name=forum_name)
+    forum = forum_cache.get_forum_by_name_or_404(forum_name)
 
     if not forum.members.all().contains(request.user.member):  #  If the user is not already in forum
         forum.members.add(request.user.member)
+        trending.bump(forum.pk, 'join')
     
     return HttpResponseRedirect(reverse('forums:show_forum', args=(forum_name,)))
 
@@ -58,7 +103,7 @@ def join_forum(request, forum_name):
 @login_required
 @require_POST
 def leave_forum(request, forum_name):
-    forum = get_object_or_404(Forum, name=forum_name)
+    forum = forum_cache.get_forum_by_name_or_404(forum_name)
 
     if forum.members.all().contains(request.user.member):  # If the user is in the forum
         forum.members.remove(request.user.member)
@@ -110,24 +155,31 @@ def create_forum(request):
 
 
 def show_post(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    post_replies = post.comment_set.all()
+    try:
+        post = sharding.get_or_404(Post, post_id)
+    except Http404:
+        return show_archived_post(request, post_id)  # 404 if it is not archived either
+    page = pagination.get_page(post.comment_set.all(), sort=request.GET.get('sort'), cursor=request.GET.get('after'))
 
     return render(request, 'forums/post.html', {
         'post': post,
-        'replies': post_replies
+        'replies': page.comments,
+        'page': page
     })
 
 
 @login_required
 def edit_post(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = sharding.get_or_404(Post, post_id)
     if request.method == 'POST' and post.was_posted_by(request.user.member):
         new_content = request.POST.get('new_content', '').strip()
         if new_content:
             post.edited = True
             post.content = new_content
-            post.save(update_fields=['content', 'edited'])
+            post.simhash = duplicates.simhash(new_content)
+            post.save(update_fields=['content', 'edited', 'simhash', 'last_modified'])
+            duplicates.refingerprint(post, post)
+            live.post_edited(post)
 
             return HttpResponseRedirect(
                 reverse('forums:show_post', args=(post.pk,))
@@ -154,12 +206,13 @@ def edit_post(request, post_id):
 @login_required
 @require_POST
 def delete_post(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = sharding.get_or_404(Post, post_id)
     
     if post.was_posted_by(request.user.member):
         title = post.title
-        forum_name = post.forum.name
+        forum_name = post.cached_forum.name
         post.delete()
+        profile_cache.invalidate(post.poster_id)
 
         messages.add_message(
             request,
@@ -183,53 +236,66 @@ def do_vote_stuff(post, * , user, vote_record=None, upvoting=False, downvoting=F
         - vote_record: a postVote object (models.postVote) if the post was already upvoted/downvoted
         - upvoting: True if user wants to upvote post, else False
         - downvoting: True if user wants to downvote post, else false
+
+    Returns the kind of the vote of user once done (Vote.UPVOTE, Vote.DOWNVOTE or None)
     '''
+    removed = added = None  # Kinds of vote taken back and cast, for the activity log
     if vote_record: # Has voted before
         if vote_record.is_upvote():
             if upvoting:
                 post.points -= 1  # Removing the upvote
                 vote_record.delete()
+                removed = Vote.UPVOTE
             elif downvoting:
                 post.points -= 2  # Removing upvote effect and downvoting
+                removed, added = Vote.UPVOTE, Vote.DOWNVOTE
 
                 vote_record.kind_of_vote = 'D'  # Updating vote record
-                vote_record.save(update_fields=['kind_of_vote'])     
+                vote_record.voted_at = timezone.now()
+                vote_record.save(update_fields=['kind_of_vote', 'voted_at'])     
 
         elif vote_record.is_downvote():
             if upvoting:
                 post.points += 2  # Remove downvt effects and upvoting
+                removed, added = Vote.DOWNVOTE, Vote.UPVOTE
 
                 vote_record.kind_of_vote = 'U'  # Updating vote record
-                vote_record.save(update_fields=['kind_of_vote'])
+                vote_record.voted_at = timezone.now()
+                vote_record.save(update_fields=['kind_of_vote', 'voted_at'])
                 
             elif downvoting:
                 post.points += 1  # Removing the downvote
                 vote_record.delete()
+                removed = Vote.DOWNVOTE
 
     else:  # Voting first time
         if upvoting:
             post.points += 1
+            added = Vote.UPVOTE
 
             # Creating vote record
-            PostVote.objects.create(
-            post=post,
+            post.postvote_set.create(
             user=user,
             kind_of_vote='U'
         )
 
         elif downvoting:
             post.points -= 1
+            added = Vote.DOWNVOTE
 
-            PostVote.objects.create(
-            post=post,
+            post.postvote_set.create(
             user=user,
             kind_of_vote='D'
         )
 
-    post.save(update_fields=['points'])  # Saving changes
+    post.save(update_fields=['points', 'last_modified'])  # Saving changes
+    activity.record_vote_change(post, removed=removed, added=added)
+    live.points_changed(post)
+    return added  # Removing a vote leaves the user without one
 
 @login_required
 @require_POST
+@throttle_writes('vote')
 def upvote_post(request, post_id):
 
     # If the user upvoted the post from /forums/forum_name
@@ -240,54 +306,61 @@ def upvote_post(request, post_id):
         reverse('forums:show_post', args=(post_id,))
         )
     
-    post = get_object_or_404(Post, pk=post_id)
+    post = sharding.get_or_404(Post, post_id)
 
     try:
-        vote_record = PostVote.objects.get(post=post, user=request.user)
+        vote_record = post.postvote_set.get(user=request.user)
     except PostVote.DoesNotExist:
         vote_record = None
     
-    do_vote_stuff(post, vote_record=vote_record, user=request.user, upvoting=True)
+    kind_of_vote = do_vote_stuff(post, vote_record=vote_record, user=request.user, upvoting=True)
 
-    return HttpResponseRedirect(redirection_url)
+    return vote_response(request, post.points, kind_of_vote, redirection_url)
         
 
 @login_required
 @require_POST
+@throttle_writes('vote')
 def downvote_post(request, post_id):
     redirection_url = request.META.get(
         'HTTP_REFERER', 
         reverse('forums:show_post', args=(post_id,))
         )
 
-    post = get_object_or_404(Post, pk=post_id)
+    post = sharding.get_or_404(Post, post_id)
     
     try:
-        vote_record = PostVote.objects.get(post=post, user=request.user)
+        vote_record = post.postvote_set.get(user=request.user)
     except PostVote.DoesNotExist:
         vote_record = None
     
-    do_vote_stuff(post, vote_record=vote_record, user=request.user, downvoting=True)
+    kind_of_vote = do_vote_stuff(post, vote_record=vote_record, user=request.user, downvoting=True)
 
-    return HttpResponseRedirect(redirection_url)
+    return vote_response(request, post.points, kind_of_vote, redirection_url)
 
 
 @login_required
+@throttle_writes('post')
 def publish_post(request, forum_name):
-    forum = get_object_or_404(Forum, name=forum_name)
+    forum = forum_cache.get_forum_by_name_or_404(forum_name)
     if request.method == 'POST' and forum.members.contains(request.user.member):
         # Using .get() to avoid KeyError, '' as default to avoid AtributeError
         # .strip() to remove leading spaces
         title = request.POST.get('post_title', '').strip()
         content = request.POST.get('post_content', '').strip()
-        if all((title, content)):  # True if both are NOT empty string nor blank
+        simhash, duplicate = duplicates.check(content, forum.pk, sharding.shard_of(forum))
+        if all((title, content)) and not duplicates.rejects(duplicate):  # True if both are NOT empty string nor blank
             post = Post(
                 forum=forum, 
                 poster=request.user.member, 
                 title=title, 
-                content=content
+                content=content,
+                simhash=simhash
                 )
             post.save()
+            duplicates.fingerprint(post, post, near_duplicate=duplicate is not None)
+            activity.record_post(post)
+            profile_cache.invalidate(post.poster_id)
             return HttpResponseRedirect(
                 reverse('forums:show_post', args=(post.pk,))
                 )
@@ -296,7 +369,8 @@ def publish_post(request, forum_name):
             messages.add_message(
                 request, 
                 messages.INFO,
-                'Please fill all the fields'
+                'Please fill all the fields' if not all((title, content)) else
+                'That looks like a copy of something recently published in this forum.'
                 )
             return render(request, 'forums/publish_post.html', {
                 'forum_name': forum.name
@@ -319,7 +393,7 @@ def publish_post(request, forum_name):
 
 
 def reply_post(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = sharding.get_or_404(Post, post_id)
     return render(request, 'forums/reply_post.html', {
         'post' : post,
     })
\ No newline at end of file
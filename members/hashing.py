@@ -0,0 +1,66 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.hashers import check_password, make_password
+
+# PBKDF2 takes tens of milliseconds of CPU per password. The login and singup views run it here
+# instead of in the thread serving the request, so a burst of logins can use at most
+# PASSWORD_HASHING_WORKERS threads, queueing the rest, and never all the threads that serve pages.
+# Only pure hashing runs in this pool, never db queries: those threads have their own db
+# connections that would never be closed.
+HASHING_EXECUTOR = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASHING_WORKERS,
+    thread_name_prefix='password-hashing'
+    )
+
+
+async def run_hashing(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(HASHING_EXECUTOR, func, *args)
+
+
+def _check_password(raw_password, encoded):
+    '''
+    Same as django.contrib.auth.hashers.check_password but, instead of saving the upgraded hash if
+    the hasher changed, it is returned as second value (None if the hash does not need to be upgraded)
+    '''
+    upgraded = []
+    is_correct = check_password(
+        raw_password,
+        encoded,
+        setter=lambda raw_password: upgraded.append(make_password(raw_password))
+        )
+    return is_correct, upgraded[0] if upgraded else None
+
+
+def _get_user(username):
+    try:
+        return User._default_manager.get_by_natural_key(username)
+    except User.DoesNotExist:
+        return None
+
+
+async def authenticate_off_thread(username, password):
+    '''
+    Does the same as django.contrib.auth.backends.ModelBackend.authenticate (the only authentication
+    backend we use), but the password is hashed in HASHING_EXECUTOR. Returns the user or None.
+    '''
+    if username is None or password is None:
+        return None
+
+    user = await sync_to_async(_get_user)(username)
+    if user is None:
+        # Hashing anyway to reduce the timing difference between an existing and a nonexistent user
+        await run_hashing(make_password, password)
+        return None
+
+    is_correct, upgraded_password = await run_hashing(_check_password, password, user.password)
+    if not is_correct or not user.is_active:
+        return None
+
+    if upgraded_password is not None:
+        user.password = upgraded_password
+        await sync_to_async(user.save)(update_fields=['password'])
+    return user
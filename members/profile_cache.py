@@ -0,0 +1,98 @@
+'''
+Cached profile data of the members, in the 'objects' cache: the member (with its user) and the
+ids of its most recent posts, for show_profile and show_member.
+
+Only ids are cached, the posts themselves are read (by primary key, in the shards that hold
+them) on every request, so their points, edits and votes are always fresh. The entry of a member
+is deleted when it is saved or deleted (edit_profile, delete_account, see members.signals) and
+by the views that change its posts (publish_post and delete_post).
+Posts that leave by other ways (archiving, moves between shards) are noticed when they are not
+found anymore, and the entry is rebuilt.
+'''
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from monitoring import metrics
+from forums import sharding
+from forums.models import Post
+from .models import Member
+
+RECENT_POSTS = 5
+
+
+def cache():
+    return caches['objects']
+
+
+def profile_key(user_pk):
+    return f'profile:{user_pk}'
+
+
+def username_key(username):
+    # Hashing the username because usernames can contain characters that are not valid in cache keys
+    return f'profile:username:{hashlib.md5(username.encode()).hexdigest()}'
+
+
+def _load(**lookup):
+    '''The profile entry of the member matching lookup, read from the dbs. None if there is no such member'''
+    member = Member.objects.select_related('user').filter(**lookup).first()
+    if member is None:
+        return None
+    recent = sharding.gather(
+        Post.objects.filter(poster_id=member.pk).only('pk', 'pub_date'), order_by=('-pub_date',), limit=RECENT_POSTS
+        )
+    profile = {'member': member, 'recent_posts': [(post._state.db, post.pk) for post in recent]}
+    cache().set_many(
+        {profile_key(member.pk): profile, username_key(member.user.username): member.pk},
+        settings.PROFILE_CACHE_TIMEOUT
+        )
+    return profile
+
+
+def get_profile(user_pk):
+    profile = cache().get(profile_key(user_pk))
+    metrics.cache_lookups.inc('profile', 'hit' if profile else 'miss')
+    return profile or _load(pk=user_pk)
+
+
+def get_profile_by_username(username):
+    '''None if there is no member with that username'''
+    user_pk = cache().get(username_key(username))
+    metrics.cache_lookups.inc('username', 'miss' if user_pk is None else 'hit')
+    if user_pk is not None:
+        return get_profile(user_pk)
+    return _load(user__username=username)
+
+
+def _fetch_posts(profile):
+    pks_by_shard = defaultdict(list)
+    for shard, pk in profile['recent_posts']:
+        pks_by_shard[shard].append(pk)
+    found = {}
+    for shard, pks in pks_by_shard.items():
+        found.update((post.pk, post) for post in Post.objects.using(shard).filter(pk__in=pks))
+    return [found[pk] for shard, pk in profile['recent_posts'] if pk in found]
+
+
+def recent_posts(profile):
+    '''
+    The recent posts of profile, in order. Their poster is the cached member, so rendering
+    them does not look it up again
+    '''
+    posts = _fetch_posts(profile)
+    if len(posts) < len(profile['recent_posts']):  # Archived or moved to another shard since cached
+        profile = _load(pk=profile['member'].pk)
+        if profile is None:
+            return []
+        posts = _fetch_posts(profile)
+    for post in posts:
+        post.poster = profile['member']
+    return posts
+
+
+def invalidate(user_pk, username=None):
+    '''Deletes the profile entry of a member, and the username one when given (the member is leaving)'''
+    cache().delete_many([profile_key(user_pk)] + ([username_key(username)] if username is not None else []))
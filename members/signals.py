@@ -0,0 +1,17 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.models import User
+
+from . import profile_cache
+from .models import Member
+
+
+@receiver(post_save, sender=Member)
+@receiver(post_delete, sender=Member)
+def uncache_profile(sender, instance, **kwargs):
+    profile_cache.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def uncache_username(sender, instance, **kwargs):
+    profile_cache.invalidate(instance.pk, instance.username)
@@ -0,0 +1,149 @@
+import math
+import time
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+from abstract_models.vote import wants_json
+from monitoring import metrics
+
+
+class SlidingWindowThrottle:
+    '''
+    Counts the attempts of an action (login, singup...) made by an identifier (ip, username) and
+    tells if a new one is allowed, according to the (attempts, seconds) pair of settings.AUTH_THROTTLE_RATES[scope]
+    (or of the settings dict named by rates_setting).
+
+    It uses the "sliding window counter" approximation: we keep one counter per fixed window in the
+    cache, and estimate the attempts made in the last `seconds` as the count of the current window
+    plus the part of the previous window that is still inside the sliding one. This only needs two
+    cache keys per identifier, no matter how many attempts were made.
+    '''
+    def __init__(self, scope, rates_setting='AUTH_THROTTLE_RATES'):
+        self.scope = scope
+        self.rates_setting = rates_setting
+
+    def _key(self, ident, window_number):
+        # Hashing the identifier because usernames can contain characters that are not valid in cache keys
+        digest = hashlib.md5(str(ident).encode()).hexdigest()
+        return f'throttle:{self.scope}:{digest}:{window_number}'
+
+    @property
+    def rate(self):
+        return getattr(settings, self.rates_setting)[self.scope]
+
+    def allow(self, ident):
+        '''Returns True and records the attempt if ident can do one more attempt, else returns False'''
+        limit, window = self.rate
+        now = time.time()
+        window_number = int(now // window)
+        current_key = self._key(ident, window_number)
+        previous_key = self._key(ident, window_number - 1)
+
+        counts = cache.get_many([current_key, previous_key])
+        elapsed_fraction = (now % window) / window
+        estimated = counts.get(previous_key, 0) * (1 - elapsed_fraction) + counts.get(current_key, 0)
+        if estimated >= limit:
+            return False
+
+        # The counter has to survive the next window, where it will be the previous one
+        cache.add(current_key, 0, timeout=2 * window)
+        try:
+            cache.incr(current_key)
+        except ValueError:  # The key expired between add() and incr()
+            cache.set(current_key, 1, timeout=2 * window)
+        return True
+
+
+class TokenBucketThrottle:
+    '''
+    Token bucket for the writes of an identifier (user, ip), according to the (tokens, seconds) pair
+    of settings.WRITE_THROTTLE_RATES[scope]: a full bucket holds `tokens` tokens, every write takes
+    one and the bucket fills up again at tokens / seconds tokens per second. Bursts up to the size
+    of the bucket go through, a sustained flood is held to the refill rate.
+
+    The bucket is a single (tokens, updated at) cache entry, refilled lazily when it is read. It
+    expires once it would be full again, so idle identifiers take no room. Reading and writing it
+    is not atomic: concurrent writes of the same identifier can take the same token, which lets a
+    few more writes through but never blocks a writer that is below the limit.
+    '''
+    def __init__(self, scope, rates_setting='WRITE_THROTTLE_RATES'):
+        self.scope = scope
+        self.rates_setting = rates_setting
+
+    def _key(self, ident):
+        digest = hashlib.md5(str(ident).encode()).hexdigest()
+        return f'bucket:{self.scope}:{digest}'
+
+    @property
+    def rate(self):
+        return getattr(settings, self.rates_setting)[self.scope]
+
+    def take(self, ident):
+        '''Takes a token of ident and returns 0, or the seconds until there is one if the bucket is empty'''
+        capacity, seconds = self.rate
+        refill_rate = capacity / seconds
+        now = time.time()
+        key = self._key(ident)
+
+        tokens, updated_at = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        if tokens < 1:
+            return (1 - tokens) / refill_rate
+        tokens -= 1
+        cache.set(key, (tokens, now), timeout=math.ceil((capacity - tokens) / refill_rate))
+        return 0
+
+    def allow(self, ident):
+        return self.take(ident) == 0
+
+
+login_per_ip = SlidingWindowThrottle('login_per_ip')
+login_per_username = SlidingWindowThrottle('login_per_username')
+singup_per_ip = SlidingWindowThrottle('singup_per_ip')
+data_export_per_user = SlidingWindowThrottle('data_export_per_user', rates_setting='DATA_EXPORT_THROTTLE_RATES')
+data_export_site_wide = SlidingWindowThrottle('data_export_site_wide', rates_setting='DATA_EXPORT_THROTTLE_RATES')
+
+write_throttles = {
+    action: (TokenBucketThrottle(f'{action}_per_user'), TokenBucketThrottle(f'{action}_per_ip'))
+    for action in ('post', 'comment', 'vote')
+}
+
+
+def get_client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def throttle_writes(action):
+    '''
+    View decorator limiting the POSTs of a write view (action is 'post', 'comment' or 'vote') per
+    user and per ip, see TokenBucketThrottle. It goes below login_required, and rejected writes are
+    answered with a 429 before the view touches the db.
+    '''
+    per_user, per_ip = write_throttles[action]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method == 'POST':
+                for throttle, ident in ((per_ip, get_client_ip(request)), (per_user, request.user.pk)):
+                    wait = throttle.take(ident)
+                    if wait:
+                        metrics.throttled_writes.inc(action)
+                        return write_throttled_response(request, wait)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def write_throttled_response(request, wait):
+    message = 'You are writing too fast, please wait a moment and try again.'
+    if wants_json(request):
+        response = JsonResponse({'error': message}, status=429)
+    else:
+        response = HttpResponse(message, content_type='text/plain', status=429)
+    response['Retry-After'] = math.ceil(wait)
+    return response
@@ -9,6 +9,7 @@ urlpatterns = [
     path('profile/', views.show_profile, name='profile'),
     path('profile/edit', views.edit_profile, name='edit_profile'),
     path('profile/delete', views.delete_account, name='delete_account'),
+    path('profile/export', views.export_data, name='export_data'),
     path('members/<str:member_username>', views.show_member, name='show_member'),
     path('feed/', views.user_feed, name='feed')
 ]
\ No newline at end of file
@@ -1,26 +1,55 @@
-from django.db.models import Q
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.db.models import Max, Q
 from django.urls import reverse
 from django.contrib import messages
 from django.db.utils import IntegrityError
 from django.contrib.auth.models import User
-from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponseRedirect
+from django.shortcuts import render
+from django.http import Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import login, logout
+from django.contrib.auth.hashers import make_password
 
+from . import profile_cache
 from .models import Member
+from .hashing import authenticate_off_thread, run_hashing
+from .throttling import login_per_ip, login_per_username, singup_per_ip, get_client_ip
+from .throttling import data_export_per_user, data_export_site_wide
+from .data_export import export_lines
+from forums import sharding
 from forums.models import Post
+from comments import pagination
 from comments.models import Comment
 
 
-def login_user(request):
+def throttled_response(request, template_name, throttle):
+    '''Renders template_name with a 429 status code, to be used when throttle rejected an attempt'''
+    messages.add_message(
+        request,
+        messages.ERROR,
+        'Too many attempts, please wait a moment and try again.'
+    )
+    response = render(request, template_name, {}, status=429)
+    response['Retry-After'] = throttle.rate[1]
+    return response
+
+
+async def login_user(request):
     if request.method == 'POST':
         username = request.POST.get('username')
         password = request.POST.get('password')
-        user = authenticate(request, username=username, password=password)
+
+        # Throttling is checked before hashing anything, so a flood of attempts is cheap to reject
+        for throttle, ident in ((login_per_ip, get_client_ip(request)), (login_per_username, username)):
+            if not await sync_to_async(throttle.allow)(ident):
+                return await sync_to_async(throttled_response)(request, 'members/login.html', throttle)
+
+        user = await authenticate_off_thread(username, password)
 
         if user is not None:
-            login(request, user)
+            await sync_to_async(login)(request, user)
             return HttpResponseRedirect(reverse('members:feed'))
         else:
             messages.add_message(
@@ -28,32 +57,46 @@ def login_user(request):
                 messages.ERROR,
                 'Unsuccesfull login, try again!'
             )
-            return render(request, 'members/login.html', {})
+            return await sync_to_async(render)(request, 'members/login.html', {})
+    else:
+        return await sync_to_async(render)(request, 'members/login.html', {})
+
+
+def save_new_account(request, user):
+    '''
+    Saves the given user (with its password already hashed) and creates its member, then logs it in.
+    Returns False if the username was already taken
+    '''
+    try:
+        user.save()
+    except IntegrityError:
+        return False
     else:
-        return render(request, 'members/login.html', {})
+        Member.objects.create(user=user, bio='Hello everyone, i\'m using ForumsApp!')
+        login(request, user)
+        return True
 
 
-def create_new_account(request, username, password, password_again):
+async def create_new_account(request, username, password, password_again):
     '''
     This function will handle all the account (User/Member models pair) creation process
     it is NOT meant to be used as a view, it will only be called inside singup_user view
     to reduce its cognitive complexity
     '''
     if password == password_again and ' ' not in username:  #  The user filled the form correctly
+        if not await sync_to_async(singup_per_ip.allow)(get_client_ip(request)):  # Checked before hashing the password
+            return await sync_to_async(throttled_response)(request, 'members/singup.html', singup_per_ip)
+
         user = User(username=username)
-        user.set_password(password)
-        try:
-            user.save()
-        except IntegrityError:
+        user.password = await run_hashing(make_password, password)
+        if not await sync_to_async(save_new_account)(request, user):
             messages.add_message(
                 request,
                 messages.ERROR,
                 'That user already exists!'
             )
-            return render(request, 'members/singup.html', {})
+            return await sync_to_async(render)(request, 'members/singup.html', {})
         else:
-            Member.objects.create(user=user, bio='Hello everyone, i\'m using ForumsApp!')
-            login(request, user)
             return HttpResponseRedirect(reverse('members:feed'))
 
     elif password != password_again:
@@ -62,7 +105,7 @@ def create_new_account(request, username, password, password_again):
             messages.ERROR,
             'Passwords were not equal!'
         )
-        return render(request, 'members/singup.html', {})
+        return await sync_to_async(render)(request, 'members/singup.html', {})
 
     elif ' ' in username:
         messages.add_message(
@@ -70,11 +113,13 @@ def create_new_account(request, username, password, password_again):
             messages.INFO,
             'Spaces are not allowed in username'
         )
-        return render(request, 'members/singup.html', {})
+        return await sync_to_async(render)(request, 'members/singup.html', {})
 
 
-def singup_user(request):
-    if not request.user.is_authenticated:  #  We dont want an already logged user to create accounts
+async def singup_user(request):
+    # request.user is loaded lazily from the session, which queries the db
+    is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+    if not is_authenticated:  #  We dont want an already logged user to create accounts
         if request.method == 'POST':
             username = request.POST.get('username', '').strip()
             password = request.POST.get('password', '')
@@ -88,7 +133,7 @@ def singup_user(request):
                 # Notice that due to the str inmutability, the password obj is not modified by .strip()
                 # Your passwd will remain the same, the strip is just to check if you sent a blank as passwd
 
-                return create_new_account(request, username ,password, password_again)
+                return await create_new_account(request, username ,password, password_again)
 
             else:
                 messages.add_message(
@@ -96,9 +141,9 @@ def singup_user(request):
                     messages.ERROR,
                     'Please fill all the fields'
                 )
-                return render(request, 'members/singup.html', {})
+                return await sync_to_async(render)(request, 'members/singup.html', {})
         else:
-            return render(request, 'members/singup.html', {})
+            return await sync_to_async(render)(request, 'members/singup.html', {})
     else:
         return HttpResponseRedirect(reverse('members:feed'))
 
@@ -110,14 +155,12 @@ def logout_user(request):
 
 @login_required
 def show_profile(request):
-    user = request.user
-    member = user.member
-    recent_posts = member.post_set.order_by('-pub_date')[:5]
+    profile = profile_cache.get_profile(request.user.pk)
 
     return render(request, 'members/profile.html', {
-        'user_name': user.username,
-        'bio_content':member.bio,
-        'posts_to_show': recent_posts,
+        'user_name': request.user.username,
+        'bio_content': profile['member'].bio,
+        'posts_to_show': profile_cache.recent_posts(profile),
         'is_owner': True
     })
 
@@ -129,7 +172,7 @@ def edit_profile(request):
         new_bio = request.POST.get('new_bio', '').strip()
         if new_bio:
             member.bio = new_bio 
-            member.save(update_fields=['bio'])
+            member.save(update_fields=['bio'])  # Uncaches the profile, see members.signals
             messages.add_message(
                 request,
                 messages.SUCCESS,
@@ -172,24 +215,50 @@ def delete_account(request):
         return render(request, 'members/delete_account.html',{})
 
 
+@login_required
+def export_data(request):
+    '''Streams everything the user wrote and voted as an NDJSON download. See members.data_export'''
+    for throttle, ident in ((data_export_per_user, request.user.pk), (data_export_site_wide, 'site')):
+        if not throttle.allow(ident):
+            response = HttpResponse(
+                'Too many data exports, please try again later.',
+                content_type='text/plain',
+                status=429
+                )
+            response['Retry-After'] = throttle.rate[1]
+            return response
+
+    response = StreamingHttpResponse(export_lines(request.user), content_type='application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="{request.user.username}-data.ndjson"'
+    return response
+
+
 @login_required
 def user_feed(request):
-    latest_posts = Post.objects.raw(
-            f'SELECT * FROM forums_post WHERE id IN \
-            (SELECT MAX(id) FROM forums_post WHERE forum_id IN \
-            (SELECT forum_id FROM forums_forum_members WHERE member_id = {request.user.pk})\
-            GROUP BY forum_id);')
+    # The latest post of every forum the user joined. The forums are in the primary db and
+    # their posts might be in different shards, so the posts are looked up shard by shard
+    forums_by_shard = defaultdict(list)
+    for forum in request.user.member.forum_set.only('pk', 'shard'):
+        forums_by_shard[sharding.shard_of(forum)].append(forum.pk)
+    latest_posts = []
+    for shard, forum_pks in forums_by_shard.items():
+        latest_pks = Post.objects.filter(forum_id__in=forum_pks).values('forum_id').annotate(latest=Max('pk')).values('latest')
+        latest_posts.extend(Post.objects.using(shard).filter(pk__in=latest_pks))
     
     # The most recent comments posted as a reply to a comment made by the user or a post
-    latest_replies = Comment.objects.filter(
-        (Q(post__poster=request.user.member) | Q(in_reply_to__commenter=request.user.member))
-        &
-        ~Q(commenter=request.user.member)
-    ).order_by('-pub_date')[:3]
+    latest_replies = sharding.gather(
+        Comment.objects.filter(
+            (Q(post__poster=request.user.member) | Q(in_reply_to__commenter=request.user.member))
+            &
+            ~Q(commenter=request.user.member)
+        ),
+        order_by=('-pub_date',),
+        limit=3
+    )
 
     return render(request, 'members/feed.html', {
         'posts_to_show': latest_posts,
-        'replies': latest_replies  # Naming context as "replies" to be able to include show_replies.html into feed template
+        'replies': pagination.add_reply_counts(latest_replies)  # Naming context as "replies" to be able to include show_replies.html into feed template
     })
 
 
@@ -198,12 +267,12 @@ def show_member(request, member_username):
         #  user trying acces to his own profile through this way.
         return HttpResponseRedirect(reverse('members:profile'))
     else:
-        user = get_object_or_404(User, username=member_username)
-        member = user.member
-        recent_posts = member.post_set.order_by('-pub_date')[:5]
+        profile = profile_cache.get_profile_by_username(member_username)
+        if profile is None:
+            raise Http404('No User matches the given query.')
         return render(request, 'members/profile.html', {
-            'user_name': user.username,
-            'bio_content': member.bio,
-            'posts_to_show': recent_posts,
+            'user_name': profile['member'].user.username,
+            'bio_content': profile['member'].bio,
+            'posts_to_show': profile_cache.recent_posts(profile),
             'is_owner': False
         })
\ No newline at end of file
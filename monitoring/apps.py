@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class MonitoringConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'monitoring'
+
+    def ready(self):
+        from . import metrics, slow_queries
+        connection_created.connect(metrics.add_execute_wrapper)
+        connection_created.connect(slow_queries.add_execute_wrapper)
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from monitoring import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        'Prints an X-Profile header that makes monitoring.profiling.ProfilingMiddleware profile the requests '
+        'sending it, for PROFILING_TOKEN_MAX_AGE seconds. For example: curl -H "$(manage.py profile_header)" ...'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'X-Profile: {profiling.sign_token()}')
+        self.stderr.write(f'Valid for {settings.PROFILING_TOKEN_MAX_AGE} seconds')
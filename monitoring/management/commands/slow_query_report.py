@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring import slow_queries
+
+
+class Command(BaseCommand):
+    help = (
+        'Adds up the entries of the slow query log (SLOW_QUERY_LOG) by query shape and prints the top shapes, '
+        'with the URL names and the call sites (python and template) that issued them.'
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Shapes shown')
+        parser.add_argument('--sort', choices=('total', 'count', 'max', 'mean'), default='total', help='Order of the shapes')
+        parser.add_argument('--log', default=None, help='Log file to read (default: SLOW_QUERY_LOG)')
+
+    def handle(self, *args, top, sort, log, **options):
+        path = log or settings.SLOW_QUERY_LOG
+        if not path:
+            raise CommandError('SLOW_QUERY_LOG is not set, pass --log')
+        entries = slow_queries.read_log(path)
+        shapes = slow_queries.report(entries, sort=sort, top=top)
+        self.stdout.write(f'{len(entries)} slow queries of {len(set(entry["shape"] for entry in entries))} shapes in {path}\n')
+        for shape in shapes:
+            self.stdout.write(
+                f'{shape.shape}  total {shape.total * 1000:.0f} ms  count {shape.count}  '
+                f'mean {shape.mean * 1000:.1f} ms  max {shape.max * 1000:.1f} ms'
+                )
+            self.stdout.write(f'    {shape.sql}')
+            for view, count in shape.views.most_common(3):
+                self.stdout.write(f'    view {view} ({count})')
+            for site, count in shape.call_sites.most_common(3):
+                self.stdout.write(f'    from {site} ({count})')
+            self.stdout.write('')
@@ -0,0 +1,284 @@
+'''
+Prometheus metrics, served in the text exposition format by monitoring:metrics (/metrics).
+
+Every process counts into the plain dicts and lists of the metrics of this module, without
+locks: an update is a dict lookup and an integer addition, which is what keeps MetricsMiddleware
+down to a few microseconds per request (under the GIL a concurrent update can very rarely be lost,
+which does not matter for metrics). With METRICS_DIR set, every process also writes a snapshot of
+its metrics to its own file there, at most every METRICS_FLUSH_SECONDS at the end of a request,
+and /metrics adds up the files of every process (worker) so any of them can answer the scrape.
+Without it, /metrics only has the numbers of the process that answers.
+'''
+import os
+import json
+import time
+import tempfile
+from pathlib import Path
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .profiling import view_name_of
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1000, 5000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+registry = []
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.series = {}  # {label values: value}
+        registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def merge(self, into, series, values):
+        into[series] = into.get(series, 0) + values
+
+    def samples(self, series, values):
+        yield self.name, series, values
+
+
+class Histogram:
+    '''A series is [count of every bucket (not cumulative), count of +Inf, sum]'''
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        registry.append(self)
+
+    def observe(self, value, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series.setdefault(label_values, [0] * (len(self.buckets) + 2))
+        series[bisect_left(self.buckets, value)] += 1  # The first bucket whose bound is >= value
+        series[-1] += value
+
+    def merge(self, into, series, values):
+        total = into.setdefault(series, [0] * (len(self.buckets) + 2))
+        for i, value in enumerate(values):
+            total[i] += value
+
+    def samples(self, series, values):
+        count = 0
+        for bound, bucket in zip(self.buckets + ('+Inf',), values):
+            count += bucket
+            yield f'{self.name}_bucket', series + (('le', bound),), count
+        yield f'{self.name}_sum', series, values[-1]
+        yield f'{self.name}_count', series, count
+
+
+request_latency = Histogram(
+    'forum_http_request_duration_seconds', 'Time to answer a request, by URL name', ('view', 'method')
+    )
+requests = Counter(
+    'forum_http_requests_total', 'Requests answered, by URL name and status code', ('view', 'method', 'status')
+    )
+request_queries = Histogram(
+    'forum_http_request_queries', 'Database queries made by a request', ('view',), QUERY_BUCKETS
+    )
+request_db_time = Histogram(
+    'forum_http_request_db_seconds', 'Time a request spent in database queries', ('view',)
+    )
+response_size = Histogram(
+    'forum_http_response_size_bytes', 'Size of the (not streamed) responses', ('view',), SIZE_BUCKETS
+    )
+writes = Counter(
+    'forum_writes_total', 'Posts, comments and votes written', ('kind',)
+    )
+throttled_writes = Counter(
+    'forum_throttled_writes_total', 'Writes rejected by members.throttling.throttle_writes', ('kind',)
+    )
+cache_lookups = Counter(
+    'forum_cache_lookups_total', 'Lookups of the read-through caches of forums and profiles', ('cache', 'result')
+    )
+
+
+def clear():
+    '''Forgets what this process counted'''
+    for metric in registry:
+        metric.series.clear()
+
+
+def snapshot():
+    # list() copies the items at once, other threads can add series meanwhile
+    return {metric.name: [[list(series), values] for series, values in list(metric.series.items())] for metric in registry}
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def render(collected):
+    '''The text exposition format of the (metric, {label values: value}) pairs of collected'''
+    lines = []
+    for metric, all_series in collected:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for label_values in sorted(all_series, key=lambda series: [str(value) for value in series]):
+            labels = tuple(zip(metric.labels, label_values))
+            for name, sample_labels, value in metric.samples(labels, all_series[label_values]):
+                label_text = ','.join(f'{label}="{_escape(label_value)}"' for label, label_value in sample_labels)
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+# File of this process in METRICS_DIR, named after its pid and start so a later process reusing
+# the pid does not take the numbers of an earlier one as its own
+_file = {'owner': None, 'path': None, 'flushed_at': 0.0}
+
+
+def _own_file():
+    owner = (os.getpid(), str(settings.METRICS_DIR))
+    if _file['owner'] != owner:
+        _file['owner'] = owner
+        _file['path'] = Path(settings.METRICS_DIR, f'{os.getpid()}-{time.time_ns()}.json')
+    return _file['path']
+
+
+def flush():
+    '''Writes the snapshot of this process to its file of METRICS_DIR, atomically'''
+    _file['flushed_at'] = time.monotonic()
+    path = _own_file()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=path.parent, suffix='.tmp', delete=False) as temporary:
+        json.dump(snapshot(), temporary, separators=(',', ':'))
+    os.replace(temporary.name, path)
+
+
+def maybe_flush():
+    if settings.METRICS_DIR and time.monotonic() - _file['flushed_at'] >= settings.METRICS_FLUSH_SECONDS:
+        try:
+            flush()
+        except OSError:  # A full disk loses the numbers of this flush, not the request
+            pass
+
+
+def collect():
+    '''
+    (metric, {label values: value}) pairs with the numbers of every process that wrote to
+    METRICS_DIR (just this one without it). Files not written in METRICS_STALE_SECONDS, of
+    processes that are long gone, are deleted
+    '''
+    if not settings.METRICS_DIR:
+        return [(metric, metric.series) for metric in registry]
+    flush()
+    by_name = {metric.name: metric for metric in registry}
+    totals = {metric.name: {} for metric in registry}
+    stale = time.time() - settings.METRICS_STALE_SECONDS
+    for path in Path(settings.METRICS_DIR).glob('*.json'):
+        try:
+            if path != _own_file() and path.stat().st_mtime < stale:
+                path.unlink()
+                continue
+            with open(path) as file:
+                process_snapshot = json.load(file)
+        except (OSError, ValueError):  # Deleted or being replaced meanwhile
+            continue
+        for name, series in process_snapshot.items():
+            if name in by_name:  # Else a metric removed since that file was written
+                for label_values, values in series:
+                    by_name[name].merge(totals[name], tuple(label_values), values)
+    return [(metric, totals[metric.name]) for metric in registry]
+
+
+class QueryTimer:
+    '''Counts the queries of a request and the time they take'''
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.count += 1
+
+
+# QueryTimer of the request being answered. A context variable and not the connections of the
+# thread of the middleware: under ASGI the queries run in other threads, with their own
+# connections, that sync_to_async gives a copy of the context
+request_timer = ContextVar('request_timer', default=None)
+
+
+def time_queries(execute, sql, params, many, context):
+    timer = request_timer.get()
+    if timer is None:  # Not in a request
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def add_execute_wrapper(connection, **kwargs):
+    '''Receiver of connection_created, times the queries of every connection (every shard and thread)'''
+    if time_queries not in connection.execute_wrappers:
+        # First, as the execute_wrapper() blocks open at that moment remove the last one when they end
+        connection.execute_wrappers.insert(0, time_queries)
+
+
+class MetricsMiddleware:
+    '''
+    Times every request and its queries, goes first in MIDDLEWARE to time the other middleware too.
+    Under ASGI it stays async, so it does not move the async views to a thread
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timer = QueryTimer()
+        token = request_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_timer.reset(token)
+        observe(request, response, timer, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        token = request_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_timer.reset(token)
+        observe(request, response, timer, time.perf_counter() - start)
+        return response
+
+
+def observe(request, response, timer, duration):
+    view = view_name_of(request)
+    request_latency.observe(duration, view, request.method)
+    requests.inc(view, request.method, response.status_code)
+    request_queries.observe(timer.count, view)
+    request_db_time.observe(timer.time, view)
+    if not response.streaming:
+        response_size.observe(len(response.content), view)
+    maybe_flush()
@@ -0,0 +1,186 @@
+'''
+Sampling request profiler.
+
+ProfilingMiddleware runs cProfile around PROFILING_SAMPLE_RATE of the requests, and around every
+request with an X-Profile header holding a token signed by the profile_header command (valid for
+PROFILING_TOKEN_MAX_AGE seconds), so a slow page can be profiled on demand in production. Every
+profile is dumped, in the pstats format, to a directory per URL name under PROFILING_DIR
+(forums.show_post/, members.user_feed/...), which keeps only its PROFILING_MAX_FILES newest files.
+The duration, method and status of the request are in the name of the file, so listing the slowest
+requests (monitoring.views.profiles) does not have to open them.
+
+An unsampled request only costs a random() call and a header lookup.
+'''
+import os
+import re
+import time
+import random
+import cProfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+
+SALT = 'monitoring.profiling'
+TOKEN = 'profile'
+
+# <epoch ms>_<duration µs>us_<method>_<status>.prof
+FILE_NAME = re.compile(r'^(?P<timestamp>\d+)_(?P<duration>\d+)us_(?P<method>[A-Z]+)_(?P<status>\d{3})\.prof$')
+# A URL name with the ':' of its namespace replaced by '.', not only dots ('..' is the parent directory)
+DIRECTORY_NAME = re.compile(r'^(?!\.+$)[\w.-]+$')
+
+
+class Profile:
+    '''A profile file of PROFILING_DIR'''
+
+    def __init__(self, view_name, file_name):
+        self.view_name = view_name
+        self.file_name = file_name
+        match = FILE_NAME.match(file_name)
+        self.created_at = datetime.fromtimestamp(int(match['timestamp']) / 1000, timezone.utc)
+        self.duration = int(match['duration']) / 1000  # ms
+        self.method = match['method']
+        self.status = int(match['status'])
+
+    @property
+    def path(self):
+        return Path(settings.PROFILING_DIR, directory_name(self.view_name), self.file_name)
+
+
+def sign_token():
+    '''Value of the X-Profile header that makes ProfilingMiddleware profile a request'''
+    return signing.TimestampSigner(salt=SALT).sign(TOKEN)
+
+
+def valid_token(value):
+    try:
+        return signing.TimestampSigner(salt=SALT).unsign(value, max_age=settings.PROFILING_TOKEN_MAX_AGE) == TOKEN
+    except signing.BadSignature:  # Includes the expired ones
+        return False
+
+
+def directory_name(view_name):
+    return view_name.replace(':', '.')
+
+
+def view_name_of(request):
+    match = request.resolver_match
+    return match.view_name if match and match.url_name else 'unresolved'
+
+
+def save(profiler, view_name, *, duration, method, status):
+    '''Dumps profiler to the directory of view_name and deletes the oldest profiles beyond PROFILING_MAX_FILES'''
+    directory = Path(settings.PROFILING_DIR, directory_name(view_name))
+    directory.mkdir(parents=True, exist_ok=True)
+    file_name = f'{time.time_ns() // 1_000_000}_{round(duration * 1_000_000)}us_{method}_{status}.prof'
+    profiler.dump_stats(directory / file_name)
+
+    # The names start with the timestamp, so they sort from the oldest to the newest
+    for old in sorted(name for name in os.listdir(directory) if FILE_NAME.match(name))[:-settings.PROFILING_MAX_FILES]:
+        try:
+            os.remove(directory / old)
+        except FileNotFoundError:  # Already rotated by another process
+            pass
+    return Profile(view_name, file_name)
+
+
+def profiles():
+    '''{URL name: [Profile, ...]} of every profile in PROFILING_DIR, slowest first'''
+    root = Path(settings.PROFILING_DIR)
+    if not root.is_dir():
+        return {}
+    found = {}
+    for directory in sorted(root.iterdir()):
+        if directory.is_dir() and DIRECTORY_NAME.match(directory.name):
+            view_profiles = [
+                Profile(directory.name.replace('.', ':'), name) for name in os.listdir(directory) if FILE_NAME.match(name)
+                ]
+            if view_profiles:
+                found[directory.name.replace('.', ':')] = sorted(view_profiles, key=lambda profile: -profile.duration)
+    return found
+
+
+def get_profile(view_name, file_name):
+    '''The Profile of that file, None if the names are not the ones of a profile or it was rotated'''
+    if not DIRECTORY_NAME.match(directory_name(view_name)) or not FILE_NAME.match(file_name):
+        return None
+    profile = Profile(view_name, file_name)
+    return profile if profile.path.is_file() else None
+
+
+def enabled(profiler):
+    '''
+    Whether profiler could be enabled. Since Python 3.12 there can only be one profiler at a time,
+    so a request sampled while another one is profiled (under ASGI, or with a debugger attached)
+    is not, instead of failing
+    '''
+    try:
+        profiler.enable()
+    except ValueError:  # Another profiling tool is already active
+        return False
+    return True
+
+
+class ProfilingMiddleware:
+    '''
+    Profiles the sampled requests (see the module docstring). Goes first in MIDDLEWARE, so the
+    profiles include the time spent in the other middleware. Under ASGI it stays async, and the
+    profile is the one of the event loop thread: what runs in threads (sync views, queries made
+    with sync_to_async) is only in it as the time spent awaiting them
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        if not enabled(profiler):
+            return self.get_response(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        return self.saved(request, response, profiler, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.sampled(request):
+            return await self.get_response(request)
+
+        profiler = cProfile.Profile()
+        if not enabled(profiler):
+            return await self.get_response(request)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+        # Not writing the profile from the event loop
+        return await sync_to_async(self.saved, thread_sensitive=False)(request, response, profiler, time.perf_counter() - start)
+
+    def sampled(self, request):
+        header = request.META.get('HTTP_X_PROFILE')
+        rate = settings.PROFILING_SAMPLE_RATE
+        return (rate and random.random() < rate) or (header and valid_token(header))
+
+    def saved(self, request, response, profiler, duration):
+        '''response, with the X-Profile header if the request asked for it'''
+        try:
+            profile = save(profiler, view_name_of(request), duration=duration, method=request.method, status=response.status_code)
+        except OSError:
+            return response  # Never failing a request because its profile could not be written
+        if request.META.get('HTTP_X_PROFILE'):
+            response['X-Profile'] = f'{profile.view_name}/{profile.file_name}'
+        return response
@@ -0,0 +1,258 @@
+'''
+Slow query log.
+
+SlowQueryMiddleware watches the queries of every request (on every connection, so every shard) and
+logs the ones that take SLOW_QUERY_SECONDS or more, to the 'monitoring.slow_queries' logger and
+as a line of JSON to SLOW_QUERY_LOG, with:
+- the normalized SQL: literals, parameters and IN lists replaced by placeholders, so every run of
+  the same query has the same text, and its shape (a hash of that text) to group them by
+- the parameters, redacted: numbers, dates and None are kept, anything else (search terms,
+  contents, session keys...) is replaced by its type
+- the duration, the database and the URL name of the request
+- where it was issued: the innermost function of the project in the stack
+  (templatetags.vote_post_form_extras.vote_post_form:17) and, for queries made while
+  rendering a template, the template line (includes/show_posts.html:12)
+
+The slow_query_report command adds the entries up by shape, see report(). Looking for the call site
+only happens for slow queries, the others only cost two perf_counter() calls.
+'''
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import logging
+from pathlib import Path
+from contextvars import ContextVar
+from collections import Counter
+from datetime import date, datetime, time as day_time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.base import Node
+
+from .profiling import view_name_of
+
+logger = logging.getLogger(__name__)
+
+STRINGS = re.compile(r"'(?:[^']|'')*'")
+NUMBERS = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b')
+PLACEHOLDERS = re.compile(r'%s|\?')
+LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+REPEATED_LISTS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')  # The rows of a bulk insert
+WHITESPACE = re.compile(r'\s+')
+
+# Frames of these files are not call sites: this package (the execute wrappers and middleware of
+# monitoring) and the installed libraries
+OWN_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+LIBRARY_DIRS = ('site-packages', 'dist-packages', f'{os.sep}lib{os.sep}python')
+
+
+def normalize(sql):
+    '''The text of sql without its values, the same for every run of the same query'''
+    sql = STRINGS.sub('?', sql)
+    sql = NUMBERS.sub('?', sql)
+    sql = PLACEHOLDERS.sub('?', sql)
+    sql = LISTS.sub('(...)', sql)
+    sql = REPEATED_LISTS.sub('(...)', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def shape_of(normalized_sql):
+    return hashlib.md5(normalized_sql.encode()).hexdigest()[:12]
+
+
+def _redact_value(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (date, datetime, day_time)):
+        return value.isoformat()
+    return f'<{type(value).__name__}>'
+
+
+def redact(params, many=False):
+    '''Parameters that can be logged: the values that are not numbers, dates or None are replaced by their type'''
+    if params is None:
+        return None
+    if many:  # executemany, params are the rows, maybe a generator
+        return '<rows>'
+    if isinstance(params, dict):
+        return {key: _redact_value(value) for key, value in params.items()}
+    return [_redact_value(value) for value in params]
+
+
+def _code_location(frame):
+    path = os.path.relpath(frame.f_code.co_filename, settings.BASE_DIR)
+    module = os.path.splitext(path)[0].replace(os.sep, '.')
+    return f'{module}.{frame.f_code.co_name}:{frame.f_lineno}'
+
+
+def call_site(frame):
+    '''(innermost function of the project, innermost template line) of the stack of frame, None if none'''
+    root = str(settings.BASE_DIR) + os.sep
+    code = template = None
+    while frame is not None and (code is None or template is None):
+        filename = frame.f_code.co_filename
+        if template is None and frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            if isinstance(node, Node) and node.origin is not None and node.token is not None:
+                template = f'{node.origin.template_name}:{node.token.lineno}'
+        if (code is None and filename.startswith(root) and not filename.startswith(OWN_DIR)
+                and not any(directory in filename[len(root):] for directory in LIBRARY_DIRS)):
+            code = _code_location(frame)
+        frame = frame.f_back
+    return code, template
+
+
+def log(sql, params, *, many, duration, view, database, frame):
+    normalized = normalize(sql)
+    code, template = call_site(frame)
+    entry = {
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'duration': round(duration, 6),
+        'view': view,
+        'database': database,
+        'shape': shape_of(normalized),
+        'sql': normalized,
+        'params': redact(params, many),
+        'code': code,
+        'template': template,
+    }
+    logger.warning(
+        'Slow query (%.1f ms) in %s, from %s%s: %s', duration * 1000, view, code,
+        f' ({template})' if template else '', normalized
+        )
+    if settings.SLOW_QUERY_LOG:
+        try:
+            _append(Path(settings.SLOW_QUERY_LOG), json.dumps(entry, default=str))
+        except OSError:  # Losing the entry, not the request
+            logger.exception('Could not write to the slow query log %s', settings.SLOW_QUERY_LOG)
+    return entry
+
+
+def _append(path, line):
+    '''Appends line to path, which is moved to path.1 (replacing the previous one) once it is SLOW_QUERY_LOG_MAX_BYTES'''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        if path.stat().st_size >= settings.SLOW_QUERY_LOG_MAX_BYTES:
+            os.replace(path, f'{path}.1')
+    except FileNotFoundError:
+        pass
+    with open(path, 'a') as file:  # One write per line, so the lines of several processes do not mix
+        file.write(line + '\n')
+
+
+def read_log(path):
+    '''The entries of the log file path and of its rotated file, oldest first'''
+    entries = []
+    for file_path in (Path(f'{path}.1'), Path(path)):
+        try:
+            with open(file_path) as file:
+                entries.extend(json.loads(line) for line in file if line.strip())
+        except FileNotFoundError:
+            pass
+    return entries
+
+
+class Shape:
+    '''The slow runs of one normalized query'''
+
+    def __init__(self, shape, sql):
+        self.shape = shape
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.views = Counter()
+        self.call_sites = Counter()
+
+    @property
+    def mean(self):
+        return self.total / self.count
+
+
+def report(entries, *, sort='total', top=20):
+    '''The top Shapes of the entries of the log, by total, count, mean or max duration'''
+    shapes = {}
+    for entry in entries:
+        shape = shapes.get(entry['shape'])
+        if shape is None:
+            shape = shapes[entry['shape']] = Shape(entry['shape'], entry['sql'])
+        shape.count += 1
+        shape.total += entry['duration']
+        shape.max = max(shape.max, entry['duration'])
+        shape.views[entry['view']] += 1
+        shape.call_sites[' / '.join(site for site in (entry['code'], entry['template']) if site) or 'unknown'] += 1
+    return sorted(shapes.values(), key=lambda shape: -getattr(shape, sort))[:top]
+
+
+class QueryWatcher:
+    '''Execute wrapper logging the slow queries of request'''
+
+    def __init__(self, request, threshold):
+        self.request = request
+        self.threshold = threshold
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            if duration >= self.threshold:
+                log(
+                    sql, params, many=many, duration=duration, view=view_name_of(self.request),
+                    database=context['connection'].alias, frame=sys._getframe(1)
+                    )
+
+
+# QueryWatcher of the request being answered, see metrics.request_timer
+request_watcher = ContextVar('request_watcher', default=None)
+
+
+def watch_queries(execute, sql, params, many, context):
+    watcher = request_watcher.get()
+    if watcher is None:  # Not in a request, or SLOW_QUERY_SECONDS is None
+        return execute(sql, params, many, context)
+    return watcher(execute, sql, params, many, context)
+
+
+def add_execute_wrapper(connection, **kwargs):
+    '''Receiver of connection_created, watches the queries of every connection (every shard and thread)'''
+    if watch_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, watch_queries)  # See metrics.add_execute_wrapper
+
+
+class SlowQueryMiddleware:
+    '''Logs the slow queries of every request, off when SLOW_QUERY_SECONDS is None. Async under ASGI'''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        threshold = settings.SLOW_QUERY_SECONDS
+        if threshold is None:
+            return self.get_response(request)
+        token = request_watcher.set(QueryWatcher(request, threshold))
+        try:
+            return self.get_response(request)
+        finally:
+            request_watcher.reset(token)
+
+    async def __acall__(self, request):
+        threshold = settings.SLOW_QUERY_SECONDS
+        if threshold is None:
+            return await self.get_response(request)
+        token = request_watcher.set(QueryWatcher(request, threshold))
+        try:
+            return await self.get_response(request)
+        finally:
+            request_watcher.reset(token)
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'monitoring'
+urlpatterns = [
+    path('profiles/', views.profiles, name='profiles'),
+    path('profiles/<str:view_name>/<str:file_name>', views.show_profile, name='show_profile'),
+]
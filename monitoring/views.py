@@ -0,0 +1,64 @@
+import io
+import pstats
+
+from django.conf import settings
+from django.http import Http404, FileResponse, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+
+from . import metrics, profiling
+
+SORTS = ('cumulative', 'tottime', 'ncalls')  # Orders of the functions of a profile
+
+
+@staff_member_required
+def profiles(request):
+    '''The PROFILING_SLOWEST slowest profiled requests of every URL name, slowest URL names first'''
+    slowest = [
+        (view_name, view_profiles[:settings.PROFILING_SLOWEST], len(view_profiles))
+        for view_name, view_profiles in profiling.profiles().items()
+    ]
+    slowest.sort(key=lambda row: -row[1][0].duration)
+    return render(request, 'monitoring/profiles.html', {
+        'title': 'Profiled requests',
+        'slowest': slowest,
+        'sample_rate': settings.PROFILING_SAMPLE_RATE,
+    })
+
+
+@staff_member_required
+def show_profile(request, view_name, file_name):
+    '''The functions of a profile by cumulative time, or the profile file itself with ?download'''
+    profile = profiling.get_profile(view_name, file_name)
+    if profile is None:
+        raise Http404('No such profile')
+    if 'download' in request.GET:
+        return FileResponse(open(profile.path, 'rb'), as_attachment=True, filename=file_name)
+
+    stream = io.StringIO()
+    sort = request.GET.get('sort') if request.GET.get('sort') in SORTS else SORTS[0]
+    pstats.Stats(str(profile.path), stream=stream).strip_dirs().sort_stats(sort).print_stats(settings.PROFILING_SHOWN_FUNCTIONS)
+    return render(request, 'monitoring/profile.html', {
+        'title': f'{view_name} in {profile.duration:.1f} ms',
+        'profile': profile,
+        'sort': sort,
+        'sorts': SORTS,
+        'stats': stream.getvalue(),
+    })
+
+
+@require_GET
+def show_metrics(request):
+    '''
+    The metrics of every worker in the Prometheus text format. With METRICS_TOKEN set, the
+    scraper has to send it as "Authorization: Bearer <token>"
+    '''
+    if settings.METRICS_TOKEN and not constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {settings.METRICS_TOKEN}'
+            ):
+        return HttpResponse('Missing or wrong metrics token', content_type='text/plain', status=403)
+    response = HttpResponse(metrics.render(metrics.collect()), content_type=metrics.CONTENT_TYPE)
+    response['Cache-Control'] = 'no-store'
+    return response
@@ -0,0 +1,74 @@
+// Sends the vote forms (the ones with data-vote-form) with fetch, asking the vote views for json,
+// and updates the points and the labels of the buttons in place instead of rendering the page
+// again. Votes rejected for going too fast (429) show the message of the answer next to the
+// buttons, which are disabled for its Retry-After seconds. Any other answer (not logged in, an
+// error) submits the form as usual.
+(function () {
+    if (!window.fetch || !window.FormData) {
+        return;
+    }
+
+    function update(form, data) {
+        var target = form.dataset.voteForm;  // post-<pk> or comment-<pk>
+        var pk = form.id.slice(form.id.lastIndexOf('-') + 1);
+        var kind = form.id.slice(form.id.indexOf('-') + 1, form.id.lastIndexOf('-'));  // post, reply or comment
+        document.querySelectorAll('[data-live-points="' + target + '"]').forEach(function (element) {
+            element.textContent = data.points + ' Point' + (data.points === 1 ? '' : 's');
+        });
+        document.querySelectorAll('button[form="upvote-' + kind + '-' + pk + '"]').forEach(function (button) {
+            button.textContent = data.upvote_label;
+        });
+        document.querySelectorAll('button[form="downvote-' + kind + '-' + pk + '"]').forEach(function (button) {
+            button.textContent = data.downvote_label;
+        });
+    }
+
+    function throttled(form, message, seconds) {
+        var buttons = document.querySelectorAll('button[form="' + form.id + '"]');
+        buttons.forEach(function (button) {
+            var notice = document.createElement('span');
+            notice.className = 'vote-throttled';
+            notice.setAttribute('role', 'status');
+            notice.textContent = ' ' + message;
+            button.disabled = true;
+            button.after(notice);
+            setTimeout(function () {
+                button.disabled = false;
+                notice.remove();
+            }, Math.max(seconds, 1) * 1000);
+        });
+    }
+
+    document.addEventListener('submit', function (event) {
+        var form = event.target;
+        if (!form.dataset || !form.dataset.voteForm) {
+            return;
+        }
+        event.preventDefault();
+        fetch(form.action, {
+            method: 'POST',
+            body: new FormData(form),
+            credentials: 'same-origin',
+            headers: {'Accept': 'application/json'}
+        }).then(function (response) {
+            var type = response.headers.get('Content-Type') || '';
+            if (response.status === 429 && type.indexOf('application/json') !== -1) {
+                var seconds = parseInt(response.headers.get('Retry-After'), 10) || 1;
+                return response.json().then(function (data) {
+                    throttled(form, data.error, seconds);
+                    return null;
+                });
+            }
+            if (!response.ok || type.indexOf('application/json') === -1) {
+                throw new Error('not a vote');
+            }
+            return response.json();
+        }).then(function (data) {
+            if (data) {
+                update(form, data);
+            }
+        }).catch(function () {
+            form.submit();  // Does not fire the submit event again
+        });
+    });
+})();
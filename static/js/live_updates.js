@@ -0,0 +1,48 @@
+// Live updates of a post or comment page, streamed by forums/sse.py. Points and edited contents
+// are updated in place, new replies show a notice. Without EventSource the page works as before.
+(function () {
+    var url = document.body.dataset.liveUrl;
+    if (!url || !window.EventSource) {
+        return;
+    }
+    var source = new EventSource(url);
+
+    function elements(attribute, data) {
+        var key = data.post !== undefined ? 'post-' + data.post : 'comment-' + data.comment;
+        return document.querySelectorAll('[' + attribute + '="' + key + '"]');
+    }
+
+    // Events sent while the stream was reconnecting are lost, the scores are fetched again
+    var opened = false;
+    source.addEventListener('open', function () {
+        if (opened && window.refreshPoints) {
+            window.refreshPoints();
+        }
+        opened = true;
+    });
+
+    source.addEventListener('points', function (event) {
+        var data = JSON.parse(event.data);
+        elements('data-live-points', data).forEach(function (element) {
+            element.textContent = data.points + ' Point' + (data.points === 1 ? '' : 's');
+        });
+    });
+
+    source.addEventListener('edit', function (event) {
+        var data = JSON.parse(event.data);
+        elements('data-live-content', data).forEach(function (element) {
+            element.textContent = data.content;
+        });
+    });
+
+    source.addEventListener('comment', function () {
+        var notice = document.getElementById('live-notice');
+        notice.hidden = false;
+    });
+
+    // The stream fell too far behind to be trusted, reloading gets the current state
+    source.addEventListener('reset', function () {
+        source.close();
+        window.location.reload();
+    });
+})();
@@ -0,0 +1,35 @@
+// Shows the replies of a comment below it when its "N Replies" link (or a "More replies" link of
+// replies loaded this way) is clicked, fetching only their HTML from comments:replies_fragment
+// (the data-replies-url of the link) instead of opening the page of the comment. The links keep
+// working as plain links without javascript or if the request fails.
+(function () {
+    if (!window.fetch) {
+        return;
+    }
+
+    document.addEventListener('click', function (event) {
+        var link = event.target.closest('a[data-replies-url]');
+        if (!link || event.ctrlKey || event.metaKey || event.shiftKey || event.button !== 0) {
+            return;  // Opening the page in a new tab
+        }
+        event.preventDefault();
+        if (link.dataset.loading) {
+            return;
+        }
+        link.dataset.loading = 'true';
+
+        fetch(link.dataset.repliesUrl, {credentials: 'same-origin'}).then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+            return response.text();
+        }).then(function (html) {
+            var replies = document.createElement('div');
+            replies.className = 'nested-replies';
+            replies.innerHTML = html;
+            link.replaceWith(replies);  // static/js/refresh_points.js picks their scores up on its next refresh
+        }).catch(function () {
+            window.location = link.href;
+        });
+    });
+})();
@@ -0,0 +1,70 @@
+// Keeps the scores of the posts and comments of a page fresh with a single request to
+// forums:bulk_points (the url is the data-points-url of the body) every data-points-interval
+// seconds, while the page is visible. Updates the points and the labels of the vote buttons.
+(function () {
+    var url = document.body.dataset.pointsUrl;
+    if (!url || !window.fetch) {
+        return;
+    }
+    var interval = (parseInt(document.body.dataset.pointsInterval, 10) || 30) * 1000;
+
+    function labels(vote) {
+        if (vote === 'U') {
+            return ['Remove Upvote', 'Downvote'];
+        } else if (vote === 'D') {
+            return ['Upvote', 'Remove Downvote'];
+        }
+        return ['Upvote', 'Downvote'];
+    }
+
+    function buttons(direction, kinds, pk) {
+        return document.querySelectorAll(kinds.map(function (kind) {
+            return 'button[form="' + direction + '-' + kind + '-' + pk + '"]';
+        }).join(','));
+    }
+
+    function update(kind, buttonKinds, scores) {
+        Object.keys(scores).forEach(function (pk) {
+            var points = scores[pk][0], vote = labels(scores[pk][2]);
+            document.querySelectorAll('[data-live-points="' + kind + '-' + pk + '"]').forEach(function (element) {
+                element.textContent = points + ' Point' + (points === 1 ? '' : 's');
+            });
+            buttons('upvote', buttonKinds, pk).forEach(function (button) {
+                button.textContent = vote[0];
+            });
+            buttons('downvote', buttonKinds, pk).forEach(function (button) {
+                button.textContent = vote[1];
+            });
+        });
+    }
+
+    function shown(kind) {
+        var ids = [];
+        document.querySelectorAll('[data-live-points^="' + kind + '-"]').forEach(function (element) {
+            var pk = element.dataset.livePoints.slice(kind.length + 1);
+            if (ids.indexOf(pk) === -1) {
+                ids.push(pk);
+            }
+        });
+        return ids.join(',');
+    }
+
+    function refresh() {
+        var posts = shown('post'), comments = shown('comment');
+        if (document.hidden || (!posts && !comments)) {
+            return;
+        }
+        fetch(url + '?posts=' + posts + '&comments=' + comments, {credentials: 'same-origin'})
+            .then(function (response) { return response.ok ? response.json() : null; })
+            .then(function (scores) {
+                if (scores) {
+                    update('post', ['post'], scores.posts);
+                    update('comment', ['reply', 'comment'], scores.comments);
+                }
+            });
+    }
+
+    window.refreshPoints = refresh;
+    setInterval(refresh, interval);
+    document.addEventListener('visibilitychange', refresh);
+})();
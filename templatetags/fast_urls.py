@@ -0,0 +1,59 @@
+from urllib.parse import quote
+
+from django import template
+from django.dispatch import receiver
+from django.utils.http import RFC3986_SUBDELIMS
+from django.test.signals import setting_changed
+from django.urls import reverse, get_script_prefix, get_urlconf
+
+register = template.Library()
+
+# Digits only, so it matches both the <int:...> and the <str:...> path converters
+PLACEHOLDER = '918273645'
+
+
+class URLBuilder:
+    '''
+    reverse() walks the whole URLconf every time it is called, which adds up quickly in templates
+    that render hundreds of rows with 4-6 {% url %} tags each. Every row asks for the same
+    pattern with a different argument, so we reverse the pattern only once, using a placeholder
+    as argument, and build the following URLs by pasting the real argument where the placeholder was.
+
+    Only meant for URL patterns that take exactly one argument. Unlike reverse(), the argument is
+    NOT validated against the path converter.
+    '''
+    def __init__(self, viewname):
+        url = reverse(viewname, args=(PLACEHOLDER,))
+        if url.count(PLACEHOLDER) != 1:
+            raise ValueError(f'Can not build a URLBuilder for "{viewname}"')
+
+        self.prefix, self.suffix = url.split(PLACEHOLDER)
+
+    def build(self, arg):
+        # Quoting the argument the same way reverse() does
+        return self.prefix + quote(str(arg), safe=RFC3986_SUBDELIMS + '/~:@') + self.suffix
+
+
+_builders = {}
+
+
+def build_url(viewname, arg):
+    '''Drop-in replacement for reverse(viewname, args=(arg,)) for the per-row URLs of the templates'''
+    key = (viewname, get_script_prefix(), get_urlconf())
+    try:
+        builder = _builders[key]
+    except KeyError:
+        builder = _builders[key] = URLBuilder(viewname)
+    return builder.build(arg)
+
+
+@receiver(setting_changed)
+def clear_builders(*, setting, **kwargs):
+    '''The precomputed URLs are no longer valid if the URLconf changes (e.g. override_settings in tests)'''
+    if setting == 'ROOT_URLCONF':
+        _builders.clear()
+
+
+@register.simple_tag
+def fast_url(viewname, arg):
+    return build_url(viewname, arg)
@@ -1,35 +1,35 @@
 from django import template
 
-from comments.models import CommentVote
+from abstract_models.vote import vote_button_labels
+from templatetags.fast_urls import build_url
 
 register = template.Library()
-vote_record = None
 
-# The aproach used in this module to reduce db calls is described in detail in template_tags.vote_post_form_extras.py
 
-@register.filter
-def already_upvoted_by(comment, user):
-    global vote_record
-    try:
-        vote_record = CommentVote.objects.get(comment=comment, user=user)
-        if vote_record.is_upvote():
-            return 'Remove Upvote'
-        else:
-            return 'Upvote'
-
-    except CommentVote.DoesNotExist:
+def vote_form_context(context, comment):
+    '''The URLs and button labels of the vote form of comment, see vote_post_form_extras.vote_post_form'''
+    user = context['request'].user
+    if user.is_authenticated:
+        vote_record = comment.commentvote_set.filter(user=user).first()
+    else:
         vote_record = None
-        return 'Upvote'
+    upvote_label, downvote_label = vote_button_labels(vote_record)
+
+    return {
+        'upvote_url': build_url('comments:upvote_comment', comment.pk),
+        'downvote_url': build_url('comments:downvote_comment', comment.pk),
+        'upvote_label': upvote_label,
+        'downvote_label': downvote_label
+    }
+
 
+# Used by comments/comment.html for the comment of the page
+@register.inclusion_tag('includes/vote_comment_form.html', takes_context=True)
+def vote_comment_form(context, comment):
+    return {'comment_pk': comment.pk, **vote_form_context(context, comment)}
 
-@register.filter
-def already_downvoted_by(comment, user):
-    global vote_record
-    try:
-        if vote_record.is_downvote():
-            return 'Remove Downvote'
-        else:
-            return 'Downvote'
 
-    except AttributeError:
-        return 'Downvote'
\ No newline at end of file
+# Used for every row of includes/show_replies.html
+@register.inclusion_tag('includes/vote_reply_form.html', takes_context=True)
+def vote_reply_form(context, reply):
+    return {'reply_pk': reply.pk, **vote_form_context(context, reply)}
@@ -1,11 +1,17 @@
+import json
+from datetime import timedelta
+
 from django.test import TestCase
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_encode
 from django.db.utils import IntegrityError
 from django.contrib.auth.models import User
 
+from comments import pagination
 from comments.models import Comment, CommentVote
 from members.models import Member
-from forums.models import Post, Forum
+from forums.models import Post, Forum, ActivityEvent
 
 class CommentModelTests(TestCase):
     def test_both_post_and_in_reply_to_are_none(self):
@@ -366,6 +372,71 @@ class UpvoteAndDownvote(TestCase):
         self.assertNotContains(response, 'Remove Downvote')
 
 
+    def test_vote_comment_as_json(self):
+        '''Votes asking for json get the new points and labels instead of a redirect'''
+        user = User(username='jsonvoter')
+        user.set_password('pass')
+        user.save()
+        member = Member.objects.create(user=user, bio='sdd')
+        forum = Forum.objects.create(owner=user, name='forum1', description='sdasd')
+        p = Post.objects.create(forum=forum, poster=member, title='ad', content='adad')
+        c = Comment.objects.create(commenter=member, post=p, content='adfdf')
+
+        self.client.login(username=user.username, password='pass')
+        response = self.client.post(reverse('comments:downvote_comment', args=(c.pk,)), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), {
+            'points': -1, 'vote': 'D', 'upvote_label': 'Upvote', 'downvote_label': 'Remove Downvote'
+            })
+        response = self.client.post(reverse('comments:upvote_comment', args=(c.pk,)), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['points'], 1)
+        self.assertEqual(response.json()['vote'], 'U')
+
+    def test_comment_page_vote_form(self):
+        '''The comment page shows the labels of the vote of the viewer, and of nobody else's'''
+        user = User(username='pagevoter')
+        user.set_password('pass')
+        user.save()
+        member = Member.objects.create(user=user, bio='sdd')
+        forum = Forum.objects.create(owner=user, name='forum1', description='sdasd')
+        p = Post.objects.create(forum=forum, poster=member, title='ad', content='adad')
+        c = Comment.objects.create(commenter=member, post=p, content='adfdf')
+        CommentVote.objects.create(comment=c, user=user, kind_of_vote='D')
+
+        response = self.client.get(reverse('comments:show_comment', args=(c.pk,)))
+        self.assertContains(response, f'id="upvote-comment-{c.pk}"')
+        self.assertNotContains(response, 'Remove Downvote')
+        self.client.login(username=user.username, password='pass')
+        response = self.client.get(reverse('comments:show_comment', args=(c.pk,)))
+        self.assertContains(response, 'Remove Downvote')
+        self.assertNotContains(response, 'Remove Upvote')
+
+    def test_vote_on_nested_reply(self):
+        '''A vote on a deep reply finds its thread with one query, and a changed vote is dated at the change'''
+        user = User(username='deepvoter')
+        user.set_password('pass')
+        user.save()
+        member = Member.objects.create(user=user, bio='sdd')
+        forum = Forum.objects.create(owner=user, name='forum1', description='sdasd')
+        p = Post.objects.create(forum=forum, poster=member, title='ad', content='adad')
+        reply = Comment.objects.create(commenter=member, post=p, content='level 0')
+        for level in range(1, 4):
+            reply = Comment.objects.create(commenter=member, in_reply_to=reply, content=f'level {level}')
+        reply = Comment.objects.get(pk=reply.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(reply.thread_post(), p)
+            self.assertEqual(reply.thread_post(), p)  # Kept
+
+        long_ago = timezone.now() - timedelta(days=30)
+        CommentVote.objects.create(comment=reply, user=user, kind_of_vote='D')
+        CommentVote.objects.update(voted_at=long_ago)
+        self.client.login(username=user.username, password='pass')
+        self.client.post(reverse('comments:upvote_comment', args=(reply.pk,)))
+        vote = CommentVote.objects.get()
+        self.assertEqual(vote.kind_of_vote, 'U')
+        self.assertGreater(vote.voted_at, long_ago + timedelta(days=29))
+        self.assertEqual(ActivityEvent.objects.filter(post=p, on_comment=True).count(), 2)  # Downvote taken back, upvote
+
+
 class EditCommentView(TestCase):
     def test_edit_comment_works(self):
         user = User(username='hellothere')
@@ -489,4 +560,126 @@ class DeleteCommentView(TestCase):
         response = self.client.post(reverse('comments:delete_comment', args=(c.pk,)))
 
         self.assertEqual(response.status_code, 403)
-        self.assertIs(Comment.objects.contains(c), True) # comment was not deleted
\ No newline at end of file
+        self.assertIs(Comment.objects.contains(c), True) # comment was not deleted
+
+class CommentPagination(TestCase):
+
+    def setUp(self):
+        user = User(username='pager')
+        user.set_password('pass')
+        user.save()
+        self.member = Member.objects.create(user=user, bio='a')
+        forum = Forum.objects.create(owner=user, name='pages', description='d')
+        self.post = Post.objects.create(forum=forum, poster=self.member, title='t', content='c')
+        # Points 0, 1, 2, 0, 1, 2, 0, so the top order has ties
+        self.comments = [
+            Comment.objects.create(post=self.post, commenter=self.member, content=f'comment {i}', points=i % 3)
+            for i in range(7)
+        ]
+
+    def pages(self, sort):
+        '''The pks of every page of the comments of the post in that order, following the cursors'''
+        pages, cursor = [], None
+        while True:
+            page = pagination.get_page(self.post.comment_set.all(), sort=sort, cursor=cursor, size=3)
+            pages.append([comment.pk for comment in page.comments])
+            if page.next_cursor is None:
+                return pages
+            cursor = page.next_cursor
+
+    def test_sorts(self):
+        '''Every order is walked page by page without skipping nor repeating comments'''
+        pks = [comment.pk for comment in self.comments]
+        self.assertEqual(self.pages('old'), [pks[0:3], pks[3:6], pks[6:]])
+        self.assertEqual(self.pages('new'), [pks[6:3:-1], pks[3:0:-1], pks[:1]])
+        self.assertEqual(self.pages('top'), [[pks[5], pks[2], pks[4]], [pks[1], pks[6], pks[3]], [pks[0]]])
+
+    def test_invalid_cursors(self):
+        '''Cursors that can not be decoded give the first page, unknown sorts the default one'''
+        first = pagination.get_page(self.post.comment_set.all(), size=3)
+        for sort, cursor in (('old', 'garbage'), ('top', first.next_cursor), ('nope', None)):
+            page = pagination.get_page(self.post.comment_set.all(), sort=sort, cursor=cursor, size=3)
+            self.assertEqual(len(page.comments), 3)
+        self.assertEqual(page.sort, pagination.DEFAULT_SORT)
+
+        # Integers that do not fit in a 64-bit column
+        for value, pk in ((10 ** 30, 1), (1, 2 ** 63), (1, -2 ** 63 - 1), (1, True)):
+            cursor = urlsafe_base64_encode(json.dumps([value, pk]).encode())
+            with self.assertRaises(ValueError):
+                pagination.decode_cursor(cursor, 'top')
+            page = pagination.get_page(self.post.comment_set.all(), sort='top', cursor=cursor, size=3)
+            self.assertEqual(len(page.comments), 3)
+        self.assertEqual(pagination.decode_cursor(urlsafe_base64_encode(b'[-5, 9223372036854775807]'), 'top'), (-5, 2 ** 63 - 1))
+
+    def test_pages_in_views(self):
+        '''The post and comment pages show a page of comments and link the next one'''
+        with self.settings(COMMENTS_PAGE_SIZE=5):
+            response = self.client.get(reverse('forums:show_post', args=(self.post.pk,)), {'sort': 'new'})
+            self.assertEqual([reply.pk for reply in response.context['replies']], [c.pk for c in self.comments[:1:-1]])
+            self.assertContains(response, f'after={response.context["page"].next_cursor}')
+
+            response = self.client.get(reverse('forums:show_post', args=(self.post.pk,)), {
+                'sort': 'new', 'after': response.context['page'].next_cursor
+                })
+            self.assertEqual([reply.pk for reply in response.context['replies']], [c.pk for c in self.comments[1::-1]])
+            self.assertNotContains(response, 'More comments')
+
+            parent = self.comments[0]
+            for i in range(6):
+                Comment.objects.create(in_reply_to=parent, commenter=self.member, content=f'reply {i}')
+            response = self.client.get(reverse('comments:show_comment', args=(parent.pk,)))
+            self.assertEqual(len(response.context['replies']), 5)
+            self.assertContains(response, 'More replies')
+
+
+class RepliesFragment(TestCase):
+
+    def setUp(self):
+        user = User(username='nester')
+        user.set_password('pass')
+        user.save()
+        self.member = Member.objects.create(user=user, bio='a')
+        forum = Forum.objects.create(owner=user, name='nested', description='d')
+        self.post = Post.objects.create(forum=forum, poster=self.member, title='t', content='c')
+        self.parent = Comment.objects.create(post=self.post, commenter=self.member, content='parent')
+        self.replies = [
+            Comment.objects.create(in_reply_to=self.parent, commenter=self.member, content=f'reply {i}')
+            for i in range(5)
+        ]
+        for i in range(2):
+            Comment.objects.create(in_reply_to=self.replies[0], commenter=self.member, content=f'nested {i}')
+
+    def test_fragment(self):
+        '''The fragment has only the replies of the page, and links the next one as another fragment'''
+        url = reverse('comments:replies_fragment', args=(self.parent.pk,))
+        response = self.client.get(url, {'limit': 3})
+        self.assertEqual([reply.pk for reply in response.context['replies']], [r.pk for r in self.replies[:3]])
+        self.assertNotContains(response, '<html')
+        self.assertContains(response, '2 Replies')
+        self.assertContains(response, reverse('comments:replies_fragment', args=(self.replies[0].pk,)))
+        next_url = f'{url}?sort=old&after={response.context["page"].next_cursor}&limit=3'
+        self.assertContains(response, next_url)
+
+        response = self.client.get(url, {'after': response.context['page'].next_cursor, 'limit': 3})
+        self.assertEqual([reply.pk for reply in response.context['replies']], [r.pk for r in self.replies[3:]])
+        self.assertNotContains(response, 'More replies')
+
+    def test_not_modified(self):
+        '''The same replies are not rendered again, until one of them changes'''
+        url = reverse('comments:replies_fragment', args=(self.parent.pk,))
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Comment.objects.create(in_reply_to=self.replies[1], commenter=self.member, content='new')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '1 Reply')
+
+    def test_reply_counts(self):
+        '''The reply counts of a page take one query, however many replies it has'''
+        page = pagination.get_page(self.parent.comment_set.all())
+        self.assertEqual([reply.reply_count for reply in page.comments], [2, 0, 0, 0, 0])
+        with self.assertNumQueries(1):
+            pagination.add_reply_counts(page.comments)
+        self.assertEqual(self.client.get(reverse('comments:replies_fragment', args=(404,))).status_code, 404)
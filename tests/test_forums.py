@@ -1,9 +1,34 @@
+import os
+import json
+import asyncio
+import tempfile
+from unittest import mock
+from unittest import skipUnless
+from io import StringIO
+from datetime import timedelta
+
+from asgiref.testing import ApplicationCommunicator
 from django.urls import reverse
-from django.test import TestCase
+from django.utils import timezone
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.management import call_command
+from django.db.utils import IntegrityError
 from django.contrib.auth.models import User
 
 from members.models import Member
-from forums.models import Forum, Post, PostVote
+from forums.models import Forum, Post, PostVote, ActivityEvent, Activity, ForumActivity, PostActivity, Fingerprint
+from forums.activity import compact_events, top_posts
+from forums import duplicates, forum_cache, live, trending, sharding
+from forums.sse import live_updates
+from forums.models import TrendingEpoch
+from forums.name_index import ForumNameIndex
+from templatetags.fast_urls import build_url
+from members.throttling import write_throttles
+from comments.models import Comment, CommentVote
+from archive.models import ArchivedPost, ArchivedComment, ArchivedCommentVote
 
 class TestJoinAndLeaveForumView(TestCase):
 
@@ -162,6 +187,67 @@ class TestForumCreation(TestCase):
         'You must provide a name and description to the new forum'
         )
 
+class ForumNameSimilarity(TestCase):
+
+    def test_name_index_finds_typos(self):
+        '''Names a typo away are too similar, short names are only compared exactly'''
+        index = ForumNameIndex()
+        index.rebuild(['tiktoknews', 'cooking', 'art'])
+
+        self.assertEqual(index.similar_to('tiktoknewz'), {'tiktoknews'})
+        self.assertEqual(index.similar_to('tiktoknew'), {'tiktoknews'})
+        self.assertEqual(index.similar_to('cookimg'), {'cooking'})
+        self.assertEqual(index.similar_to('ant'), set())
+        self.assertEqual(index.similar_to('gardening'), set())
+
+        # Names of 8 letters or more can be two edits away, the shorter ones only one
+        self.assertEqual(index.similar_to('tiktokmewz'), {'tiktoknews'})
+        self.assertEqual(index.similar_to('tiktoknewsxy'), {'tiktoknews'})
+        self.assertEqual(index.similar_to('tiktknws'), {'tiktoknews'})
+        self.assertEqual(index.similar_to('tiktokmewzy'), set())
+        self.assertEqual(index.similar_to('cokimg'), set())
+
+        index.remove('tiktoknews')
+        self.assertEqual(index.similar_to('tiktoknewz'), set())
+
+        index.add('tiktoknews')
+        index.add('tiktoknewz')  # Sharing most of their variants
+        index.remove('tiktoknews')
+        self.assertEqual(index.similar_to('tiktoknewq'), {'tiktoknewz'})
+
+    def test_create_forum_with_name_a_typo_away_is_not_allowed(self):
+        '''Forums are added to the name index once created, so a name with a typo is rejected'''
+        user = User(username='typo')
+        user.set_password('1234')
+        user.save()
+        Member.objects.create(user=user, bio='asds')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Forum.objects.create(owner=user, name='tiktoknews', description='asdasd')
+
+        self.client.login(username='typo', password='1234')
+        response = self.client.post(reverse('forums:create_forum'), {
+            'forum_name': 'TikTokNewz',
+            'description': 'des'
+        })
+        self.client.logout()
+
+        self.assertContains(
+            response, 'We already have forums with names very similar to &quot;TikTokNewz&quot;. Try with another one'
+            )
+        self.assertIs(Forum.objects.filter(name='TikTokNewz').exists(), False)
+
+    def test_real_name_is_unique_in_db(self):
+        '''Even if the checks in save() are skipped, the db rejects a repeated real name'''
+        user = User(username='dbunique')
+        user.set_password('1234')
+        user.save()
+        Forum.objects.create(owner=user, name='unique_name', description='asdasd')
+
+        with self.assertRaises(IntegrityError):
+            Forum.objects.bulk_create([Forum(owner=user, name='UniqueName', real_name='uniquename', description='a')])
+
+
 class UpvoteAndDownvote(TestCase):
 
     def test_upvote_works_fine(self):
@@ -289,8 +375,53 @@ class UpvoteAndDownvote(TestCase):
         self.assertNotContains(response, 'Remove Upvote')
         self.assertNotContains(response, 'Remove Downvote')
 
+    def test_vote_as_json(self):
+        '''Votes asking for json get the new points and labels instead of a redirect'''
+        user = User(username='jsonvoter')
+        user.set_password('pass')
+        user.save()
+        Member.objects.create(user=user, bio='sdd')
+        forum = Forum.objects.create(owner=user, name='forum1', description='sdasd')
+        post = Post.objects.create(forum=forum, poster=user.member, title='a', content='a')
+
+        self.client.login(username='jsonvoter', password='pass')
+        url = reverse('forums:upvote_post', args=(post.pk,))
+        response = self.client.post(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), {
+            'points': 1, 'vote': 'U', 'upvote_label': 'Remove Upvote', 'downvote_label': 'Downvote'
+            })
+        response = self.client.post(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), {
+            'points': 0, 'vote': None, 'upvote_label': 'Upvote', 'downvote_label': 'Downvote'
+            })
+        response = self.client.post(reverse('forums:downvote_post', args=(post.pk,)), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['points'], -1)
+        self.assertEqual(response.json()['downvote_label'], 'Remove Downvote')
+
+    def test_changed_vote_is_dated(self):
+        '''Turning an upvote into a downvote dates the vote at the change'''
+        user = User(username='flipper')
+        user.set_password('pass')
+        user.save()
+        Member.objects.create(user=user, bio='sdd')
+        forum = Forum.objects.create(owner=user, name='forum1', description='sdasd')
+        post = Post.objects.create(forum=forum, poster=user.member, title='a', content='a')
+        long_ago = timezone.now() - timedelta(days=30)
+        PostVote.objects.create(post=post, user=user, kind_of_vote='U')
+        PostVote.objects.update(voted_at=long_ago)
+
+        self.client.login(username='flipper', password='pass')
+        self.client.post(reverse('forums:downvote_post', args=(post.pk,)))
+        vote = PostVote.objects.get()
+        self.assertEqual(vote.kind_of_vote, 'D')
+        self.assertGreater(vote.voted_at, long_ago + timedelta(days=29))
+
+
 class PublishEditAndDeletePost(TestCase):
 
+    def setUp(self):
+        caches['default'].clear()  # Write throttling buckets left by the posts of other tests
+
     def test_post_publishment_works(self):
         '''Test if the publishment process works well'''
         user = User(username='hellothere')
@@ -537,4 +668,837 @@ class PublishEditAndDeletePost(TestCase):
         edited_post = Post.objects.get(pk=post.pk)
         self.assertEqual(response.status_code, 403)
         self.assertEqual(edited_post.content, 'first content')  # content remains the same
-        self.assertIs(edited_post.edited, False)
\ No newline at end of file
+        self.assertIs(edited_post.edited, False)
+
+
+class PostFragmentCache(TestCase):
+
+    def test_edited_post_is_not_served_from_stale_fragment(self):
+        '''The cached fragment of a post is keyed on its last_modified, so editing it shows the new content'''
+        user = User(username='cacheuser')
+        user.set_password('pass')
+        user.save()
+        Member.objects.create(user=user, bio='sdd')
+        forum = Forum(owner=user, name='cacheforum', description='sdasd')
+        forum.save()
+        forum.members.add(user.member)
+        post = Post(forum=forum, poster=user.member, title='cached', content='first content')
+        post.save()
+
+        self.client.login(username='cacheuser', password='pass')
+        response = self.client.get(reverse('forums:show_forum', args=(forum.name,)))  # Warming the cache
+        self.assertContains(response, 'first content')
+
+        self.client.post(reverse('forums:edit_post', args=(post.pk,)), {
+            'new_content': 'second content'
+        })
+        response = self.client.get(reverse('forums:show_forum', args=(forum.name,)))
+        self.client.logout()
+
+        self.assertContains(response, 'second content')
+        self.assertNotContains(response, 'first content')
+
+    def test_voting_updates_cached_points(self):
+        '''Votes change last_modified too, so the points shown are never stale'''
+        user = User(username='cacheuser2')
+        user.set_password('pass')
+        user.save()
+        Member.objects.create(user=user, bio='sdd')
+        forum = Forum(owner=user, name='cacheforumb', description='sdasd')
+        forum.save()
+        forum.members.add(user.member)
+        post = Post(forum=forum, poster=user.member, title='cached', content='content')
+        post.save()
+
+        self.client.login(username='cacheuser2', password='pass')
+        self.assertContains(self.client.get(reverse('forums:show_forum', args=(forum.name,))), '0 Points')
+        response = self.client.post(reverse('forums:upvote_post', args=(post.pk,)), 
+            HTTP_REFERER=reverse('forums:show_forum', args=(forum.name,)),
+            follow=True
+            )
+        self.client.logout()
+
+        self.assertContains(response, '1 Point')
+        self.assertNotContains(response, '0 Points')
+
+
+class FastUrls(TestCase):
+
+    def test_build_url_matches_reverse(self):
+        '''The precomputed URL builders must produce exactly what reverse() does'''
+        self.assertEqual(build_url('forums:show_post', 42), reverse('forums:show_post', args=(42,)))
+        self.assertEqual(build_url('forums:upvote_post', 7), reverse('forums:upvote_post', args=(7,)))
+        self.assertEqual(build_url('comments:show_comment', 3), reverse('comments:show_comment', args=(3,)))
+        self.assertEqual(
+            build_url('members:show_member', 'jo@n+doe'), 
+            reverse('members:show_member', args=('jo@n+doe',))
+            )
+        self.assertEqual(
+            build_url('forums:show_forum', 'already exists'), 
+            reverse('forums:show_forum', args=('already exists',))
+            )
+
+
+class ReconcilePointsCommand(TestCase):
+
+    def setUp(self):
+        self.user = User(username='reconciler')
+        self.user.set_password('pass')
+        self.user.save()
+        Member.objects.create(user=self.user, bio='sdd')
+        self.forum = Forum(owner=self.user, name='reconcile', description='sdasd')
+        self.forum.save()
+
+    def test_drifted_points_are_fixed(self):
+        '''Points that do not match the vote records are recomputed, the right ones are untouched'''
+        voters = []
+        for i in range(3):
+            voter = User.objects.create(username=f'voter{i}')
+            voters.append(voter)
+        drifted = Post.objects.create(forum=self.forum, poster=self.user.member, title='a', content='a', points=10)
+        correct = Post.objects.create(forum=self.forum, poster=self.user.member, title='b', content='b', points=1)
+        PostVote.objects.create(post=drifted, user=voters[0], kind_of_vote='U')
+        PostVote.objects.create(post=drifted, user=voters[1], kind_of_vote='U')
+        PostVote.objects.create(post=drifted, user=voters[2], kind_of_vote='D')
+        PostVote.objects.create(post=correct, user=voters[0], kind_of_vote='U')
+
+        output = StringIO()
+        call_command('reconcile_points', chunk_size=1, stdout=output)
+
+        self.assertEqual(Post.objects.get(pk=drifted.pk).points, 1)
+        self.assertEqual(Post.objects.get(pk=correct.pk).points, 1)
+        self.assertIn('Post: checked 2, 1 with wrong points (total drift 9), fixed', output.getvalue())
+
+    def test_dry_run_only_reports(self):
+        '''With --dry-run the drift is reported but not fixed'''
+        post = Post.objects.create(forum=self.forum, poster=self.user.member, title='a', content='a', points=-4)
+
+        output = StringIO()
+        call_command('reconcile_points', dry_run=True, stdout=output)
+
+        self.assertEqual(Post.objects.get(pk=post.pk).points, -4)
+        self.assertIn('Post: checked 1, 1 with wrong points (total drift 4)', output.getvalue())
+
+
+class ActivityRollups(TestCase):
+
+    def setUp(self):
+        self.user = User(username='active')
+        self.user.set_password('pass')
+        self.user.save()
+        Member.objects.create(user=self.user, bio='sdd')
+        self.forum = Forum(owner=self.user, name='activity', description='sdasd')
+        self.forum.save()
+        self.forum.members.add(self.user.member)
+
+    def test_votes_and_posts_are_compacted_into_rollups(self):
+        '''Publishing and voting log raw events, compact_events adds them to the hourly and daily rollups'''
+        self.client.login(username='active', password='pass')
+        self.client.post(reverse('forums:publish_post', args=(self.forum.name,)), {
+            'post_title': 'title',
+            'post_content': 'content'
+        })
+        post = Post.objects.get(title='title')
+        self.client.post(reverse('forums:upvote_post', args=(post.pk,)))
+        self.client.post(reverse('forums:downvote_post', args=(post.pk,)))  # Takes the upvote back
+        self.client.post(reverse('comments:reply_to_post', args=(post.pk,)), {'comment_content': 'reply'})
+        self.client.logout()
+
+        self.assertEqual(compact_events(), 6)  # post, upvote, -upvote, downvote, comment, comment's self upvote
+        self.assertIs(ActivityEvent.objects.exists(), False)
+
+        for period in (Activity.HOURLY, Activity.DAILY):
+            forum_activity = ForumActivity.objects.get(forum=self.forum, period=period)
+            self.assertEqual(forum_activity.posts, 1)
+            self.assertEqual(forum_activity.comments, 1)
+            self.assertEqual(forum_activity.upvotes, 1)  # the one of the comment
+            self.assertEqual(forum_activity.downvotes, 1)
+
+            post_activity = PostActivity.objects.get(post=post, period=period)
+            self.assertEqual(post_activity.comments, 1)
+            self.assertEqual(post_activity.upvotes, 0)  # Votes on comments dont count for the post
+            self.assertEqual(post_activity.score, -1)
+
+    def test_top_posts_of_the_day(self):
+        '''top_posts ranks by the votes of the period, not by the all time points'''
+        old_favourite = Post.objects.create(forum=self.forum, poster=self.user.member, title='a', content='a', points=50)
+        rising = Post.objects.create(forum=self.forum, poster=self.user.member, title='b', content='b')
+        self.client.login(username='active', password='pass')
+        self.client.post(reverse('forums:upvote_post', args=(rising.pk,)))
+        self.client.logout()
+        compact_events()
+
+        self.assertEqual([post.pk for post in top_posts(days=1)], [rising.pk])
+        self.assertEqual([post.pk for post in top_posts()], [old_favourite.pk, rising.pk])
+
+
+class TrendingForums(TestCase):
+
+    def setUp(self):
+        self.user = User(username='trendsetter')
+        self.user.set_password('pass')
+        self.user.save()
+        Member.objects.create(user=self.user, bio='sdd')
+        self.quiet = Forum.objects.create(owner=self.user, name='quietforum', description='a')
+        self.busy = Forum.objects.create(owner=self.user, name='busyforum', description='b')
+
+    def test_activity_makes_forum_trend(self):
+        '''Joining and posting raise the score of a forum, the trending page lists the busiest first'''
+        self.client.login(username='trendsetter', password='pass')
+        self.client.post(reverse('forums:join_forum', args=(self.busy.name,)))
+        self.client.post(reverse('forums:publish_post', args=(self.busy.name,)), {
+            'post_title': 'title',
+            'post_content': 'content'
+        })
+        response = self.client.get(reverse('forums:trending_forums'))
+        self.client.logout()
+
+        self.assertGreater(Forum.objects.get(pk=self.busy.pk).trending_score, 0)
+        self.assertEqual(Forum.objects.get(pk=self.quiet.pk).trending_score, 0)
+        self.assertEqual([forum.pk for forum in response.context['forums_list']], [self.busy.pk, self.quiet.pk])
+
+    def test_renormalize_keeps_current_scores(self):
+        '''Moving the epoch rescales the stored scores without changing the real (decayed) ones'''
+        trending.bump(self.busy.pk, 'post')
+        epoch = TrendingEpoch.objects.get()
+        epoch.started_at -= settings.TRENDING_HALF_LIFE  # As if the last renormalization was one half life ago
+        epoch.save()
+        before = trending.trending_forums()[0].current_trending_score
+
+        call_command('renormalize_trending', stdout=StringIO())
+
+        after = trending.trending_forums()[0]
+        self.assertEqual(after.pk, self.busy.pk)
+        self.assertAlmostEqual(after.current_trending_score, before, places=3)
+        self.assertAlmostEqual(after.trending_score, settings.TRENDING_WEIGHTS['post'] / 2, places=2)  # Epoch is now
+
+
+class ExportAndImportForums(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='exporter')
+        self.voter = User.objects.create(username='exportvoter')
+        Member.objects.create(user=self.owner, bio='a')
+        Member.objects.create(user=self.voter, bio='b')
+        self.forum = Forum.objects.create(owner=self.owner, name='exportedforum', description='dumped')
+        self.forum.members.add(self.owner.member, self.voter.member)
+        self.post = Post.objects.create(forum=self.forum, poster=self.owner.member, title='t', content='c', points=1)
+        PostVote.objects.create(post=self.post, user=self.voter, kind_of_vote=PostVote.UPVOTE)
+        self.comment = Comment.objects.create(post=self.post, commenter=self.voter.member, content='first')
+        self.reply = Comment.objects.create(in_reply_to=self.comment, commenter=self.owner.member, content='reply', points=-1)
+        CommentVote.objects.create(comment=self.reply, user=self.voter, kind_of_vote=CommentVote.DOWNVOTE)
+        Comment.objects.create(in_reply_to=self.reply, commenter=self.voter.member, content='reply to reply')
+
+    def import_dump(self, content, **options):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as dump_file:
+            dump_file.write(content)
+        self.addCleanup(os.remove, dump_file.name)
+        output = StringIO()
+        call_command('import_forums', dump_file.name, batch_size=1, stdout=output, stderr=StringIO(), **options)
+        return output.getvalue()
+
+    def test_round_trip(self):
+        '''A forum deleted after being exported comes back with the same threads, votes and timestamps'''
+        output = StringIO()
+        call_command('export_forums', 'exportedforum', stdout=output)
+        pub_date = self.post.pub_date
+        self.forum.delete()
+
+        self.import_dump(output.getvalue())
+
+        forum = Forum.objects.get(name='exportedforum')
+        self.assertEqual(set(forum.members.values_list('user__username', flat=True)), {'exporter', 'exportvoter'})
+        post = forum.post_set.get()
+        self.assertEqual((post.points, post.pub_date), (1, pub_date))
+        self.assertEqual(post.postvote_set.get().user, self.voter)
+        comment = post.comment_set.get()
+        reply = comment.comment_set.get()
+        self.assertEqual((reply.content, reply.commenter, reply.points), ('reply', self.owner.member, -1))
+        self.assertEqual(reply.commentvote_set.get().kind_of_vote, CommentVote.DOWNVOTE)
+        self.assertEqual(reply.comment_set.get().content, 'reply to reply')
+
+    def test_repeated_votes_and_unknown_users(self):
+        '''Repeated votes are loaded once and users that do not exist are created'''
+        lines = [
+            {'type': 'forum', 'id': 7, 'name': 'importedforum', 'description': 'd', 'owner': 'newcomer'},
+            {'type': 'post', 'id': 3, 'forum': 7, 'poster': 'newcomer', 'title': 't', 'content': 'c', 'points': 1},
+            {'type': 'post_vote', 'post': 3, 'user': 'exportvoter', 'kind_of_vote': 'U'},
+            {'type': 'post_vote', 'post': 3, 'user': 'exportvoter', 'kind_of_vote': 'U'},
+            {'type': 'post_vote', 'post': 99, 'user': 'exportvoter', 'kind_of_vote': 'U'},
+        ]
+        self.import_dump(''.join(json.dumps(line) + '\n' for line in lines))
+
+        post = Post.objects.get(forum__name='importedforum')
+        self.assertEqual(post.poster.user.username, 'newcomer')
+        self.assertIs(post.poster.user.has_usable_password(), False)
+        self.assertEqual(post.postvote_set.count(), 1)
+
+    def test_too_similar_forum_is_skipped(self):
+        '''Importing a forum whose name clashes with an existent one skips it and keeps the rest'''
+        lines = [
+            {'type': 'forum', 'id': 1, 'name': 'exported_forum', 'description': 'd', 'owner': 'exporter'},
+            {'type': 'post', 'id': 1, 'forum': 1, 'poster': 'exporter', 'title': 't', 'content': 'c'},
+            {'type': 'forum', 'id': 2, 'name': 'otherforum', 'description': 'd', 'owner': 'exporter'},
+        ]
+        output = self.import_dump(''.join(json.dumps(line) + '\n' for line in lines))
+
+        self.assertIn('1 skipped forums', output)
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertIs(Forum.objects.filter(name='otherforum').exists(), True)
+
+    def test_users_of_a_skipped_forum(self):
+        '''A user created by a skipped forum is rolled back with it and created again by the next forum'''
+        lines = [
+            {'type': 'forum', 'id': 1, 'name': 'exported_forum', 'description': 'd', 'owner': 'sharedowner'},
+            {'type': 'post', 'id': 1, 'forum': 1, 'poster': 'sharedposter', 'title': 't', 'content': 'c'},
+            {'type': 'forum', 'id': 2, 'name': 'otherforum', 'description': 'd', 'owner': 'sharedowner'},
+            {'type': 'post', 'id': 2, 'forum': 2, 'poster': 'sharedposter', 'title': 't', 'content': 'c'},
+            {'type': 'post_vote', 'post': 2, 'user': 'sharedowner', 'kind_of_vote': 'U'},
+        ]
+        output = self.import_dump(''.join(json.dumps(line) + '\n' for line in lines))
+
+        self.assertIn('1 skipped forums', output)
+        self.assertIn('2 created users', output)
+        post = Post.objects.get(forum__name='otherforum')
+        self.assertEqual(post.forum.owner.username, 'sharedowner')
+        self.assertEqual(post.poster.user.username, 'sharedposter')
+        self.assertEqual(post.postvote_set.get().user.username, 'sharedowner')
+
+
+class ParallelImport(TransactionTestCase):
+    '''import_forums --jobs, with the transactions of the forums of several dumps at the same time'''
+    databases = '__all__'  # Every shard
+
+    def test_jobs_share_a_database(self):
+        '''Dumps loaded in parallel into the same sqlite database wait for each other instead of failing'''
+        names = ['alphaforum', 'bravoforum', 'charliehub', 'deltaplace', 'echospace', 'foxtrotden']
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for number, name in enumerate(names):
+                lines = [{'type': 'forum', 'id': number, 'name': name, 'description': 'd', 'owner': 'parallelowner'}]
+                lines += [
+                    {'type': 'post', 'id': pk, 'forum': number, 'poster': f'poster{pk % 3}', 'title': 't', 'content': 'c'}
+                    for pk in range(50)
+                    ]
+                paths.append(os.path.join(directory, f'{name}.jsonl'))
+                with open(paths[-1], 'w') as dump_file:
+                    dump_file.writelines(json.dumps(line) + '\n' for line in lines)
+            output = StringIO()
+            call_command('import_forums', *paths, jobs=4, batch_size=5, stdout=output, stderr=StringIO())
+
+        self.assertEqual(set(Forum.objects.values_list('name', flat=True)), set(names))
+        self.assertEqual(sum(Post.objects.using(shard).count() for shard in sharding.shards()), 50 * len(names))
+        self.assertEqual(User.objects.filter(username__startswith='poster').count(), 3)
+
+
+class ArchiveThreads(TestCase):
+
+    def setUp(self):
+        self.user = User(username='archivist')
+        self.user.set_password('pass')
+        self.user.save()
+        Member.objects.create(user=self.user, bio='a')
+        self.forum = Forum.objects.create(owner=self.user, name='oldforum', description='d')
+        self.old_post = Post.objects.create(forum=self.forum, poster=self.user.member, title='old', content='old post')
+        PostVote.objects.create(post=self.old_post, user=self.user, kind_of_vote=PostVote.UPVOTE)
+        self.comment = Comment.objects.create(post=self.old_post, commenter=self.user.member, content='old comment')
+        self.reply = Comment.objects.create(in_reply_to=self.comment, commenter=self.user.member, content='old reply')
+        CommentVote.objects.create(comment=self.reply, user=self.user, kind_of_vote=CommentVote.DOWNVOTE)
+        self.new_post = Post.objects.create(forum=self.forum, poster=self.user.member, title='new', content='new post')
+
+        long_ago = timezone.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS + 1)
+        Post.objects.filter(pk=self.old_post.pk).update(last_modified=long_ago)
+        Comment.objects.all().update(last_modified=long_ago)
+
+    def test_old_threads_are_archived(self):
+        '''Old threads leave the hot tables and are still shown, read only, from the archive'''
+        call_command('archive_threads', stdout=StringIO())
+
+        self.assertEqual(list(Post.objects.values_list('pk', flat=True)), [self.new_post.pk])
+        self.assertEqual(Comment.objects.count(), 0)
+        self.assertEqual(ArchivedPost.objects.get().pk, self.old_post.pk)
+        self.assertEqual(ArchivedComment.objects.get(pk=self.reply.pk).thread_id, self.old_post.pk)
+        self.assertEqual(ArchivedCommentVote.objects.get().comment_id, self.reply.pk)
+
+        response = self.client.get(reverse('forums:show_post', args=(self.old_post.pk,)))
+        self.assertContains(response, 'old comment')
+        self.assertContains(response, 'archived')
+        response = self.client.get(reverse('comments:show_comment', args=(self.reply.pk,)))
+        self.assertContains(response, 'old reply')
+
+        self.client.login(username='archivist', password='pass')
+        response = self.client.post(reverse('forums:upvote_post', args=(self.old_post.pk,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_recently_active_threads_are_kept(self):
+        '''A thread with a recently modified comment stays in the hot tables'''
+        Comment.objects.filter(pk=self.reply.pk).update(last_modified=timezone.now())
+
+        call_command('archive_threads', stdout=StringIO())
+
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(ArchivedPost.objects.count(), 0)
+
+    def test_deleting_the_user_deletes_its_archived_content(self):
+        '''The archive has no foreign keys, deleting a user still deletes what they wrote there'''
+        call_command('archive_threads', stdout=StringIO())
+        self.user.delete()
+
+        self.assertEqual(ArchivedPost.objects.count(), 0)
+        self.assertEqual(ArchivedComment.objects.count(), 0)
+        self.assertEqual(ArchivedCommentVote.objects.count(), 0)
+
+
+class ShardHelpers(TestCase):
+
+    @override_settings(FORUM_SHARDS=['first', 'second', 'third'])
+    def test_lookups_by_id_start_by_the_home_shard(self):
+        '''The shard where an object was created is tried first, the others after it'''
+        self.assertEqual(sharding.shards_for_id(5), ['first', 'second', 'third'])
+        self.assertEqual(sharding.shards_for_id(2 * sharding.SHARD_ID_BLOCK + 5), ['third', 'first', 'second'])
+        self.assertEqual(sharding.shards_for_id(7 * sharding.SHARD_ID_BLOCK), ['first', 'second', 'third'])
+
+    @skipUnless(len(settings.FORUM_SHARDS) == 1, 'Only with the default settings')
+    def test_single_shard_changes_nothing(self):
+        '''With the default settings content stays in the default db'''
+        user = User.objects.create(username='single')
+        Member.objects.create(user=user)
+        forum = Forum.objects.create(owner=user, name='singleforum', description='d')
+        post = Post.objects.create(forum=forum, poster=user.member, title='t', content='c')
+
+        self.assertEqual(forum.shard, 'default')
+        self.assertEqual(post._state.db, 'default')
+        self.assertEqual(sharding.gather(Post.objects.all(), order_by=('-pk',), limit=5), [post])
+
+
+# The shards of the Sharding tests: in-memory sqlite databases that only exist while they run, so
+# they run with the default settings too
+TEST_SHARDS = ['test_shard_0', 'test_shard_1']
+
+
+@override_settings(FORUM_SHARDS=TEST_SHARDS)
+class Sharding(TestCase):
+    databases = '__all__'  # Including the TEST_SHARDS, which are added before it is expanded
+
+    @classmethod
+    def setUpClass(cls):
+        # Migrated as shards, which also seeds their id blocks
+        with override_settings(FORUM_SHARDS=TEST_SHARDS):
+            for alias in TEST_SHARDS:
+                settings.DATABASES[alias] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+                connections.settings[alias] = connections.configure_settings(settings.DATABASES)[alias]
+                connections[alias].creation.create_test_db(verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in TEST_SHARDS:
+            connections[alias].creation.destroy_test_db(':memory:', verbosity=0)
+            del connections[alias]
+            connections.settings.pop(alias, None)  # Usually settings.DATABASES itself
+            settings.DATABASES.pop(alias, None)
+
+    def setUp(self):
+        caches['objects'].clear()  # Forums cached by other tests, with their shard
+        self.user = User(username='sharded')
+        self.user.set_password('pass')
+        self.user.save()
+        Member.objects.create(user=self.user, bio='a')
+        self.forums = [
+            Forum.objects.create(owner=self.user, name=name, description='d')
+            for name in ('firstforum', 'secondforum')
+        ]
+        self.posts = [
+            forum.post_set.create(poster=self.user.member, title=forum.name, content='c')
+            for forum in self.forums
+        ]
+        self.client.login(username='sharded', password='pass')
+
+    def test_content_lives_in_the_shard_of_its_forum(self):
+        '''New forums go to the emptiest shard and their content follows them'''
+        self.assertNotEqual(self.forums[0].shard, self.forums[1].shard)
+        for forum, post in zip(self.forums, self.posts):
+            comment = post.comment_set.create(commenter=self.user.member, content='c')
+            reply = Comment(in_reply_to=comment, commenter=self.user.member, content='r')
+            reply.save()
+            self.assertEqual(post._state.db, forum.shard)
+            self.assertEqual(reply._state.db, forum.shard)
+            self.assertEqual(post.pk // sharding.SHARD_ID_BLOCK, sharding.shards().index(forum.shard))
+
+            response = self.client.post(reverse('forums:upvote_post', args=(post.pk,)))
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(Post.objects.using(forum.shard).get(pk=post.pk).points, 1)
+            self.assertContains(self.client.get(reverse('comments:show_comment', args=(reply.pk,))), 'r')
+
+    def test_profile_gathers_posts_of_every_shard(self):
+        '''Cross forum pages ask every shard'''
+        response = self.client.get(reverse('members:profile'))
+        self.assertContains(response, 'firstforum')
+        self.assertContains(response, 'secondforum')
+
+    def test_rebalance_moves_forum_keeping_ids(self):
+        '''A moved forum keeps its post ids, and new ids in its new shard do not collide with the old shard'''
+        # From the second shard to the first one, whose ids are lower
+        forum, post = self.forums[1], self.posts[1]
+        comment = post.comment_set.create(commenter=self.user.member, content='moved comment')
+        comment.commentvote_set.create(user=self.user, kind_of_vote=CommentVote.UPVOTE)
+        source, destination = forum.shard, self.forums[0].shard
+
+        call_command('rebalance_shards', 'secondforum', to=destination, stdout=StringIO())
+
+        forum.refresh_from_db()
+        self.assertEqual(forum.shard, destination)
+        self.assertIs(Post.objects.using(source).filter(forum_id=forum.pk).exists(), False)
+        self.assertEqual(Comment.objects.using(destination).get(pk=comment.pk).commentvote_set.count(), 1)
+        self.assertContains(self.client.get(reverse('forums:show_post', args=(post.pk,))), 'moved comment')
+
+        new_post = forum.post_set.create(poster=self.user.member, title='new', content='c')
+        source_forum = Forum.objects.create(owner=self.user, name='thirdforum', description='d')
+        self.assertEqual(source_forum.shard, source)
+        source_post = source_forum.post_set.create(poster=self.user.member, title='other', content='c')
+        all_pks = [pk for shard in sharding.shards() for pk in Post.objects.using(shard).values_list('pk', flat=True)]
+        self.assertEqual(len(all_pks), len(set(all_pks)))
+        self.assertIn(new_post.pk, all_pks)
+        self.assertIn(source_post.pk, all_pks)
+
+
+class ForumCache(TestCase):
+
+    def setUp(self):
+        caches['objects'].clear()
+        self.user = User.objects.create(username='cached')
+        Member.objects.create(user=self.user)
+
+    def test_forums_are_read_once(self):
+        '''A forum is read from the db once, then from the cache by name and by id'''
+        forum = Forum.objects.create(owner=self.user, name='cachedforum', description='d')
+        with self.assertNumQueries(1):
+            self.assertEqual(forum_cache.get_forum_by_name('cachedforum'), forum)
+            self.assertEqual(forum_cache.get_forum_by_name('cachedforum'), forum)
+            self.assertEqual(forum_cache.get_forum(forum.pk), forum)
+
+    def test_missing_forums_are_cached_until_created(self):
+        '''Names without a forum are cached as missing, creating the forum replaces that'''
+        with self.assertNumQueries(1):
+            self.assertIsNone(forum_cache.get_forum_by_name('notyetforum'))
+            self.assertIsNone(forum_cache.get_forum_by_name('notyetforum'))
+        response = self.client.get(reverse('forums:show_forum', args=('notyetforum',)))
+        self.assertEqual(response.status_code, 404)
+
+        forum = Forum.objects.create(owner=self.user, name='notyetforum', description='d')
+        self.assertEqual(forum_cache.get_forum_by_name('notyetforum'), forum)
+        response = self.client.get(reverse('forums:show_forum', args=('notyetforum',)))
+        self.assertEqual(response.status_code, 200)
+
+    def test_deleted_forums_are_uncached(self):
+        '''Deleting a forum deletes its cache entries'''
+        forum = Forum.objects.create(owner=self.user, name='goneforum', description='d')
+        forum_cache.get_forum_by_name('goneforum')
+        pk = forum.pk
+        forum.delete()
+
+        self.assertIsNone(forum_cache.get_forum_by_name('goneforum'))
+        self.assertIsNone(forum_cache.get_forum(pk))
+
+
+class LastActivity(TestCase):
+
+    def setUp(self):
+        self.user = User(username='active')
+        self.user.set_password('pass')
+        self.user.save()
+        Member.objects.create(user=self.user, bio='a')
+        long_ago = timezone.now() - timedelta(days=400)
+        self.quiet = Forum.objects.create(owner=self.user, name='quietforum', description='d')
+        self.busy = Forum.objects.create(owner=self.user, name='busyforum', description='d')
+        Forum.objects.update(last_activity_at=long_ago)
+        self.old_post = Post.objects.create(forum=self.busy, poster=self.user.member, title='oldthread', content='c')
+        self.new_post = Post.objects.create(forum=self.busy, poster=self.user.member, title='newthread', content='c')
+        Post.objects.filter(pk=self.old_post.pk).update(last_comment_at=long_ago)
+        self.client.login(username='active', password='pass')
+
+    def test_comments_bump_their_thread_and_forum(self):
+        '''A new comment, even a nested reply, moves its thread to the top of the forum and the forum to the top of the directory'''
+        comment = Comment.objects.create(post=self.old_post, commenter=self.user.member, content='c')
+        self.client.post(reverse('comments:reply_to_comment', args=(comment.pk,)), {'comment_content': 'bump'})
+
+        response = self.client.get(reverse('forums:show_forum', args=('busyforum',)))
+        self.assertEqual([post.title for post in response.context['posts_to_show']], ['oldthread', 'newthread'])
+        response = self.client.get(reverse('forums:forums_home'), {'sort': 'active'})
+        self.assertEqual([forum.name for forum in response.context['forums_list']], ['busyforum', 'quietforum'])
+
+    def test_stale_forums(self):
+        '''Forums without new posts or comments are listed as stale'''
+        self.busy.members.add(self.user.member)
+        self.client.post(reverse('forums:publish_post', args=('busyforum',)), {'post_title': 't', 'post_content': 'c'})
+
+        out = StringIO()
+        call_command('stale_forums', days=30, stdout=out)
+        self.assertIn('quietforum', out.getvalue())
+        self.assertNotIn('busyforum', out.getvalue())
+
+
+@override_settings(LIVE_COALESCE_SECONDS=0, LIVE_MAX_PENDING=3)
+class LiveUpdates(TestCase):
+
+    def setUp(self):
+        self.user = User(username='live')
+        self.user.set_password('pass')
+        self.user.save()
+        Member.objects.create(user=self.user, bio='a')
+        self.forum = Forum.objects.create(owner=self.user, name='liveforum', description='d')
+        self.post = Post.objects.create(forum=self.forum, poster=self.user.member, title='t', content='c')
+
+    async def test_votes_are_coalesced_and_slow_readers_reset(self):
+        '''Point changes of the same post replace each other, a subscription that falls too far behind overflows'''
+        subscription = live.hub.subscribe(live.post_topic(1))
+        try:
+            for points in (1, 2, 3):
+                live.hub.publish([live.post_topic(1)], 'points', {'post': 1, 'points': points}, coalesce=('points', 1))
+            live.hub.publish([live.post_topic(1)], 'comment', {'id': 5})
+            await asyncio.sleep(0)
+            self.assertEqual(subscription.take(), [('points', {'post': 1, 'points': 3}), ('comment', {'id': 5})])
+
+            for comment_pk in range(4):
+                live.hub.publish([live.post_topic(1)], 'comment', {'id': comment_pk})
+            await asyncio.sleep(0)
+            self.assertIs(subscription.overflowed, True)
+        finally:
+            live.hub.unsubscribe(subscription)
+        self.assertEqual(live.hub.subscribers(live.post_topic(1)), 0)
+
+    def test_write_paths_publish_on_commit(self):
+        '''Replies and votes publish their events once committed'''
+        self.client.login(username='live', password='pass')
+        with mock.patch.object(live.hub, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('comments:reply_to_post', args=(self.post.pk,)), {'comment_content': 'hi'})
+                self.client.post(reverse('forums:upvote_post', args=(self.post.pk,)))
+        kinds = [call.args[1] for call in publish.call_args_list]
+        self.assertEqual(kinds, ['comment', 'points', 'points'])  # The comment, its automatic upvote and the post vote
+        self.assertIn(live.post_topic(self.post.pk), publish.call_args_list[0].args[0])
+
+    async def test_stream(self):
+        '''The stream sends the events of the post until the reader disconnects'''
+        communicator = ApplicationCommunicator(live_updates, {
+            'type': 'http', 'method': 'GET', 'path': f'/live/post/{self.post.pk}/', 'headers': []
+            })
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        self.assertEqual((await communicator.receive_output(timeout=5))['status'], 200)
+        await communicator.receive_output(timeout=1)  # retry
+
+        live.hub.publish([live.post_topic(self.post.pk)], 'points', {'post': self.post.pk, 'points': 7})
+        message = await communicator.receive_output(timeout=1)
+        self.assertEqual(message['body'], f'event: points\ndata: {{"post": {self.post.pk}, "points": 7}}\n\n'.encode())
+
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(timeout=1)
+        self.assertEqual(live.hub.subscribers(live.post_topic(self.post.pk)), 0)
+
+    async def test_missing_post(self):
+        '''Streams of posts that do not exist are 404'''
+        communicator = ApplicationCommunicator(live_updates, {
+            'type': 'http', 'method': 'GET', 'path': '/live/post/999999/', 'headers': []
+            })
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        self.assertEqual((await communicator.receive_output(timeout=5))['status'], 404)
+
+
+class BulkPoints(TestCase):
+
+    def setUp(self):
+        self.user = User(username='scores')
+        self.user.set_password('pass')
+        self.user.save()
+        Member.objects.create(user=self.user, bio='a')
+        forum = Forum.objects.create(owner=self.user, name='scoresforum', description='d')
+        self.post = Post.objects.create(forum=forum, poster=self.user.member, title='t', content='c', points=4)
+        self.other = Post.objects.create(forum=forum, poster=self.user.member, title='t2', content='c2')
+        self.comment = Comment.objects.create(post=self.post, commenter=self.user.member, content='c', points=2)
+        Comment.objects.create(post=self.post, commenter=self.user.member, content='c')
+        Comment.objects.create(in_reply_to=self.comment, commenter=self.user.member, content='r')
+        self.post.postvote_set.create(user=self.user, kind_of_vote='U')
+        self.comment.commentvote_set.create(user=self.user, kind_of_vote='D')
+
+    def test_scores(self):
+        '''Points, direct replies and vote of the user, with one query per table'''
+        self.client.login(username='scores', password='pass')
+        url = reverse('forums:bulk_points')
+        with self.assertNumQueries(1 + 6):  # The user, then 3 tables for posts and 3 for comments
+            response = self.client.get(url, {
+                'posts': f'{self.post.pk},{self.other.pk},999999', 'comments': str(self.comment.pk)
+                })
+        self.assertEqual(response.json(), {
+            'posts': {str(self.post.pk): [4, 2, 'U'], str(self.other.pk): [0, 0, None]},
+            'comments': {str(self.comment.pk): [2, 1, 'D']},
+        })
+
+    def test_anonymous_and_invalid_requests(self):
+        '''Anonymous users get no vote, and bad or too many ids are rejected'''
+        url = reverse('forums:bulk_points')
+        response = self.client.get(url, {'posts': str(self.post.pk)})
+        self.assertEqual(response.json(), {'posts': {str(self.post.pk): [4, 2, None]}, 'comments': {}})
+        self.assertEqual(self.client.get(url, {'posts': '1,a'}).status_code, 400)
+        oversized = str(2 ** 63)  # Does not fit in the integer columns
+        self.assertEqual(self.client.get(url, {'posts': f'1,{oversized}'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'comments': oversized}).status_code, 400)
+        with self.settings(BULK_POINTS_MAX_IDS=2):
+            self.assertEqual(self.client.get(url, {'posts': '1,2', 'comments': '3'}).status_code, 400)
+
+
+@override_settings(WRITE_THROTTLE_RATES={
+    'post_per_user': (2, 60),
+    'post_per_ip': (100, 60),
+    'comment_per_user': (100, 60),
+    'comment_per_ip': (100, 60),
+    'vote_per_user': (100, 60),
+    'vote_per_ip': (3, 60),
+})
+class WriteThrottling(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User(username='writer')
+        self.user.set_password('pass')
+        self.user.save()
+        Member.objects.create(user=self.user, bio='a')
+        self.forum = Forum.objects.create(owner=self.user, name='writeforum', description='d')
+        self.forum.members.add(self.user.member)
+        self.client.login(username='writer', password='pass')
+
+    def tearDown(self):
+        caches['default'].clear()  # So the writes made here dont count in other tests
+
+    def test_posts_throttled_per_user(self):
+        '''Once the bucket of the user is empty the writes get a 429 and nothing is written'''
+        url = reverse('forums:publish_post', args=(self.forum.name,))
+        for i in range(2):
+            self.client.post(url, {'post_title': f't{i}', 'post_content': 'c'})
+        with self.assertNumQueries(1):  # The user, for login_required
+            response = self.client.post(url, {'post_title': 't2', 'post_content': 'c'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')  # 2 tokens a minute
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(self.client.get(url).status_code, 200)  # Reading the form is not a write
+
+    def test_votes_throttled_per_ip(self):
+        '''Votes from the same ip share a bucket, json votes get a json 429'''
+        post = Post.objects.create(forum=self.forum, poster=self.user.member, title='t', content='c')
+        url = reverse('forums:upvote_post', args=(post.pk,))
+        for _ in range(3):
+            self.client.post(url, HTTP_ACCEPT='application/json')
+        response = self.client.post(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('error', response.json())
+        self.assertEqual(self.client.post(url, REMOTE_ADDR='10.0.0.2').status_code, 302)
+
+    def test_bucket_refills(self):
+        '''The bucket gets a token back every seconds / tokens seconds'''
+        throttle = write_throttles['post'][0]
+        with mock.patch('members.throttling.time.time', return_value=1000.0):
+            self.assertEqual([throttle.take('x') for _ in range(3)], [0, 0, 30])
+        with mock.patch('members.throttling.time.time', return_value=1030.0):
+            self.assertEqual(throttle.take('x'), 0)
+            self.assertGreater(throttle.take('x'), 0)
+
+
+class NearDuplicates(TestCase):
+    SPAM = 'Buy cheap watches at our shop today, the best prices you will ever find online'
+
+    def setUp(self):
+        caches['default'].clear()  # Write throttling
+        self.user = User(username='dup')
+        self.user.set_password('pass')
+        self.user.save()
+        Member.objects.create(user=self.user, bio='a')
+        self.forum = Forum.objects.create(owner=self.user, name='dupforum', description='d')
+        self.other_forum = Forum.objects.create(owner=self.user, name='otherforum', description='d')
+        for forum in (self.forum, self.other_forum):
+            forum.members.add(self.user.member)
+        self.client.login(username='dup', password='pass')
+
+    def tearDown(self):
+        caches['default'].clear()
+
+    def publish(self, forum, content):
+        return self.client.post(reverse('forums:publish_post', args=(forum.name,)), {
+            'post_title': 'title', 'post_content': content
+            })
+
+    def test_simhash(self):
+        '''Texts that share most of their words are a few bits apart, unrelated texts are not'''
+        spam = duplicates.simhash(self.SPAM)
+        self.assertEqual(duplicates.distance(spam, duplicates.simhash(self.SPAM.upper() + '!!')), 0)
+        self.assertLessEqual(duplicates.distance(spam, duplicates.simhash(self.SPAM.replace('shop', 'store'))), 10)
+        self.assertGreater(duplicates.distance(spam, duplicates.simhash('What is your favourite book about the sea?')), 10)
+        self.assertEqual(duplicates.features('Is there 1 thing you would change in it?'), ['change'])
+        self.assertEqual(len(duplicates.bands(spam)), duplicates.BANDS)
+        self.assertTrue(-2 ** 63 <= spam < 2 ** 63)
+
+    @override_settings(NEAR_DUPLICATE_ACTION='reject')
+    def test_copies_are_rejected(self):
+        '''With NEAR_DUPLICATE_ACTION = 'reject' a copy of a recent post of the same forum is rejected, in other forums it is not'''
+        self.publish(self.forum, self.SPAM)
+        response = self.publish(self.forum, self.SPAM + '!!!')
+        self.assertContains(response, 'looks like a copy')
+        self.assertEqual(self.forum.post_set.count(), 1)
+        self.assertEqual(self.publish(self.other_forum, self.SPAM).status_code, 302)
+        self.publish(self.forum, 'thanks a lot')
+        self.assertEqual(self.publish(self.forum, 'thanks a lot').status_code, 302)  # Too short to be checked
+
+        post = self.forum.post_set.first()
+        self.client.post(reverse('comments:reply_to_post', args=(post.pk,)), {'comment_content': self.SPAM})
+        self.assertEqual(Comment.objects.count(), 0)
+
+    def test_copies_are_flagged(self):
+        '''By default copies are published and their fingerprint is flagged'''
+        self.publish(self.forum, self.SPAM)
+        self.publish(self.forum, self.SPAM)
+        self.assertEqual(self.forum.post_set.count(), 2)
+        self.assertEqual(list(Fingerprint.objects.order_by('pk').values_list('near_duplicate', flat=True)), [False, True])
+
+    @override_settings(NEAR_DUPLICATE_ACTION='reject')
+    def test_short_replies_are_not_copies(self):
+        '''Short replies on the same subject are published, even when they only differ in one word'''
+        post = self.forum.post_set.create(poster=self.user.member, title='t', content='What should I try?')
+        replies = [
+            'I have the same problem with my laptop', 'I have the same problem with my phone',
+            'This is the best movie I have seen this year', 'This is the worst movie I have seen this year',
+            'Does anyone know how to fix this error in python', 'Does anyone know how to fix this error in java',
+            ]
+        for reply in replies:
+            self.client.post(reverse('comments:reply_to_post', args=(post.pk,)), {'comment_content': reply})
+        self.assertEqual(post.comment_set.count(), len(replies))
+        self.assertFalse(Fingerprint.objects.exists())
+
+    @override_settings(NEAR_DUPLICATE_ACTION='reject')
+    def test_edits_update_the_fingerprint(self):
+        '''An edited post is looked up by its new content'''
+        self.publish(self.forum, self.SPAM)
+        post = self.forum.post_set.get()
+        self.client.post(reverse('forums:edit_post', args=(post.pk,)), {'new_content': 'A long review of the new season of my favourite show, the actors and the soundtrack'})
+        self.assertEqual(self.publish(self.forum, self.SPAM).status_code, 302)
+        self.assertEqual(Fingerprint.objects.filter(post=post).count(), 1)
+
+    @override_settings(NEAR_DUPLICATE_ACTION='reject')
+    def test_backfill(self):
+        '''The command fingerprints the content that has no SimHash and drops the old fingerprints'''
+        post = self.forum.post_set.create(poster=self.user.member, title='t', content=self.SPAM)
+        reply = post.comment_set.create(
+            commenter=self.user.member,
+            content='I do not think these watches are cheap at all, the prices of that shop are higher than anywhere else'
+            )
+        reply.comment_set.create(commenter=self.user.member, content='short')
+        old = Fingerprint.objects.create(forum=self.forum, post=post, simhash=1, **dict.fromkeys(
+            [f'band{band}' for band in range(duplicates.BANDS)], 0
+            ))
+        Fingerprint.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=2))
+
+        call_command('backfill_fingerprints', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.simhash, duplicates.simhash(self.SPAM))
+        self.assertFalse(Comment.objects.filter(simhash__isnull=True).exists())
+        self.assertEqual(Fingerprint.objects.count(), 2)  # The post and the reply, not the short one nor the old one
+        self.assertEqual(Fingerprint.objects.get(comment=reply).post, post)
+        self.assertContains(self.publish(self.forum, self.SPAM), 'looks like a copy')
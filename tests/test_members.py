@@ -1,8 +1,14 @@
+import json
+
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache, caches
 from django.contrib.auth.models import User
 
+from members import profile_cache
 from members.models import Member
+from forums.models import Forum, Post
+from comments.models import Comment, CommentVote
 
 class SingupViewTests(TestCase):
     def test_display_message_user_already_exists(self):
@@ -147,6 +153,61 @@ class LoginViewTests(TestCase):
         self.assertEqual(response.url, reverse('members:feed'))
 
 
+@override_settings(AUTH_THROTTLE_RATES={
+    'login_per_ip': (4, 60),
+    'login_per_username': (2, 60),
+    'singup_per_ip': (1, 60)
+})
+class ThrottlingTests(TestCase):
+
+    def tearDown(self):
+        cache.clear()  # So the attempts made here dont count in other tests
+
+    def test_login_throttled_per_username(self):
+        '''After too many attempts for the same username we answer 429 without checking the password'''
+        user = User(username='throttled')
+        user.set_password('1234')
+        user.save()
+        Member.objects.create(user=user, bio='bio')
+
+        for _ in range(2):
+            self.client.post(reverse('members:login'), {'username': 'throttled', 'password': 'wrong'})
+        response = self.client.post(reverse('members:login'), {'username': 'throttled', 'password': '1234'})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertContains(response, 'Too many attempts', status_code=429)
+        
+        # Other usernames from the same ip are not throttled yet
+        response = self.client.post(reverse('members:login'), {'username': 'other', 'password': 'wrong'})
+        self.assertContains(response, 'Unsuccesfull login, try again!')
+
+    def test_login_throttled_per_ip(self):
+        '''Trying many usernames from the same ip gets throttled too'''
+        for i in range(4):
+            self.client.post(reverse('members:login'), {'username': f'user{i}', 'password': 'wrong'})
+        response = self.client.post(reverse('members:login'), {'username': 'user5', 'password': 'wrong'})
+
+        self.assertEqual(response.status_code, 429)
+
+    def test_singup_throttled_per_ip(self):
+        '''Only the configured number of accounts can be created per ip'''
+        self.client.post(reverse('members:singup'), {
+            'username': 'first',
+            'password': '1234',
+            'password_again': '1234'
+        })
+        self.client.logout()
+        response = self.client.post(reverse('members:singup'), {
+            'username': 'second',
+            'password': '1234',
+            'password_again': '1234'
+        })
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIs(User.objects.filter(username='second').exists(), False)
+
+
 class ShowMemberViewTests(TestCase):
     
     def test_authenticated_user_accesing_his_own_profile(self):
@@ -274,4 +335,97 @@ class DeleteAccountTests(TestCase):
         })
         
         self.assertContains(response, 
-        'You wrote the wrong password! seems like you dont really want to leave...')
\ No newline at end of file
+        'You wrote the wrong password! seems like you dont really want to leave...')
+
+@override_settings(
+    DATA_EXPORT_THROTTLE_RATES={'data_export_per_user': (1, 60), 'data_export_site_wide': (10, 60)},
+    DATA_EXPORT_CHUNK_SIZE=1
+)
+class ExportDataTests(TestCase):
+
+    def setUp(self):
+        self.user = User(username='exporting')
+        self.user.set_password('1234')
+        self.user.save()
+        Member.objects.create(user=self.user, bio='my bio')
+        forum = Forum.objects.create(owner=self.user, name='exportforum', description='d')
+        post = Post.objects.create(forum=forum, poster=self.user.member, title='t', content='my post')
+        Post.objects.create(forum=forum, poster=self.user.member, title='t', content='other post')
+        comment = Comment.objects.create(post=post, commenter=self.user.member, content='my comment')
+        CommentVote.objects.create(comment=comment, user=self.user, kind_of_vote=CommentVote.UPVOTE)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_export_streams_everything(self):
+        '''The export is streamed as one json line per profile, forum, post, comment and vote'''
+        self.client.login(username='exporting', password='1234')
+        response = self.client.get(reverse('members:export_data'))
+
+        self.assertIs(response.streaming, True)
+        self.assertIn('attachment', response['Content-Disposition'])
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(
+            [record['type'] for record in records],
+            ['profile', 'owned_forum', 'post', 'post', 'comment', 'comment_vote']
+        )
+        self.assertEqual(records[0]['bio'], 'my bio')
+        self.assertEqual(records[2]['content'], 'my post')
+
+    def test_export_is_throttled(self):
+        '''Members can only export their data the configured number of times'''
+        self.client.login(username='exporting', password='1234')
+        self.client.get(reverse('members:export_data'))
+        response = self.client.get(reverse('members:export_data'))
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+
+class ProfileCacheTests(TestCase):
+    def setUp(self):
+        caches['objects'].clear()
+        self.user = User(username='famous')
+        self.user.set_password('pass')
+        self.user.save()
+        Member.objects.create(user=self.user, bio='old bio')
+        self.forum = Forum.objects.create(owner=self.user, name='fanclub', description='d')
+        self.forum.members.add(self.user.member)
+        Post.objects.create(forum=self.forum, poster=self.user.member, title='first', content='c')
+
+    def test_profile_is_read_from_the_cache(self):
+        '''Once cached, only the recent posts are read, by id'''
+        with self.assertNumQueries(2):  # User and member together, then the recent posts
+            profile = profile_cache.get_profile_by_username('famous')
+        with self.assertNumQueries(1):
+            profile = profile_cache.get_profile_by_username('famous')
+            posts = profile_cache.recent_posts(profile)
+        self.assertEqual([post.title for post in posts], ['first'])
+        with self.assertNumQueries(0):
+            self.assertEqual(posts[0].poster.user.username, 'famous')
+
+    def test_profile_changes_are_shown(self):
+        '''Editing the bio, publishing and deleting posts uncache the profile'''
+        self.client.get(reverse('members:show_member', args=('famous',)))
+        self.client.login(username='famous', password='pass')
+
+        self.client.post(reverse('members:edit_profile'), {'new_bio': 'new bio'})
+        self.client.post(reverse('forums:publish_post', args=('fanclub',)), {'post_title': 'second', 'post_content': 'c'})
+        self.client.logout()
+        response = self.client.get(reverse('members:show_member', args=('famous',)))
+        self.assertContains(response, 'new bio')
+        self.assertContains(response, 'second')
+
+        self.client.login(username='famous', password='pass')
+        second = Post.objects.get(title='second')
+        self.client.post(reverse('forums:delete_post', args=(second.pk,)))
+        response = self.client.get(reverse('members:profile'))
+        self.assertNotContains(response, reverse('forums:show_post', args=(second.pk,)))
+
+    def test_deleted_member_is_not_shown(self):
+        '''Deleting the account uncaches the profile and its username'''
+        self.client.get(reverse('members:show_member', args=('famous',)))
+        self.user.delete()
+
+        response = self.client.get(reverse('members:show_member', args=('famous',)))
+        self.assertEqual(response.status_code, 404)
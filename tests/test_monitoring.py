@@ -0,0 +1,262 @@
+import os
+import json
+import tempfile
+from unittest import mock
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.urls import reverse
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.core.cache import caches
+from django.contrib.auth.models import User
+
+from monitoring import metrics, profiling, slow_queries
+from members.models import Member
+from forums.models import Forum, Post
+
+
+class RequestProfiling(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.settings_override = override_settings(PROFILING_DIR=self.directory.name, PROFILING_SAMPLE_RATE=0)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        user = User(username='profiled')
+        user.set_password('pass')
+        user.save()
+        Member.objects.create(user=user, bio='a')
+        self.forum = Forum.objects.create(owner=user, name='profiled', description='d')
+
+    def test_unsampled(self):
+        '''Without sampling nor a valid header nothing is profiled'''
+        self.client.get(reverse('forums:show_forum', args=(self.forum.name,)))
+        response = self.client.get(reverse('forums:show_forum', args=(self.forum.name,)), HTTP_X_PROFILE='profile:forged:sig')
+        self.assertNotIn('X-Profile', response)
+        self.assertEqual(profiling.profiles(), {})
+
+    def test_sampled(self):
+        '''Sampled requests are profiled in a directory per URL name, which keeps its newest profiles only'''
+        with self.settings(PROFILING_SAMPLE_RATE=1, PROFILING_MAX_FILES=3):
+            for _ in range(5):
+                self.client.get(reverse('forums:show_forum', args=(self.forum.name,)))
+            self.client.get('/no/such/page/')
+        found = profiling.profiles()
+        self.assertEqual(set(found), {'forums:show_forum', 'unresolved'})
+        self.assertEqual(len(found['forums:show_forum']), 3)
+        self.assertEqual(len(os.listdir(os.path.join(self.directory.name, 'forums.show_forum'))), 3)
+        durations = [profile.duration for profile in found['forums:show_forum']]
+        self.assertEqual(durations, sorted(durations, reverse=True))
+        self.assertEqual(found['unresolved'][0].status, 404)
+
+    def test_signed_header(self):
+        '''A request with a signed header is profiled and says where its profile is'''
+        response = self.client.get(reverse('forums:show_forum', args=(self.forum.name,)), HTTP_X_PROFILE=profiling.sign_token())
+        view_name, file_name = response['X-Profile'].split('/')
+        self.assertEqual(view_name, 'forums:show_forum')
+        self.assertIsNotNone(profiling.get_profile(view_name, file_name))
+
+    def test_another_profiler(self):
+        '''A sampled request is served unprofiled when another profiler is active'''
+        error = ValueError('Another profiling tool is already active')
+        with self.settings(PROFILING_SAMPLE_RATE=1), mock.patch('cProfile.Profile.enable', side_effect=error):
+            response = self.client.get(reverse('forums:show_forum', args=(self.forum.name,)), HTTP_X_PROFILE=profiling.sign_token())
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile', response)
+        self.assertEqual(profiling.profiles(), {})
+
+    def test_admin_pages(self):
+        '''Staff members see the slowest profiles and their functions, nobody else does'''
+        response = self.client.get(reverse('forums:show_forum', args=(self.forum.name,)), HTTP_X_PROFILE=profiling.sign_token())
+        view_name, file_name = response['X-Profile'].split('/')
+        profile_url = reverse('monitoring:show_profile', args=(view_name, file_name))
+        self.assertEqual(self.client.get(reverse('monitoring:profiles')).status_code, 302)  # To the admin login
+
+        User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.login(username='admin', password='pass')
+        self.assertContains(self.client.get(reverse('monitoring:profiles')), profile_url)
+        self.assertContains(self.client.get(profile_url), 'show_forum')
+        self.assertEqual(self.client.get(profile_url, {'download': ''})['Content-Type'], 'application/octet-stream')
+        for args in ((view_name, '..'), ('..', file_name), (view_name, '1_1us_GET_200.prof')):
+            self.assertEqual(self.client.get(reverse('monitoring:show_profile', args=args)).status_code, 404)
+
+    def test_out_of_profiling_dir(self):
+        '''View names made of dots do not reach the profiles out of PROFILING_DIR'''
+        file_name = '1_1us_GET_200.prof'
+        Path(self.directory.name, file_name).touch()
+        os.mkdir(os.path.join(self.directory.name, 'profiles'))
+        with self.settings(PROFILING_DIR=os.path.join(self.directory.name, 'profiles')):
+            for view_name in ('.', '..', ':.'):
+                self.assertIsNone(profiling.get_profile(view_name, file_name))
+
+    async def test_async(self):
+        '''Under ASGI the middleware is async, so it does not move the async views to a thread'''
+        async def view(request):
+            return HttpResponse('ok')
+
+        middleware = profiling.ProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().get('/', HTTP_X_PROFILE=profiling.sign_token()))
+        view_name, file_name = response['X-Profile'].split('/')
+        self.assertEqual(view_name, 'unresolved')
+        self.assertIsNotNone(profiling.get_profile(view_name, file_name))
+        self.assertFalse(iscoroutinefunction(profiling.ProfilingMiddleware(lambda request: HttpResponse('ok'))))
+
+
+class Metrics(TestCase):
+
+    def setUp(self):
+        metrics.clear()
+        caches['default'].clear()  # Write throttles
+        user = User(username='measured')
+        user.set_password('pass')
+        user.save()
+        Member.objects.create(user=user, bio='a')
+        self.forum = Forum.objects.create(owner=user, name='measured', description='d')
+        self.forum.members.add(user.member)
+        self.client.login(username='measured', password='pass')
+
+    def scrape(self, **headers):
+        response = self.client.get(reverse('metrics'), **headers)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        return response.content.decode()
+
+    def test_requests(self):
+        '''Latency, queries, db time and size of the requests are histograms by URL name'''
+        self.client.get(reverse('forums:show_forum', args=(self.forum.name,)))
+        self.client.get(reverse('forums:show_forum', args=(self.forum.name,)))
+        text = self.scrape()
+        self.assertIn('# TYPE forum_http_request_duration_seconds histogram', text)
+        self.assertIn('forum_http_request_duration_seconds_bucket{view="forums:show_forum",method="GET",le="+Inf"} 2', text)
+        self.assertIn('forum_http_request_duration_seconds_count{view="forums:show_forum",method="GET"} 2', text)
+        self.assertIn('forum_http_requests_total{view="forums:show_forum",method="GET",status="200"} 2', text)
+        self.assertIn('forum_http_request_queries_bucket{view="forums:show_forum",le="0"} 0', text)
+        self.assertIn('forum_http_request_db_seconds_count{view="forums:show_forum"} 2', text)
+        self.assertIn('forum_http_response_size_bytes_count{view="forums:show_forum"} 2', text)
+        self.assertIn('forum_cache_lookups_total{cache="forum",result="hit"}', text)
+
+    def test_writes(self):
+        '''Posts, comments and votes written, and the throttled ones, are counted'''
+        self.client.post(reverse('forums:publish_post', args=(self.forum.name,)), {'post_title': 't', 'post_content': 'c'})
+        post = Post.objects.get()
+        self.client.post(reverse('comments:reply_to_post', args=(post.pk,)), {'comment_content': 'hello'})
+        with self.settings(WRITE_THROTTLE_RATES={**settings.WRITE_THROTTLE_RATES, 'vote_per_user': (1, 60)}):
+            for _ in range(2):
+                self.client.post(reverse('forums:upvote_post', args=(post.pk,)))
+        text = self.scrape()
+        self.assertIn('forum_writes_total{kind="post"} 1', text)
+        self.assertIn('forum_writes_total{kind="comment"} 1', text)
+        self.assertIn('forum_writes_total{kind="vote"} 2', text)  # The comment is upvoted by its author
+        self.assertIn('forum_throttled_writes_total{kind="vote"} 1', text)
+
+    def test_workers(self):
+        '''With METRICS_DIR, the numbers of every process are added up'''
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            self.client.get(reverse('forums:show_forum', args=(self.forum.name,)))
+            metrics.flush()
+            other_worker = json.loads(open(next(Path(directory).glob('*.json'))).read())
+            with open(Path(directory, '1-1.json'), 'w') as file:
+                json.dump(other_worker, file)
+            stale = Path(directory, '2-1.json')
+            stale.write_text(json.dumps(other_worker))
+            os.utime(stale, (0, 0))
+
+            text = self.scrape()
+            self.assertIn('forum_http_requests_total{view="forums:show_forum",method="GET",status="200"} 2', text)
+            self.assertIn('forum_http_request_duration_seconds_count{view="forums:show_forum",method="GET"} 2', text)
+            self.assertFalse(stale.exists())
+
+    def test_token(self):
+        '''With METRICS_TOKEN the scraper has to send it'''
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            self.assertIn('forum_writes_total', self.scrape(HTTP_AUTHORIZATION='Bearer secret'))
+
+    async def test_async(self):
+        '''Under ASGI the middleware is async, and still counts the queries made in threads'''
+        async def view(request):
+            await sync_to_async(lambda: list(Forum.objects.all()))()
+            return HttpResponse('ok')
+
+        middleware = metrics.MetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        await middleware(RequestFactory().get('/'))
+        self.assertEqual(metrics.requests.series, {('unresolved', 'GET', 200): 1})
+        self.assertEqual(metrics.request_queries.series[('unresolved',)][metrics.QUERY_BUCKETS.index(1)], 1)
+
+
+class SlowQueries(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = Path(directory.name, 'slow.log')
+        # Every query is slow
+        self.settings_override = override_settings(SLOW_QUERY_SECONDS=0, SLOW_QUERY_LOG=self.log)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        user = User(username='slow')
+        user.set_password('pass')
+        user.save()
+        Member.objects.create(user=user, bio='a')
+        self.forum = Forum.objects.create(owner=user, name='slow', description='d')
+        Post.objects.create(forum=self.forum, poster=user.member, title='t', content='c')
+        self.client.login(username='slow', password='pass')
+
+    def test_normalize(self):
+        '''Values and IN lists do not change the normalized query'''
+        self.assertEqual(
+            slow_queries.normalize('SELECT "a"."band0" FROM "a"  WHERE "a"."id" IN (%s, %s, %s) AND "b" = \'it\'\'s\' LIMIT 21'),
+            'SELECT "a"."band0" FROM "a" WHERE "a"."id" IN (...) AND "b" = ? LIMIT ?'
+            )
+        self.assertEqual(slow_queries.normalize('INSERT INTO "a" VALUES (%s, %s), (%s, %s)'), 'INSERT INTO "a" VALUES (...)')
+
+    def test_log(self):
+        '''Slow queries are logged with their URL name, call sites, and without their text parameters'''
+        with self.assertLogs('monitoring.slow_queries', 'WARNING'):
+            self.client.get(reverse('forums:show_forum', args=(self.forum.name,)), {'q': 'secretword'})
+            self.client.get(reverse('forums:show_forum', args=(self.forum.name,)))
+        self.assertNotIn('secretword', self.log.read_text())
+        entries = slow_queries.read_log(self.log)
+        self.assertTrue(all(entry['view'] == 'forums:show_forum' for entry in entries))
+
+        search = next(entry for entry in entries if 'LIKE' in entry['sql'])
+        self.assertEqual(search['params'], [self.forum.pk, '<str>', '<str>'])
+        self.assertEqual(search['code'].split(':')[0], 'forums.views.show_forum')  # Evaluated by the template
+        self.assertTrue(search['template'].startswith('includes/show_posts.html:'))
+
+        vote = next(entry for entry in entries if 'forums_postvote' in entry['sql'])
+        self.assertEqual(vote['code'].split(':')[0], 'templatetags.vote_post_form_extras.vote_post_form')
+
+    def test_report(self):
+        '''The report adds up the runs of every shape'''
+        with self.assertLogs('monitoring.slow_queries', 'WARNING'):
+            for _ in range(3):
+                self.client.get(reverse('forums:show_forum', args=(self.forum.name,)))
+        shapes = slow_queries.report(slow_queries.read_log(self.log), sort='count')
+        vote = next(shape for shape in shapes if 'forums_postvote' in shape.sql)
+        self.assertEqual(vote.count, 3)
+        self.assertEqual(vote.views, {'forums:show_forum': 3})
+        self.assertAlmostEqual(vote.mean, vote.total / 3)
+
+        with self.settings(SLOW_QUERY_LOG_MAX_BYTES=1):  # Rotating on every entry
+            with self.assertLogs('monitoring.slow_queries', 'WARNING'):
+                self.client.get(reverse('forums:show_forum', args=(self.forum.name,)))
+        self.assertEqual(len(slow_queries.read_log(self.log)), 2)
+
+    async def test_async(self):
+        '''Under ASGI the middleware is async, and still watches the queries made in threads'''
+        async def view(request):
+            await sync_to_async(lambda: list(Forum.objects.all()))()
+            return HttpResponse('ok')
+
+        middleware = slow_queries.SlowQueryMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertLogs('monitoring.slow_queries', 'WARNING'):
+            await middleware(RequestFactory().get('/'))
+        self.assertIn('"forums_forum"', slow_queries.read_log(self.log)[0]['sql'])